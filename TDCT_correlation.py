@@ -16,7 +16,7 @@ to one single stack file, ...).
 # @Credits			:
 # @Maintainer		: Jan Arnold
 # @Date				: 2016/01
-# @Version			: 3DCT 2.3.0 module rev. 30
+# @Version			: 3DCT 2.3.0 module rev. 31
 # @Status			: stable
 # @Usage			: part of 3D Correlation Toolbox
 # @Notes			:
@@ -37,7 +37,7 @@ import tifffile as tf
 import qimage2ndarray
 ## Colored stdout, custom Qt functions (mostly to handle events), CSV handler
 ## and correlation algorithm
-from tdct import clrmsg, TDCT_debug, QtCustom, csvHandler, correlation
+from tdct import clrmsg, TDCT_debug, QtCustom, csvHandler, correlation, instrument
 
 __version__ = 'v2.3.0'
 
@@ -81,6 +81,8 @@ class MainWidget(QtGui.QMainWindow, Ui_WidgetWindow):
         ## Marker and POI color
         self.markerColor = (0,255,0)
         self.poiColor = (0,0,255)
+        ## Keeps the last correlation to update it quickly after single marker edits
+        self.incrementalCorrelation = correlation.IncrementalCorrelation()
 
         ## Tableview and models
         self.modelLleft = QtCustom.QStandardItemModelCustom(self)
@@ -215,6 +217,7 @@ class MainWidget(QtGui.QMainWindow, Ui_WidgetWindow):
         self.toolButton_saveImage_right.clicked.connect(lambda: self.displayImage(side='right',save=True))
         self.toolButton_loadLayer2.clicked.connect(lambda: self.layerCtrl('layer2',load=True))
         self.toolButton_loadLayer3.clicked.connect(lambda: self.layerCtrl('layer3',load=True))
+        self.toolButton_timing.clicked.connect(self.showTiming)
         self.commandLinkButton_correlate.clicked.connect(self.correlate)
 
         ## Sliders
@@ -277,6 +280,16 @@ class MainWidget(QtGui.QMainWindow, Ui_WidgetWindow):
                 self.workingdir = workingdir
             self.lineEdit_workingDir.setText(self.workingdir)
 
+    def showTiming(self):
+        ## Non-modal timing summary, kept as attribute so it stays open and can be raised again
+        if getattr(self, 'timingDialog', None) is None:
+            self.timingDialog = QtCustom.TimingDialog(self,workingdir=self.workingdir)
+        self.timingDialog.workingdir = self.workingdir
+        self.timingDialog.refresh()
+        self.timingDialog.show()
+        self.timingDialog.raise_()
+        self.timingDialog.activateWindow()
+
     def updateWorkingDir(self):
         if os.path.isdir(self.lineEdit_workingDir.text()):
             workingdir = self.checkWorkingDirPrivileges(str(self.lineEdit_workingDir.text()))
@@ -1089,8 +1102,8 @@ class MainWidget(QtGui.QMainWindow, Ui_WidgetWindow):
         self.displayImage()
 
     ## Adjust Brightness and Contrast by sliders
+    @instrument.timed('image.adjustBrightCont')
     def adjustBrightCont(self,img_displayed,img_adjusted,brightness,contrast):
-        if debug is True: ping = time.time()
         if debug is True: print clrmsg.DEBUG + "===== adjustBrightCont"
         ## Load replacement
         img_adjusted = np.copy(img_displayed)
@@ -1107,8 +1120,6 @@ class MainWidget(QtGui.QMainWindow, Ui_WidgetWindow):
             img_adjusted = np.where(img_adjusted <= -brightness,0,img_adjusted+brightness)
             ## Convert from int16 back to uint8
             img_adjusted = img_adjusted.astype(dtype=np.uint8)
-        if debug is True: pong = time.time()
-        if debug is True: print clrmsg.DEBUG + 'adjusting brightness/contrast in s:', pong-ping
         return img_adjusted
 
     ## Normalize Image
@@ -1237,14 +1248,12 @@ class MainWidget(QtGui.QMainWindow, Ui_WidgetWindow):
                     self.layer3CustomColor_right = self.getCustomChannelColor()
             self.displayImage(side='right')
 
+    @instrument.timed('image.colorize')
     def colorizeImage(self,img,color=None):
-        if debug is True: ping = time.time()
         if color is None and all(comboboxColor == 'none' for comboboxColor in [
                                                                 self.comboBox_channelColorLayer1.currentText(),
                                                                 self.comboBox_channelColorLayer2.currentText(),
                                                                 self.comboBox_channelColorLayer3.currentText()]):
-            if debug is True: pong = time.time()
-            if debug is True: print clrmsg.DEBUG + 'colorize image in s:', pong-ping
             return img
         elif color is None:
             color = [255,255,255]
@@ -1255,8 +1264,6 @@ class MainWidget(QtGui.QMainWindow, Ui_WidgetWindow):
         imgC[:,:,0] = img*(color[0]/255.0)
         imgC[:,:,1] = img*(color[1]/255.0)
         imgC[:,:,2] = img*(color[2]/255.0)
-        if debug is True: pong = time.time()
-        if debug is True: print clrmsg.DEBUG + 'colorize image in s:', pong-ping
         return imgC.astype(dtype=np.uint8)
 
     def colorCoder(self,code,side,layer):
@@ -1289,11 +1296,11 @@ class MainWidget(QtGui.QMainWindow, Ui_WidgetWindow):
                 elif layer == 3:
                     return self.layer3CustomColor_right
 
+    @instrument.timed('image.display')
     def displayImage(self,side=None,save=False,keepRGB=False):
         """
         Display all active images. Set side to 'left' or 'right' for specific refresh, otherwise the active focused image side is used.
         """
-        if debug is True: ping = time.time()
         if side is None:
             side = self.label_selimg.text()
         if side == 'left':
@@ -1344,14 +1351,12 @@ class MainWidget(QtGui.QMainWindow, Ui_WidgetWindow):
         if save is True:
             timestamp = time.strftime("%Y-%m-%d_%H-%M-%S")
             cv2.imwrite(os.path.join(self.workingdir,timestamp+"_image.tif"), cv2.cvtColor(img_blend,cv2.COLOR_RGB2BGR))
-        if debug is True: pong = time.time()
-        if debug is True: print clrmsg.DEBUG + 'displaying image in s:', pong-ping
 
+    @instrument.timed('image.blend')
     def blendImages(self,images,blendmode='screen'):
         """
         Blends multiple images (same numpy size and type) and returns a single image (numpy array). Images are passed in as a list argument.
         """
-        if debug is True: ping = time.time()
         if len(images) == 0:
             return np.zeros([10,10],dtype=np.uint8)-1
         if len(images) == 1:
@@ -1366,8 +1371,6 @@ class MainWidget(QtGui.QMainWindow, Ui_WidgetWindow):
                         blend = blend + images[i] - (blend * images[i].astype(dtype=np.float32)/255.0)
                     elif blendmode == 'minimum':
                         blend = np.minimum(blend,images[i])
-            if debug is True: pong = time.time()
-            if debug is True: print clrmsg.DEBUG + 'blending images in s:', pong-ping
             return blend.astype(dtype=np.uint8)
 
     def layerCtrl(self,layer,load=False):
@@ -1810,6 +1813,7 @@ class MainWidget(QtGui.QMainWindow, Ui_WidgetWindow):
         if nrRowsModel2D >= 3:
             if nrRowsModel2D <= nrRowsModel3D:
                 timestamp = time.strftime("%Y-%m-%d_%H-%M-%S")
+                if debug is True: ping = time.time()
                 self.correlation_results = correlation.main(
                                                         markers_3d=self.model2np(model3D,[0,nrRowsModel2D]),
                                                         markers_2d=self.model2np(model2D,[0,nrRowsModel2D]),
@@ -1818,8 +1822,18 @@ class MainWidget(QtGui.QMainWindow, Ui_WidgetWindow):
                                                         results_file=''.join([
                                                             self.workingdir,'/',timestamp, '_correlation.txt'
                                                             ] if self.checkBox_writeReport.isChecked() else ''),
-                                                        imageProps=imageProps
+                                                        imageProps=imageProps,
+                                                        incremental=self.incrementalCorrelation,
+                                                        robust=self.checkBox_robust.isChecked(),
+                                                        random_state=(
+                                                            self.spinBox_seed.value()
+                                                            if self.spinBox_seed.value() >= 0 else None),
+                                                        certify=self.checkBox_certify.isChecked()
                                                         )
+                if clrmsg and debug is True:
+                    print clrmsg.DEBUG + 'Correlation (%s) done in %.3f s' % (
+                        'robust' if self.checkBox_robust.isChecked() else self.incrementalCorrelation.lastMode,
+                        time.time()-ping)
             else:
                 QtGui.QMessageBox.critical(self, "Data Structure", "The two datasets do not contain the same amount of markers!")
                 return
@@ -1960,6 +1974,17 @@ class MainWidget(QtGui.QMainWindow, Ui_WidgetWindow):
             else: self.label_meandxdy.setStyleSheet(self.stylesheet_red)
             self.label_rms.setText('{0:.5f}'.format(transf.rmsError))
             self.label_rms.setStyleSheet(self.stylesheet_green if transf.rmsError < 1 else self.stylesheet_orange)
+            ## largest semi-axis of the POI confidence ellipses (bootstrap)
+            uncertainty = getattr(transf, 'poiUncertainty', None)
+            if uncertainty and 'bootstrap' in uncertainty:
+                poiAxis = uncertainty['bootstrap'].axes[:,0].max()
+                self.label_poiUncertainty.setText('{0:.3f}'.format(poiAxis))
+                if poiAxis <= 2: self.label_poiUncertainty.setStyleSheet(self.stylesheet_green)
+                elif poiAxis <= 5: self.label_poiUncertainty.setStyleSheet(self.stylesheet_orange)
+                else: self.label_poiUncertainty.setStyleSheet(self.stylesheet_red)
+            else:
+                self.label_poiUncertainty.setText('n/a')
+                self.label_poiUncertainty.setStyleSheet("color: rgb(180, 180, 180);")
 
             self.widget_matplotlib.setupScatterCanvas(width=4,height=4,dpi=52,toolbar=False)
             self.widget_matplotlib.scatterPlot(x=delta2D[0,:],y=delta2D[1,:],frame=frame,framesize=framesize,xlabel="px",ylabel="px")
@@ -1968,11 +1993,17 @@ class MainWidget(QtGui.QMainWindow, Ui_WidgetWindow):
             self.modelResults.removeRows(0,self.modelResults.rowCount())
             if self.checkBox_resultsAbsolute.isChecked():
                 delta2D = np.absolute(delta2D)
+            outliers = getattr(transf, 'outliers', [])
             for i in range(delta2D.shape[1]):
                 item = [
                     QtGui.QStandardItem(str(i+1)),
                     QtGui.QStandardItem('{0:.5f}'.format(delta2D[0,i])),
                     QtGui.QStandardItem('{0:.5f}'.format(delta2D[1,i]))]
+                if i in outliers:
+                    ## Outlier marker (robust correlation), not used for the transformation
+                    for subitem in item:
+                        subitem.setForeground(QtGui.QColor(255,0,0))
+                        subitem.setToolTip('Outlier, not used for the correlation')
                 self.modelResults.appendRow(item)
             self.modelResults.setHeaderData(0, QtCore.Qt.Horizontal,'Nr.')
             self.modelResults.setHeaderData(1, QtCore.Qt.Horizontal,'dx')
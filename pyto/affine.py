@@ -34,6 +34,7 @@ class Affine(object):
     Main methods:
 
       - find(): finds a transformation between two sets of points
+      - findBatch(): finds transformations for many pairs of point sets
       - findTwoStep(): finds a transformation between two sets of points in 
       two steps
       - findTranslation(): finds a translation between two sets of points
@@ -41,6 +42,8 @@ class Affine(object):
       - composeGl(): makes gl from its decomposition, opposite of decompose()
       - identity(): makes the identity transformation
       - transform(): transforms a (set of) point(s)
+      - transformChunked(): transforms many points with bounded memory
+      - getHomogeneous(): transformation in homogeneous coordinates
       - inverse(): calculates inverse transformation
       - compose(): composition of two transformations
 
@@ -437,6 +440,124 @@ class Affine(object):
         # return
         return inst
         
+    @classmethod
+    def findBatch(cls, x, y, order='qpsm', xy_axes='point_dim',
+                  x_ref='cm', y_ref='cm'):
+        """
+        Finds affine transformations (like find(), type_='gl') for many sets
+        of points at once.
+
+        The normal equations of all sets are solved together:
+
+          gl^T = (x'^T x')^-1 x'^T y'
+
+        where x' and y' are x and y in the reference frames (centers of mass
+        by default) and the Gl matrices are decomposed together (see
+        decomposeQRBatch()). Sets whose points do not span the space (rank
+        deficient) are solved by scipy.linalg.lstsq() like in find(). Order
+        'usv' is decomposed one transformation at a time.
+
+        Arguments:
+          - x, y: stacked sets of points, shape (n_sets, n_points, n_dim)
+          for xy_axes 'point_dim', or (n_sets, n_dim, n_points) for
+          'dim_point'
+          - x_ref, y_ref: 'cm' to use centers of mass, or reference points
+          for each set (shape (n_sets, n_dim) or (n_dim))
+          - order: gl decomposition order (see decompose())
+          - xy_axes: order of point and dimension axes of each set
+
+        Returns list of transformations (instances of class cls), one for
+        each set, having the same attributes as the ones returned by find().
+        Attribute resids contains the sum of squared residuals for each
+        dimension.
+        """
+
+        # bring x and y to n_sets x n_points x n_dim shape
+        x = numpy.asarray(x, dtype=float)
+        y = numpy.asarray(y, dtype=float)
+        if x.ndim != 3 or x.shape != y.shape:
+            raise ValueError(
+                "Arguments x and y have to have the same shape (n_sets, "
+                + "n_points, n_dim) or (n_sets, n_dim, n_points).")
+        if xy_axes == 'point_dim':
+            pass
+        elif xy_axes == 'dim_point':
+            x = x.transpose((0, 2, 1))
+            y = y.transpose((0, 2, 1))
+        else:
+            raise ValueError(
+                "Argument xy_axes was not understood. Possible values are: "
+                + "'point_dim' and 'dim_point'.")
+        n_points, ndim = x.shape[1:]
+
+        # bring x and y to reference frames
+        refs = []
+        for points, ref in [(x, x_ref), (y, y_ref)]:
+            if isinstance(ref, str) and (ref == 'cm'):
+                ref = points.mean(axis=1)
+            elif isinstance(ref, (list, tuple, numpy.ndarray)):
+                ref = numpy.zeros((len(points), ndim)) + ref
+            else:
+                raise ValueError(
+                    'Argument x_ref or y_ref: ', ref, ' was not understood.',
+                    " Allowed values are 'cm', or an array.")
+            refs.append(ref)
+        x_ref, y_ref = refs
+        x_prime = x - x_ref[:, numpy.newaxis, :]
+        y_prime = y - y_ref[:, numpy.newaxis, :]
+
+        # rank from singular values (same cutoff as numpy.linalg.lstsq)
+        singular = numpy.linalg.svd(x_prime, compute_uv=False)
+        cutoff = (numpy.finfo(float).eps * max(n_points, ndim)
+                  * singular[:, :1])
+        rank = (singular > cutoff).sum(axis=1)
+        full = rank == ndim
+
+        # solve normal equations of all full rank sets
+        gl = numpy.empty((len(x), ndim, ndim))
+        if full.any():
+            xtx = numpy.einsum('kni,knj->kij', x_prime[full], x_prime[full])
+            xty = numpy.einsum('kni,knj->kij', x_prime[full], y_prime[full])
+            gl[full] = numpy.linalg.solve(xtx, xty).transpose((0, 2, 1))
+        for ind in numpy.nonzero(~full)[0]:
+            gl_t = linalg.lstsq(x_prime[ind], y_prime[ind])[0]
+            gl[ind] = gl_t.transpose()
+
+        # translation and error
+        d = y_ref - numpy.einsum('kj,kij->ki', x_ref, gl)
+        error = y - numpy.einsum('knj,kij->kni', x, gl) - d[:, numpy.newaxis]
+        resids = numpy.square(error).sum(axis=1)
+
+        # decompose
+        if order == 'usv':
+            decomp = None
+        else:
+            decomp = cls.decomposeQRBatch(gl=gl, order=order)
+
+        # make instances
+        if xy_axes == 'dim_point':
+            error = error.transpose((0, 2, 1))
+            x_prime = x_prime.transpose((0, 2, 1))
+            y_prime = y_prime.transpose((0, 2, 1))
+        res = []
+        for ind in range(len(gl)):
+            inst = cls(gl=gl[ind], d=d[ind], xy_axes=xy_axes)
+            inst.resids = resids[ind]
+            inst.rank = rank[ind]
+            inst.singular = singular[ind]
+            inst.error = error[ind]
+            inst._xPrime = x_prime[ind]
+            inst._yPrime = y_prime[ind]
+            if decomp is None:
+                inst.decompose(order=order)
+            else:
+                inst.order = order
+                inst.q, inst.p, inst.s, inst.m = [
+                    mat[ind] for mat in decomp]
+            res.append(inst)
+
+        return res
+
     @classmethod
     def findTwoStep(cls, x, y, x_gl, y_gl, type_='gl', order='qpsm'):
         """
@@ -563,6 +684,111 @@ class Affine(object):
 
         return res
 
+    def getHomogeneous(self):
+        """
+        Returns the transformation as a (n_dim+1) x (n_dim+1) matrix in
+        homogeneous coordinates:
+
+          [[gl, d],
+           [0,  1]]
+
+        so that the transformation of points x (n_dim x n_points) is a single
+        matrix product with x extended by a row of ones.
+
+        The matrix is obtained using transform(), so that subclasses that
+        implement transform() differently (like Rigid3D) are exported
+        correctly.
+        """
+        if self.d is not None:
+            ndim = len(self.d)
+        elif getattr(self, 'gl', None) is not None:
+            ndim = self.gl.shape[0]
+        else:
+            ndim = self.q.shape[0]
+        res = numpy.identity(ndim + 1)
+        res[:ndim, :ndim] = self.transform(
+            x=numpy.identity(ndim), d=0, xy_axes='dim_point')
+        if self.d is not None:
+            res[:ndim, ndim] = self.d
+        return res
+
+    homogeneous = property(
+        fget=getHomogeneous, doc='Transformation in homogeneous coordinates')
+
+    def transformChunked(self, x, out=None, dtype=None, chunk_size=65536,
+                         xy_axes=None):
+        """
+        Transforms a large number of points x in chunks. Gives the same
+        result as transform(), but the memory needed in addition to the
+        result is bounded by the chunk size.
+
+        The result is written to arg out if given, which can also be x
+        itself (in place transformation). Otherwise a new array of type
+        dtype is made (default float64, or float32 for float32 points).
+
+        Arguments:
+          - x: (ndarray) points, n_point x n_dim or n_dim x n_point
+          - out: (ndarray, same shape as x) array the result is written to
+          - dtype: type of the result, ignored if out is given
+          - chunk_size: number of points transformed in one go
+          - xy_axes: order of axes in matrices representing points, if None
+          self.xy_axes is used
+
+        Returns the transformed points (arg out if given)
+        """
+
+        # parse arguments
+        if xy_axes is None:
+            xy_axes = self.xy_axes
+        x = numpy.asarray(x)
+        if out is not None:
+            if out.shape != x.shape:
+                raise ValueError(
+                    "Argument out has shape " + str(out.shape) + " but "
+                    + "points have shape " + str(x.shape) + ".")
+            dtype = out.dtype
+        elif dtype is None:
+            if x.dtype == numpy.float32:
+                dtype = numpy.float32
+            else:
+                dtype = numpy.float64
+        if out is None:
+            out = numpy.empty(x.shape, dtype=dtype)
+        if xy_axes == 'point_dim':
+            n_points, ndim = x.shape
+        elif xy_axes == 'dim_point':
+            ndim, n_points = x.shape
+        else:
+            raise ValueError(
+                "Argument xy_axes was not understood. Possible values are: "
+                + "'point_dim' and 'dim_point'.")
+
+        # transformation matrix in the output type
+        homo = self.getHomogeneous()
+        gl_t = numpy.ascontiguousarray(homo[:ndim, :ndim].transpose(),
+                                       dtype=dtype)
+        d = homo[:ndim, ndim].astype(dtype)
+
+        # transform chunk by chunk through a buffer (allows out to be x)
+        buf = numpy.empty((min(chunk_size, n_points), ndim), dtype=dtype)
+        for start in range(0, n_points, chunk_size):
+            stop = min(start + chunk_size, n_points)
+            local = buf[:stop-start]
+            if xy_axes == 'point_dim':
+                x_chunk = x[start:stop]
+            else:
+                x_chunk = x[:, start:stop].transpose()
+            if x_chunk.dtype != dtype:
+                x_chunk = x_chunk.astype(dtype)
+            numpy.dot(x_chunk, gl_t, out=local)
+            local += d
+            if xy_axes == 'point_dim':
+                out[start:stop] = local
+            else:
+                out[:, start:stop] = local.transpose()
+
+        return out
+
     ##############################################################
     #
     # Decomposing and composing Gl
@@ -713,6 +939,73 @@ class Affine(object):
 
         return q, p, s, m
 
+    @classmethod
+    def decomposeQRBatch(cls, gl, order='qr'):
+        """
+        Decomposes stacked gl matrices like decomposeQR(), all at once.
+
+        The triangular matrix with positive diagonal, s m in order 'qr' and
+        'qpsm', is the Cholesky factor of gl^T gl (of gl gl^T for 'rq' and
+        'psmq'), so the result is the same as for decomposeQR(). Stacks that
+        contain singular matrices are decomposed one matrix at a time.
+
+        Arguments:
+          - gl: (ndarray of shape (n, ndim, ndim)) general linear
+          transformations
+          - order: decomposition order 'qr' or 'rq'
+
+        Returns: (q, p, s, m), each of shape (n, ndim, ndim)
+        """
+
+        gl = numpy.asarray(gl, dtype=float)
+        ndim = gl.shape[-1]
+        if (order == 'rq') or (order == 'psmq'):
+            reverse = (slice(None),) + 2 * (slice(None, None, -1),)
+            gram = numpy.einsum('kij,klj->kil', gl, gl)[reverse]
+        elif (order == 'qr') or (order == 'qpsm'):
+            reverse = None
+            gram = numpy.einsum('kji,kjl->kil', gl, gl)
+        else:
+            raise ValueError(
+                "Argument order: " + str(order) + " not understood. It "
+                + "should be 'psmq' (same as 'rq') or 'qpsm' (same as 'qr').")
+
+        # singular matrices
+        try:
+            lower = numpy.linalg.cholesky(gram)
+        except numpy.linalg.LinAlgError:
+            inst = Affine()
+            inst.parity_axis = cls.parity_axis
+            decomp = [inst.decomposeQR(gl=one, order=order) for one in gl]
+            return tuple(numpy.array(mats) for mats in zip(*decomp))
+
+        # r = s m upper triangular with positive diagonal
+        if reverse is None:
+            r = lower.transpose((0, 2, 1))
+        else:
+            r = lower[reverse]
+        s_diag = numpy.einsum('kii->ki', r)
+        s = s_diag[:, :, numpy.newaxis] * numpy.identity(ndim)
+        m = r / s_diag[:, :, numpy.newaxis]
+        r_inv = numpy.linalg.inv(r)
+        if reverse is None:
+            q = numpy.einsum('kij,kjl->kil', gl, r_inv)
+        else:
+            q = numpy.einsum('kij,kjl->kil', r_inv, gl)
+
+        # make sure det(q) > 0 and adjust p accordingly
+        p = numpy.tile(numpy.identity(ndim, dtype=int), (len(gl), 1, 1))
+        negative = numpy.linalg.det(q) < 0
+        p[negative, cls.parity_axis, cls.parity_axis] = -1
+        p_diag = numpy.einsum('kii->ki', p)
+        if reverse is None:
+            q = q * p_diag[:, numpy.newaxis, :]
+        else:
+            q = q * p_diag[:, :, numpy.newaxis]
+            m = m * p_diag[:, :, numpy.newaxis] * p_diag[:, numpy.newaxis, :]
+
+        return q, p, s, m
+
     def decomposeSV(self, gl, order='usv', correction='u'):
         """
         Decompose gl using singular value decomposition, so that:
@@ -470,6 +470,56 @@ class Affine2D(Affine):
 
         return inst
 
+    @classmethod
+    def findBatch(cls, x, y, x_ref='cm', y_ref='cm', type_='gl', order='qpsm',
+                  xy_axes='point_dim'):
+        """
+        Finds affine transformations for many sets of 2D points at once, for
+        example one transformation for each tile of an overview image.
+
+        For type_='gl', all transformations are found together (see
+        Affine.findBatch()). Type 'rs' transformations are found one at a
+        time using findRS().
+
+        Arguments:
+          - x, y: stacked sets of points, shape (n_sets, n_points, 2) for
+          xy_axes 'point_dim', or (n_sets, 2, n_points) for 'dim_point'
+          - x_ref, y_ref: 'cm' to use centers of mass, or reference points
+          for each set
+          - type_: 'gl' or 'rs', see find()
+          - order: gl decomposition order (type_ 'gl' only)
+          - xy_axes: order of point and dimension axes of each set
+
+        Returns list of transformations (instances of this class), one for
+        each set.
+        """
+
+        if type_ == 'gl':
+            res = super(Affine2D, cls).findBatch(
+                x=x, y=y, order=order, xy_axes=xy_axes, x_ref=x_ref,
+                y_ref=y_ref)
+
+        elif type_ == 'rs':
+            refs = []
+            for ref in [x_ref, y_ref]:
+                if isinstance(ref, str):
+                    refs.append([ref] * len(x))
+                else:
+                    refs.append(numpy.zeros((len(x), 2)) + ref)
+            x_refs, y_refs = refs
+            res = [
+                cls.findRS(
+                    x=x_one, y=y_one, x_ref=x_ref_one, y_ref=y_ref_one,
+                    xy_axes=xy_axes)
+                for x_one, y_one, x_ref_one, y_ref_one
+                in zip(x, y, x_refs, y_refs)]
+
+        else:
+            raise ValueError("Argument type_: ", type_, "was not ",
+                             "understood. Valid values are 'gl', and 'rs'.")
+
+        return res
+
     @classmethod
     def findRS(cls, x, y, x_ref='cm', y_ref='cm', xy_axes='point_dim'):
         """
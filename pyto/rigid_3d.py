@@ -9,12 +9,17 @@ scaling followed by translation on points (vectors).
 __version__ = "$Revision: 1292 $"
 
 
+from copy import deepcopy
 from functools import partial
+import itertools
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 
 import numpy as np
 import scipy as sp
 # added for sp.stat
 import scipy.stats
+import scipy.special
 
 from affine import Affine
 
@@ -104,15 +109,126 @@ class Rigid3D(Affine):
 
     #########################################################
     #
-    # Methods inherited from Affine that are not needed
+    # Finding rigid transformation when complete marker points coordinates 
+    # are given
     #
 
     @classmethod
-    def find(cls, x, y, scale=None, xy_axes='dim_point'):
+    def find(
+            cls, x, y, scale=None, parity=1, weights=None, 
+            xy_axes='dim_point'):
         """
-        Should be implemented
+        Finds rigid transformation in 3D, consisting of rotation, parity,
+        scale (scalar) and translation, that transforms points x (initial)
+        into points y (final) when all three coordinates are given for both
+        x and y:
+
+          y = s q p x + d
+
+        The (weighted) sum of squared differences between y and the 
+        transformed x is minimized in closed form (Umeyama, IEEE PAMI 13, 
+        376 (1991)), so no iterative optimization is needed. In center of 
+        mass coordinates, the singular value decomposition of the 
+        covariance matrix
+
+          y x^T = u diag(l) v^T
+
+        yields the orthogonal transformation q p = u c v^T, where 
+        c = diag(1, 1, c_3) and c_3 = +-1 is chosen so that the parity 
+        (det(q p)) is the required one, and the scale:
+
+          s = tr(diag(l) c) / tr(x x^T)
+
+        Translation is determined so that the (weighted) center of mass of 
+        x is transformed to that of y.
+
+        Arguments:
+          - x: initial points coordinates (3 x n_points martix)
+          - y: final points coordinates (3 x n_points matrix)
+          - scale: if None the optimal scale is determined, otherwise scale 
+          fixed at the specified value (1 for rigid body movement)
+          - parity: 1 for proper rotations, -1 for rotations combined with
+          the inversion of z axis (mirror image), or None to choose the one
+          that fits better
+          - weights: None (all 1) or weights of points (n_points)
+          - xy_axes: order of axes in matrices representing points, can be
+          'dim_point' (default) or 'point_dim'; points of the returned
+          transformation are always 'dim_point'
+
+        Returns transformation (instance of this class) with attributes:
+          - gl: general linear matrix (gl = s q p)
+          - q: rotation matrix
+          - p: parity matrix
+          - ck: Caley-Klein parameters corresponding to q
+          - s, s_scalar: scale in matrix and scalar form
+          - d: translation
+          - y: transformed initial points
+          - error: y - transformed x (dimensions as arg y, 'dim_point')
         """
-        raise NotImplementedError()
+
+        # bring x and y to dim_point form
+        if xy_axes == 'point_dim':
+            x = np.asarray(x).transpose()
+            y = np.asarray(y).transpose()
+        elif xy_axes != 'dim_point':
+            raise ValueError(
+                "Argument xy_axes was not understood. Possible values are: "
+                + "'point_dim' and 'dim_point'.")
+        if parity not in [1, -1, None]:
+            raise ValueError(
+                "Argument parity " + str(parity) + " was not understood. " 
+                + "Valid values are 1, -1 and None.")
+
+        # (weighted) cm coordinates
+        if weights is None:
+            weights = np.ones(x.shape[1])
+        weights = np.asarray(weights, dtype=float)
+        x_cm = np.dot(x, weights) / weights.sum()
+        y_cm = np.dot(y, weights) / weights.sum()
+        x_prime = x - x_cm.reshape((3,1))
+        y_prime = y - y_cm.reshape((3,1))
+
+        # svd of the covariance and the best orthogonal matrix
+        yxt = np.dot(weights * y_prime, x_prime.transpose())
+        u, l, vt = np.linalg.svd(yxt)
+        det_uv = np.sign(np.linalg.det(u) * np.linalg.det(vt))
+        if det_uv == 0:
+            det_uv = 1.
+        if parity is None:
+            c_3 = 1.
+        else:
+            c_3 = parity * det_uv
+        c = np.array([1., 1, c_3])
+        qp = np.dot(u * c, vt)
+        found_parity = int(np.sign(c_3 * det_uv))
+
+        # scale
+        if scale is None:
+            trxx = (weights * x_prime * x_prime).sum()
+            scale = (l * c).sum() / trxx
+
+        # rotation and parity
+        p = cls.makeP(parity=found_parity)
+        q = np.dot(qp, p)
+
+        # make instance
+        inst = cls()
+        inst.q = q
+        inst.p = p
+        inst.s_scalar = scale
+        inst.s = scale * np.identity(3)
+        inst.gl = scale * qp
+        inst.ck = cls.extract_ck(q)
+        inst.d = y_cm - scale * np.dot(qp, x_cm)
+        inst.y = inst.transform(x=x)
+        inst.error = y - inst.y
+
+        return inst
+
+    #########################################################
+    #
+    # Methods inherited from Affine that are not needed
+    #
 
     @classmethod
     def findTwoStep(cls, x, y, scale=None, xy_axes='dim_point'):
@@ -145,7 +261,8 @@ class Rigid3D(Affine):
     def find_32(
             cls, x, y, scale=None, use_jac=True, mode='constr_ck',
             ninit=10, randome=False, einit=None, einit_dist=0.1, 
-            randoms=False, sinit=1., maxiter=1000, return_all=False):
+            randoms=False, sinit=1., maxiter=1000, return_all=False,
+            executor=None, weights=None, random_state=None):
         """
         Finds optimal 3D transformation consisting of rotation, scale 
         (optional) and translation that transform initial point coordinates 
@@ -198,7 +315,7 @@ class Rigid3D(Affine):
             - einit == 'gl2': at least two runs with initial rotations 
             determined by two solutions of 2D affine transformation
 
-          2) randome is True:
+          2) randome is True (or 'quasi' for quasi-random rotations):
             - einit is None: ninit runs with random initial rotations
             - einit is specified: ninit runs with random initial rotations
             in the einit_dist neighborhood of einit
@@ -229,13 +346,54 @@ class Rigid3D(Affine):
         multiple runs a re performed, the first run uses the specified
         initial conditions, while the other are random.
 
-
+        The optimization runs are independent from each other and can be
+        executed concurrently (arg executor, see 
+        find_32_constr_ck_multi()). In case einit is 'gl2', the runs for
+        both gl2 solutions are executed together. The best solution is the 
+        same as for the sequential execution.
+
+        If arg mode is 'unconstr_ck', find_32_unconstr_ck() is used for 
+        each run instead of find_32_constr_ck(). It optimizes unconstrained
+        quaternion and log scale by a quasi-Newton method, which avoids
+        the constraint handling of SLSQP.
+
+        If arg mode is 'batch_ck', all runs are advanced together by
+        find_32_batch_ck() instead of running sp.optimize.minimize() for
+        each of them (args use_jac and executor are then ignored). This
+        is much faster for a large number of runs (ninit ~ 100 and more).
+
+        If arg mode is 'global', the rotations are searched systematically
+        by find_32_global() instead, which certifies that the solution is 
+        the global minimum (attribute certificate of the returned 
+        transformation). Args concerning the initial parameters and 
+        executor are then ignored.
+
+        If arg weights is specified, weighted sum of squared differences is
+        minimized, where weights are given for each point (n_points) or 
+        separately for x and y components of final points (2 x n_points),
+        for example the inverse variances of the point localization (see
+        moments_32()). The translation is then determined from the 
+        weighted centers of mass, while the initial parameters (einit or 
+        sinit 'gl2') are still obtained from the unweighted points.
+
+        Random initial parameters are drawn from arg random_state, which 
+        can be None (numpy global random state), a seed (int) or 
+        np.random.RandomState (see get_random_state()), so that the 
+        results can be reproduced. If arg randome is 'quasi', initial 
+        rotations are quasi-random (see make_quasi_random_ck()) instead of
+        random. They cover the rotations more evenly, so that fewer runs 
+        (arg ninit) are needed for the same chance to find the optimum.
         """
 
         # check mode
-        if mode != 'constr_ck':
+        if mode not in ['constr_ck', 'unconstr_ck', 'batch_ck', 'global']:
             raise ValueError(
-                "Sorry, the only mode currently implemented is 'constr_ck'.")
+                "Mode " + str(mode) + " was not understood. Currently "
+                + "implemented modes are 'constr_ck', 'unconstr_ck', "
+                + "'batch_ck' and 'global'.")
+        if mode == 'global':
+            return cls.find_32_global(
+                x=x, y=y, scale=scale, maxiter=maxiter, weights=weights)
 
         # convert to cm coords
         x_cm = x.mean(axis=-1).reshape((3,1))
@@ -282,6 +440,7 @@ class Rigid3D(Affine):
             sinit_loc = None
 
         # adjust n iterations
+        random_state = cls.get_random_state(random_state)
         if (randome is False) and (randoms is False):
             if gl2: ninit_loc = 2
             else: ninit_loc = 1
@@ -292,66 +451,296 @@ class Rigid3D(Affine):
         if not gl2:
 
             # standard (not gl2)
-            res = cls.find_32_constr_ck_multi(
-                x=x_prime, y=y_prime, cm=False, use_jac=use_jac, 
-                randome=randome, einit=einit_loc, einit_dist=einit_dist, 
-                scale=scale, randoms=randoms, sinit=sinit_loc, maxiter=maxiter,
-                ninit=ninit_loc, return_all=return_all)
-            if return_all:
-                rigid_cm, all_rigid_cm = res
-            else:
-                best = res 
+            inits = cls.make_init_ck_multi(
+                ninit=ninit_loc, randome=randome, einit=einit_loc, 
+                einit_dist=einit_dist, scale=scale, randoms=randoms, 
+                sinit=sinit_loc, random_state=random_state)
 
         else:
 
             # gl2 so do for both possibilities
             ninit_1 = max(int(ninit_loc / 2), 1)
-            res_1 = cls.find_32_constr_ck_multi(
-                x=x_prime, y=y_prime, cm=False, use_jac=use_jac, ninit=ninit_1,
-                randome=randome, einit=einit_loc[0], einit_dist=einit_dist, 
-                randoms=randoms, sinit=sinit_loc, maxiter=maxiter)
+            inits = cls.make_init_ck_multi(
+                ninit=ninit_1, randome=randome, einit=einit_loc[0], 
+                einit_dist=einit_dist, scale=scale, randoms=randoms, 
+                sinit=sinit_loc, random_state=random_state)
             ninit_2 = max(ninit_loc - ninit_1, 1)
-            res_2 = cls.find_32_constr_ck_multi(
-                x=x_prime, y=y_prime, cm=False, use_jac=use_jac, ninit=ninit_2,
-                randome=randome, einit=einit_loc[1], einit_dist=einit_dist, 
-                randoms=randoms, sinit=sinit_loc, maxiter=maxiter)
-
-            if return_all:
-                rigid_cm_1, all_rigid_cm_1 = res_1
-                rigid_cm_2, all_rigid_cm_2 = res_2
-                all_rigid_cm = all_rigid_cm_1 + all_rigid_cm_2
-            else:
-                rigid_cm_1 = res_1 
-                rigid_cm_2 = res_2
-
-            if rigid_cm_1.optimizeResult.fun <= rigid_cm_2.optimizeResult.fun:
-                best = rigid_cm_1
-            else:
-                best = rigid_cm_2
+            inits += cls.make_init_ck_multi(
+                ninit=ninit_2, randome=randome, einit=einit_loc[1], 
+                einit_dist=einit_dist, scale=scale, randoms=randoms, 
+                sinit=sinit_loc, random_state=random_state)
+
+        # solve for all initial params (for gl2 both possibilities together)
+        if (mode == 'constr_ck') or (mode == 'unconstr_ck'):
+            best, all_rigid_cm = cls.find_32_constr_ck_inits(
+                x=x_prime, y=y_prime, inits=inits, scale=scale, 
+                use_jac=use_jac, maxiter=maxiter, executor=executor,
+                mode=mode, weights=weights)
+        elif mode == 'batch_ck':
+            best = cls.find_32_batch_ck(
+                x=x_prime, y=y_prime, inits=inits, scale=scale, 
+                maxiter=maxiter, weights=weights)
            
-        # get translation
+        # get translation (from weighted centers of mass if weights given)
+        if weights is not None:
+            x_cm, y_cm = cls.moments_32(x=x, y=y, weights=weights)[:2]
         translation_2 = (
-            y_cm - best.s_scalar * np.dot(best.q[0:2,:], x_cm))
-        translation = np.vstack((translation_2, [0]))
+            y_cm.reshape(2) 
+            - best.s_scalar * cls._rotate_cm(r=best.q[0:2,:], x_cm=x_cm))
+        translation = np.hstack((translation_2, [0]))
 
         # calculate full y in original (non-center of mass) frame
-        y_3 = best.transform(x=x, d=translation.squeeze(1)) 
+        y_3 = best.transform(x=x, d=translation) 
 
         # save translation related attributes
-        best.d = translation.reshape(3)
+        best.d = translation
         best.y = y_3
+        best.error = y - y_3[:2,:]
 
         # ToDo: see about modifying and returning all
 
         return best
 
+    @classmethod
+    def find_32_ransac(
+            cls, x, y, scale=None, threshold=None, n_hypotheses=200, 
+            loss=None, loss_param=None, max_refine=10, executor=None, 
+            weights=None, random_state=None, **kwargs):
+        """
+        Robust version of find_32() that detects outliers (for example 
+        wrongly placed markers) and finds the transformation using only
+        the remaining points (inliers).
+
+        Outliers are found by random sample consensus (RANSAC):
+          1) Hypotheses are made from minimal subsets of 3 points. Each 
+          subset gives two approximate transformations by the 2D affine
+          (GL(2)) approximation (see approx_gl2_to_ck3()). All subsets are
+          used if their number is not larger than arg n_hypotheses, 
+          otherwise n_hypotheses random subsets. The hypotheses can be
+          made concurrently (arg executor, see find_32_constr_ck_inits()).
+          2) All hypotheses are evaluated on all points at once and the 
+          one with the least median of squared residuals (LMedS) is 
+          selected. 
+          3) The transformation is refined by find_32() on the half of 
+          the points (plus 2) that fit the selected hypothesis best. 
+          Because the hypotheses are only approximate, they are not used 
+          to decide about the outliers directly. Besides the runs 
+          specified by kwargs, find_32() is also started from the 
+          selected hypothesis (and in later iterations from the previous
+          solution) and the better solution is kept.
+          4) Points whose residual for the refined transformation is not 
+          larger than the threshold are inliers. If arg threshold is None,
+          it is set to 2.5 robust standard deviations, estimated from the 
+          median of squared residuals. The transformation is refined by 
+          find_32() on inliers and this is repeated until inliers do not 
+          change (at most max_refine times). The returned inliers are 
+          always the points the transformation was fitted to.
+
+        If arg loss is 'huber' or 'tukey', the transformation is 
+        additionally refined on all points by iteratively reweighted
+        least squares with Huber or Tukey biweight loss. Residuals are 
+        weighted in the (weighted center of mass) moment matrices and 
+        each iteration is warm-started from the previous solution (see
+        find_32_batch_ck_moments()). The loss parameter (arg loss_param) 
+        is by default 1.345 (Huber) or 4.685 (Tukey) robust standard 
+        deviations. For Tukey loss, points having weight 0 are outliers. 
+
+        Arguments:
+          - x: initial points coordinates (3 x n_points martix)
+          - y: final points coordinates (2 x n_points matrix)
+          - scale: None to optimize scale, otherwise fixed scale
+          - threshold: maximal residual of inliers (same units as y), 
+          None for automatic determination
+          - n_hypotheses: max number of hypotheses (subsets of points)
+          - loss: None, 'huber' or 'tukey'
+          - loss_param: parameter of the loss function (same units as y)
+          - max_refine: max number of refinement iterations
+          - executor: None, 'thread', 'process' or an object that has 
+          map() method
+          - weights: weights of points (n_points) or of x and y 
+          components of final points (2 x n_points) used for the 
+          refinement (see find_32()), hypotheses are not weighted
+          - random_state: random state for the subsets and for find_32()
+          (see get_random_state())
+          - kwargs: other arguments passed to find_32() 
+
+        Returns transformation (like find_32()) fitted to inliers, with 
+        additional attributes:
+          - inliers: (bool ndarray, n_points) flags for inliers
+          - outliers: indices of outliers
+          - threshold: threshold used for inliers
+          - weights: weights of points (only if arg loss is specified)
+        """
+
+        n_points = x.shape[1]
+        subset_size = 3
+        random_state = cls.get_random_state(random_state)
+        kwargs['random_state'] = random_state
+        if weights is not None:
+            weights = np.asarray(weights, dtype=float)
+        if n_points <= subset_size:
+            transf = cls.find_32(
+                x=x, y=y, scale=scale, weights=weights, **kwargs)
+            transf.inliers = np.ones(n_points, dtype=bool)
+            transf.outliers = np.array([], dtype=int)
+            transf.threshold = threshold
+            return transf
+
+        # smallest threshold, related to the spread of final points
+        y_spread = np.sqrt(
+            ((y - y.mean(axis=-1).reshape((2,1)))**2).sum() / n_points)
+        min_threshold = 1e-6 * y_spread
+        def get_threshold(sq_res):
+            if threshold is not None:
+                return threshold
+            sigma = (1.4826 * (1 + 5. / (n_points - subset_size)) 
+                     * np.sqrt(np.median(sq_res)))
+            return max(2.5 * sigma, min_threshold)
+        def get_inliers(sq_res, thresh):
+            inliers = sq_res <= thresh**2
+            if inliers.sum() < subset_size:
+                inliers[np.argsort(sq_res)[:subset_size]] = True
+            return inliers
+
+        # make hypotheses from subsets of points
+        if sp.special.comb(n_points, subset_size) <= n_hypotheses:
+            subsets = [list(sub) for sub in itertools.combinations(
+                    range(n_points), subset_size)]
+        else:
+            subsets = [
+                random_state.choice(n_points, subset_size, replace=False)
+                for ind in range(n_hypotheses)]
+        tasks = [(cls, x[:, sub], y[:, sub], scale) for sub in subsets]
+        hypotheses = _executor_map(
+            _find_32_ransac_task, tasks, executor=executor)
+        hypotheses = np.array([one for hyps in hypotheses for one in hyps])
+
+        # evaluate all hypotheses (LMedS)
+        r = cls.make_r_ck(hypotheses[:, :4])[:, :2, :]
+        s = hypotheses[:, 4]
+        y_hyp = (s[:, np.newaxis, np.newaxis] * np.einsum('hij,jn->hin', r, x)
+                 + hypotheses[:, 5:, np.newaxis])
+        sq_res = ((y_hyp - y)**2).sum(axis=1)
+        best = np.argmin(np.median(sq_res, axis=1))
+
+        # start refinement from the (larger) half of points that fit best
+        inliers = np.zeros(n_points, dtype=bool)
+        inliers[np.argsort(sq_res[best])[:(n_points + subset_size + 1) // 2]] = True
+
+        # fit on inliers by find_32() as specified by kwargs and started 
+        # from the given parameters, keep the better one
+        warm_kwargs = dict(
+            (key, value) for key, value in kwargs.items() 
+            if key not in ['einit', 'sinit', 'randome', 'randoms'])
+        def fit(inliers, start):
+            fit_weights = None if weights is None else weights[..., inliers]
+            transfs = [cls.find_32(
+                x=x[:, inliers], y=y[:, inliers], scale=scale, 
+                weights=fit_weights, **kwargs)]
+            if kwargs.get('mode') != 'global':
+                transfs.append(cls.find_32(
+                    x=x[:, inliers], y=y[:, inliers], scale=scale, 
+                    weights=fit_weights, einit=start[:4], 
+                    sinit=float(start[4]), **warm_kwargs))
+            sq_errors = [
+                (one.error**2 if fit_weights is None 
+                 else fit_weights * one.error**2).sum() for one in transfs]
+            return transfs[np.argmin(sq_errors)]
+
+        # refine on inliers
+        start = hypotheses[best]
+        for iter_ in range(max_refine + 1):
+            transf = fit(inliers, start)
+            start = np.hstack((transf.ck, [transf.s_scalar]))
+            sq_res = ((transf.transform(x=x)[:2, :] - y)**2).sum(axis=0)
+            thresh = get_threshold(sq_res)
+            new_inliers = get_inliers(sq_res, thresh)
+            if (new_inliers == inliers).all() or (iter_ == max_refine):
+                break
+            inliers = new_inliers
+
+        # iteratively reweighted least squares
+        if loss is not None:
+            if loss == 'huber':
+                default_param = 1.345
+            elif loss == 'tukey':
+                default_param = 4.685
+            else:
+                raise ValueError(
+                    "Argument loss " + str(loss) + " was not understood. "
+                    + "Valid options are None, 'huber' and 'tukey'.")
+            if loss_param is None:
+                sigma = 1.4826 * np.sqrt(np.median(sq_res))
+                loss_param = max(default_param * sigma, min_threshold)
+            def get_loss_weights(sq_res):
+                res = np.sqrt(sq_res)
+                if loss == 'huber':
+                    return np.where(
+                        res <= loss_param, 1., loss_param / np.maximum(res, 1e-300))
+                else:
+                    return np.where(
+                        res < loss_param, (1 - (res / loss_param)**2)**2, 0.)
+
+            param = np.hstack((transf.ck, [transf.s_scalar]))
+            for iter_ in range(50):
+                loss_weights = get_loss_weights(sq_res)
+
+                # weighted moments
+                if weights is not None:
+                    point_weights = weights * loss_weights
+                else:
+                    point_weights = loss_weights
+                x_cm, y_cm, xxt, yxt, tryy = cls.moments_32(
+                    x=x, y=y, weights=point_weights)
+                if xxt.ndim == 3:
+                    xxt = xxt[np.newaxis]
+                if scale is None:
+                    init = param
+                else:
+                    init = param[:4]
+                landscape = cls.find_32_batch_ck_moments(
+                    xxt=xxt, yxt=yxt, tryy=tryy, inits=[init], scale=scale)
+                new_param = np.hstack((
+                    landscape.x[0, :4], 
+                    [landscape.x[0, 4] if scale is None else scale]))
+                transf = cls.make_32_ck(
+                    e_params=new_param[:4], s=new_param[4], x=x, y=y, 
+                    x_cm=x_cm, y_cm=y_cm)
+                sq_res = (transf.error**2).sum(axis=0)
+                converged = np.abs(
+                    new_param - param * np.sign(np.dot(param[:4], new_param[:4]))
+                    ).max() < 1e-10 * max(1, new_param[4])
+                param = new_param
+                if converged:
+                    break
+
+            transf.optimizeResult = sp.optimize.OptimizeResult(
+                x=landscape.x[0], fun=landscape.fun[0], nit=iter_ + 1,
+                success=landscape.success[0], 
+                status=int(not landscape.success[0]))
+            transf.weights = get_loss_weights(sq_res)
+            if loss == 'tukey':
+                thresh = loss_param
+            else:
+                thresh = get_threshold(sq_res)
+            inliers = get_inliers(sq_res, thresh)
+            transf.error = transf.error[:, inliers]
+
+        transf.inliers = inliers
+        transf.outliers = np.flatnonzero(~inliers)
+        transf.threshold = thresh
+
+        return transf
+
     @classmethod
     def find_32_constr_ck_multi(
             cls, x, y, scale=None, cm=False, use_jac=True,
             ninit=10, randome=False, einit=None, einit_dist=0.1, 
-            randoms=False, sinit=1., maxiter=1000, return_all=False):
+            randoms=False, sinit=1., maxiter=1000, return_all=False,
+            executor=None, mode='constr_ck', random_state=None):
         """
-
+        Runs find_32_constr_ck() ninit times with different initial 
+        parameters and returns the best solution.
 
 
         If arg scale is None, the optimal 3d rotation and scale are determined.
@@ -393,21 +782,88 @@ class Rigid3D(Affine):
         multiple runs a re performed, the first run uses the specified
         initial conditions, while the other are random.
 
+        All initial parameters are generated first (see 
+        make_init_ck_multi()), so the random numbers drawn do not depend 
+        on the execution mode. The optimizations are then executed 
+        according to arg executor (see find_32_constr_ck_inits()) and 
+        the best solution is the same as for the sequential execution.
 
- 
-
-       Arguments:
-          - return_all
+        Arguments:
+          - return_all: flag indicating if all solutions are returned 
+          in addition to the best one
+          - executor: None for sequential execution, 'thread' or 
+          'process' for execution in a thread or process pool, or an 
+          (already existing) pool object that has map() method, like 
+          multiprocessing.Pool
+          - mode: 'constr_ck' to use find_32_constr_ck() or 'unconstr_ck'
+          to use find_32_unconstr_ck()
+          - random_state: random state the initial parameters are drawn 
+          from (see get_random_state())
           
         """
 
+        # make initial params
+        inits = cls.make_init_ck_multi(
+            ninit=ninit, randome=randome, einit=einit, einit_dist=einit_dist,
+            scale=scale, randoms=randoms, sinit=sinit, 
+            random_state=random_state)
+
+        # find best solution from all initial values
+        best, all = cls.find_32_constr_ck_inits(
+            x=x, y=y, inits=inits, scale=scale, use_jac=use_jac, 
+            maxiter=maxiter, executor=executor, mode=mode)
+
+        # return only the best solution or the best and all solutions
+        if return_all:
+            return best, all
+        else:
+            return best
+
+    @classmethod
+    def make_init_ck_multi(
+            cls, ninit=10, randome=False, einit=None, einit_dist=0.1, 
+            scale=None, randoms=False, sinit=1., random_state=None):
+        """
+        Makes initial parameters for ninit runs of find_32_constr_ck(). 
+
+        Initial parameters are determined from args randome, einit, 
+        einit_dist, randoms and sinit as explained in 
+        find_32_constr_ck_multi(). If arg randome is 'quasi', 
+        quasi-random rotations are used instead of random ones (see
+        make_quasi_random_ck()). Random numbers are drawn from arg 
+        random_state (see get_random_state()).
+
+        Returns list of initial parameters (ndarrays), each containing 
+        Cayley-Klein parameters followed by scale (only if arg scale is 
+        None).
+        """
+
         # default initial values
         default_e = np.array([1.,0,0,0])
         default_s = 1.
 
-        # find best solution from random initial values
-        best = None
-        all = []
+        # make all random ck params at once (the same as one by one), 
+        # unless random scales are generated in between 
+        random_state = cls.get_random_state(random_state)
+        if (isinstance(randome, str) and (randome == 'quasi')):
+            make_e = partial(cls.make_quasi_random_ck, random_state=None)
+        else:
+            make_e = partial(cls.make_random_ck, random_state=random_state)
+        random_e = None
+        if ((isinstance(randome, str) and (randome == 'quasi')) 
+            or (randome and not (randoms and (scale is None)))):
+            if einit is None:
+                random_e = make_e(center=None, size=ninit)
+            else:
+
+                # second run starts from einit itself
+                random_e = make_e(
+                    center=einit, distance=einit_dist, 
+                    size=ninit - 1 if ninit > 1 else ninit)
+                if ninit > 1:
+                    random_e = np.insert(random_e, 1, 0, axis=0)
+
+        inits = []
         for init_ind in range(ninit):
 
             # initial ck params
@@ -415,16 +871,23 @@ class Rigid3D(Affine):
                 if einit is None:
                 
                     # totally random ck params
-                    one_einit = cls.make_random_ck(center=None)
+                    if random_e is not None:
+                        one_einit = random_e[init_ind]
+                    else:
+                        one_einit = cls.make_random_ck(
+                            center=None, random_state=random_state)
             
                 else:
 
                     # random around initial ck params
                     if init_ind == 1:
                         one_einit = einit
+                    elif random_e is not None:
+                        one_einit = random_e[init_ind]
                     else:
                         one_einit = cls.make_random_ck(
-                            center=einit, distance=einit_dist)
+                            center=einit, distance=einit_dist, 
+                            random_state=random_state)
                     
             else:
 
@@ -443,7 +906,7 @@ class Rigid3D(Affine):
 
                         # random around 1
                         one_s_init = sp.stats.maxwell.rvs(
-                            loc=0, scale=default_s)
+                            loc=0, scale=default_s, random_state=random_state)
                         
                     else:
 
@@ -452,7 +915,7 @@ class Rigid3D(Affine):
                             one_s_init = sinit
                         else:
                             one_s_init = sp.stats.maxwell.rvs(
-                                loc=0, scale=sinit)
+                                loc=0, scale=sinit, random_state=random_state)
                 else:
 
                     # single param set, default or specified
@@ -469,27 +932,181 @@ class Rigid3D(Affine):
                 # don't optimize scale, init params only ck
                 one_init = one_einit
 
-            # solve and see if best solution so far
-            rigid = cls.find_32_constr_ck(
-                x=x, y=y, scale=scale, init=one_init, use_jac=use_jac, 
-                maxiter=maxiter)
-            all.append(rigid)
-            try:
-                if rigid.optimizeResult.fun < best.optimizeResult.fun:
-                    best = rigid
-            except(NameError, AttributeError):
-                best = rigid        
+            inits.append(one_init)
+
+        return inits
+
+    @classmethod
+    def find_32_constr_ck_inits(
+            cls, x, y, inits, scale=None, use_jac=True, maxiter=1000, 
+            executor=None, mode='constr_ck', weights=None):
+        """
+        Runs find_32_constr_ck() (arg mode 'constr_ck') or 
+        find_32_unconstr_ck() (arg mode 'unconstr_ck') for each of the 
+        initial parameters (arg inits) and finds the best solution. 
+
+        The runs are executed sequentially (arg executor None), in a pool
+        of threads ('thread') or processes ('process') of the size of 
+        the number of cpus, or using the map() method of arg executor 
+        (e.g. an existing multiprocessing.Pool, it is not closed here). 
+        Threads help only partially because most of the time is spent in 
+        python callbacks. Processes have startup and pickling overhead, 
+        but scale with the number of cpus, so they pay off for large 
+        number of runs (ninit ~ 100 and more).
+
+        If several solutions have the same (smallest) value of the 
+        objective function, the first one is returned, like for the 
+        sequential execution.
+
+        Arg weights is passed to find_32_constr_ck() or 
+        find_32_unconstr_ck().
+
+        Returns (best, all): the best solution and a list of all 
+        solutions (in the order of inits)
+        """
+
+        # check mode
+        if mode not in ['constr_ck', 'unconstr_ck']:
+            raise ValueError(
+                "Mode " + str(mode) + " was not understood. Valid options "
+                + "are 'constr_ck' and 'unconstr_ck'.")
+
+        tasks = [
+            (cls, mode, dict(
+                x=x, y=y, scale=scale, init=one_init, use_jac=use_jac,
+                maxiter=maxiter, weights=weights)) 
+            for one_init in inits]
+
+        # solve
+        all = _executor_map(_find_32_ck_task, tasks, executor=executor)
+
+        # find the best solution
+        best = None
+        for rigid in all:
+            if (best is None) or (
+                    rigid.optimizeResult.fun < best.optimizeResult.fun):
+                best = rigid
+
+        return best, all
+
+    @classmethod
+    def find_32_batch_ck(
+            cls, x, y, inits, scale=None, maxiter=1000, ftol=1e-12, 
+            return_all=False, weights=None):
+        """
+        Finds rigid transformation in 3D that transforms points x (initial) 
+        into points y (final) when only the first two coordinates are given 
+        for y, starting from all initial parameters (arg inits) at once.
+
+        Solves the same problem as find_32_constr_ck() for each of the 
+        initial parameters, but instead of calling sp.optimize.minimize()
+        for each of them, all parameter sets are advanced together by a 
+        batched Levenberg-Marquardt (damped Gauss-Newton) iteration that 
+        uses only numpy array operations. Because the objective function
+        depends on the coordinates only through x x^T, y x^T and tr(y^T y)
+        (see sq_diff_ck_23()), one iteration costs about the same for 
+        1000 initial parameter sets as for one set in python callbacks.
+
+        The constraints of find_32_constr_ck() are implemented directly:
+        the steps for Cayley-Klein parameters are projected on the tangent
+        plane of the unit sphere and the parameters are normalized after 
+        each step, while steps that would make scale negative are rejected.
+        Because e and -e give the same rotation, the sign of Cayley-Klein 
+        parameters of the solutions is chosen so that e_0 >= 0.
+
+        Arguments:
+          - x: initial points coordinates (3 x n_points martix)
+          - y: final points coordinates (2 x n_points matrix)
+          - inits: initial parameters, list or ndarray (n_inits x 4 or 5), 
+          each containing Cayley-Klein parameters followed by scale (only 
+          if arg scale is None), like returned by make_init_ck_multi()
+          - scale: if None the optimization also solves for (scalar) scale 
+          factor, otherwise scale fixed at the specified factor
+          - maxiter: maximum number of iterations
+          - ftol: relative tolerance of the objective function used to 
+          decide convergence
+          - return_all: flag indicating if the optimization results for 
+          all initial parameters are returned in addition to the best 
+          solution
+          - weights: None, weights of points (n_points) or of x and y 
+          components of final points (2 x n_points), see moments_32(); 
+          if given, the points are always converted to the weighted 
+          center of mass for the optimization
+
+        Returns transformation (instance of this group) having the same 
+        attributes as the one returned by find_32_constr_ck(), except 
+        that attribute optimizeResult is an sp.optimize.OptimizeResult
+        made here. If arg return_all is True, returns (best, landscape), 
+        where landscape (also sp.optimize.OptimizeResult) contains all 
+        local minima found, in the order of inits:
+          - x: optimized parameters (n_inits x 4 or 5)
+          - fun: values of the objective function (n_inits)
+          - nit: number of iterations
+          - success: flags showing whether the optimization converged
+          - jac: derivatives of the objective function
+          - init: initial parameters
+        """
+
+        # calculate matrices
+        if weights is None:
+            xxt = np.dot(x, x.transpose())
+            yxt = np.dot(y, x.transpose())
+            tryy = (y * y).sum()
+        else:
+            dummy, dummy, xxt, yxt, tryy = cls.moments_32(
+                x=x, y=y, weights=weights)
+            if xxt.ndim == 3:
+                xxt = xxt[np.newaxis]
+
+        # optimize all
+        landscape = cls.find_32_batch_ck_moments(
+            xxt=xxt, yxt=yxt, tryy=tryy, inits=inits, scale=scale, 
+            maxiter=maxiter, ftol=ftol)
+        param = landscape.x
+        fun = landscape.fun
+        nit = landscape.nit
+        success = landscape.success
+        grad = landscape.jac
+        init = landscape.init
+
+        # best solution
+        best_ind = np.argmin(fun)
+        e_params = param[best_ind, :4]
+        if scale is None:
+            s = param[best_ind, 4]
+        else:
+            s = scale
+        res = sp.optimize.OptimizeResult(
+            x=param[best_ind].copy(), fun=fun[best_ind], nit=nit[best_ind], 
+            success=success[best_ind], status=int(not success[best_ind]),
+            jac=grad[best_ind].copy())
+
+        # calculate missing r and y components
+        r_33 = cls.make_r_ck(e_params)
+        y_3 = s * np.dot(r_33[2,:], x)
+        y_33 = np.vstack((y, y_3))
+
+        # make instance 
+        inst = cls()
+        inst.gl = s * r_33
+        inst.q = r_33
+        inst.y = y_33
+        inst.s_scalar = s
+        inst.s = s * np.identity(3)
+        inst.ck = e_params
+        inst.optimizeResult = res
+        inst.initial_params = init[best_ind]
+        inst.error = y - np.dot(inst.gl[:2,:], x)
 
-        # return only the best solution or the best and all solutions
         if return_all:
-            return best, all
+            return inst, landscape
         else:
-            return best
+            return inst
 
     @classmethod
     def find_32_constr_ck(
             cls, x, y, scale=None, init=None, cm=False, use_jac=True, 
-            maxiter=1000):
+            maxiter=1000, weights=None):
         """
         Finds rigid transformation in 3D that transforms points x (initial) 
         into points y (final) when only the first two coordinates are given 
@@ -526,6 +1143,10 @@ class Rigid3D(Affine):
           function (recommended)
           - maxiter: maximum number of iterations for the optimization
           procedure (same as arg maxiter of sp.optimize.minimize())
+          - weights: None, weights of points (n_points) or of x and y 
+          components of final points (2 x n_points), see moments_32(); 
+          if given, the optimization is done in the weighted center of
+          mass frame regardless of arg cm
 
         Returns transformation (instance of this group) with attributes:
           - ql: general linear matrix (in this case gl = s q)
@@ -547,9 +1168,13 @@ class Rigid3D(Affine):
             y_prime = y
 
         # calculate matrices
-        xxt = np.dot(x_prime, x_prime.transpose())
-        yxt = np.dot(y_prime, x_prime.transpose())
-        tryy = (y_prime * y_prime).sum()
+        if weights is None:
+            xxt = np.dot(x_prime, x_prime.transpose())
+            yxt = np.dot(y_prime, x_prime.transpose())
+            tryy = (y_prime * y_prime).sum()
+        else:
+            dummy, dummy, xxt, yxt, tryy = cls.moments_32(
+                x=x, y=y, weights=weights)
         
         # function to mimimize
         sq_diff_ck = partial(
@@ -676,6 +1301,896 @@ class Rigid3D(Affine):
 
         return inst
 
+    @classmethod
+    def find_32_batch_ck_moments(
+            cls, xxt, yxt, tryy, inits, scale=None, maxiter=1000, ftol=1e-12):
+        """
+        Optimization part of find_32_batch_ck(), where the (center of
+        mass) initial and final coordinates are given only by the 
+        matrices the objective function depends on: x x^T, y x^T and 
+        tr(y^T y). This allows updating these matrices when the points 
+        change, without recalculating them from the coordinates.
+
+        The matrices can also be given separately for each initial 
+        parameter set (shapes n_inits x 3 x 3, n_inits x 2 x 3 and n_inits),
+        which solves n_inits different problems (for example resampled 
+        points) at once.
+
+        For weights given separately for x and y components of final 
+        points (see moments_32()), x x^T has to be given for each axis 
+        and always with 4 dimensions: n_inits (or 1) x 2 x 3 x 3.
+
+        Arguments:
+          - xxt, yxt, tryy: x x^T, y x^T and tr(y^T y)
+          - inits, scale, maxiter, ftol: see find_32_batch_ck()
+
+        Returns sp.optimize.OptimizeResult containing results for all 
+        initial parameters (landscape in find_32_batch_ck()) and the 
+        corresponding derivatives of the objective function (jac).
+        """
+
+        # initial parameters, e normalized
+        init = np.array(inits, dtype=float, ndmin=2)
+        param = init.copy()
+        param[:, :4] /= np.sqrt((param[:, :4]**2).sum(axis=1))[:, np.newaxis]
+        n_init, n_param = param.shape
+
+        # moments for each parameter set
+        if np.ndim(xxt) == 4:
+            xxt = np.broadcast_to(xxt, (n_init, 2, 3, 3))
+        else:
+            xxt = np.broadcast_to(xxt, (n_init, 3, 3))
+        yxt = np.broadcast_to(yxt, (n_init, 2, 3))
+        tryy = np.broadcast_to(tryy, (n_init,))
+
+        # objective function and its Gauss-Newton approximation of Hessian
+        fun, grad, hess = cls.sq_diff_ck_23_batch(
+            param=param, scale=scale, xxt=xxt, yxt=yxt, const=tryy)
+        lam = np.ones(n_init) * 1e-3
+        nit = np.zeros(n_init, dtype=int)
+        success = np.zeros(n_init, dtype=bool)
+        active = np.arange(n_init)
+        abs_tol = ftol * np.maximum(tryy, np.finfo(float).tiny)
+
+        for iter_ in range(maxiter):
+
+            # project e part of grad and hess on the tangent plane
+            proj = np.tile(np.identity(n_param), (len(active), 1, 1))
+            e_act = param[active, :4]
+            proj[:, :4, :4] -= e_act[:, :, np.newaxis] * e_act[:, np.newaxis, :]
+            grad_t = np.einsum('nij,nj->ni', proj, grad[active])
+            hess_t = np.einsum(
+                'nij,njk,nkl->nil', proj, hess[active], proj)
+
+            # damped Gauss-Newton step (radial e direction has no curvature)
+            diag = np.einsum('nii->ni', hess_t)
+            damp = (lam[active, np.newaxis] * diag 
+                    + 1e-12 * (diag.sum(axis=1)[:, np.newaxis] + 1))
+            step = np.linalg.solve(
+                hess_t + damp[:, :, np.newaxis] * np.identity(n_param), 
+                -grad_t[:, :, np.newaxis] / 2.)[:, :, 0]
+
+            # new parameters, back on the unit sphere
+            new = param[active] + step
+            new[:, :4] /= np.sqrt((new[:, :4]**2).sum(axis=1))[:, np.newaxis]
+            new_fun, new_grad, new_hess = cls.sq_diff_ck_23_batch(
+                param=new, scale=scale, xxt=xxt[active], yxt=yxt[active], 
+                const=tryy[active])
+            if scale is None:
+                new_fun[new[:, 4] <= 0] = np.inf
+
+            # accept improved, adjust damping
+            better = new_fun < fun[active]
+            decrease = fun[active] - new_fun
+            acc = active[better]
+            param[acc] = new[better]
+            grad[acc] = new_grad[better]
+            hess[acc] = new_hess[better]
+            nit[active] += 1
+            lam[active] = np.where(better, lam[active] / 10., lam[active] * 10.)
+
+            # convergence
+            converged = better & (
+                decrease <= ftol * new_fun + abs_tol[active])
+            success[active[converged]] = True
+            fun[acc] = new_fun[better]
+            done = converged | (lam[active] > 1e16)
+            active = active[~done]
+            if len(active) == 0:
+                break
+
+        # e and -e are the same rotation
+        param[param[:, 0] < 0, :4] *= -1
+
+        landscape = sp.optimize.OptimizeResult(
+            x=param, fun=fun, nit=nit, success=success, jac=grad, init=init)
+
+        return landscape
+
+    @classmethod
+    def find_32_global(
+            cls, x, y, scale=None, grid=6, tol=None, max_cells=500000, 
+            n_refine=10, min_angle=np.pi/180, maxiter=1000, weights=None,
+            chunk_size=65536):
+        """
+        Finds the same transformation as find_32(), but instead of relying
+        on a number of (random) initial parameters, certifies that the 
+        solution is the global minimum of the sum of squared differences 
+        (within arg tol), or reports how far from certain it is.
+
+        The rotations (SO(3)) are systematically divided in cells by a 
+        coarse grid (see _so3_cells()), the objective function is 
+        evaluated in the cell centers for all cells at once and the best 
+        cells are refined by find_32_batch_ck_moments(). A lower bound of 
+        the objective function in each cell is calculated from its value,
+        derivatives and a bound on the second derivatives at the cell 
+        center (see _bound_32_cells()). Cells whose lower bound is 
+        larger than the best solution found minus tol can not contain a 
+        better solution and are discarded, the others are split in 8 
+        smaller cells (branch and bound). This is repeated until no cells 
+        remain (the solution is certified) or until the total number of 
+        evaluated cells would exceed max_cells, which limits the runtime.
+
+        In addition, distinct local minima (rotations differing by more 
+        than min_angle) whose objective function is within tol of the 
+        best one are reported as alternatives. They are found by refining
+        the best cells of different regions of the initial grid, so 
+        their detection is not guaranteed. For example, if all initial
+        points lie on the same z-plane, rotations mirrored by that plane
+        give the same objective function.
+
+        If arg scale is None, scale is optimized together with the 
+        rotation, in which case the cells are evaluated at the optimal 
+        scale for the rotation of their centers.
+
+        Arguments:
+          - x: initial points coordinates (3 x n_points martix)
+          - y: final points coordinates (2 x n_points matrix)
+          - scale: None to optimize scale, otherwise fixed scale
+          - grid: number of initial cells along each of the 3 axes of the 
+          4 faces of the Cayley-Klein parameter cube (4 grid^3 cells) 
+          - tol: tolerance of the objective function (sum of squared 
+          differences), None for 1% of the objective function of the 
+          best initially refined cell plus 1e-9 tr(y^T y) (center of 
+          mass y)
+          - max_cells: max number of evaluated cells
+          - n_refine: max number of cells refined by the local 
+          optimization at each step
+          - min_angle: min rotation angle (in rad) between distinct minima
+          - maxiter: max number of iterations of the local optimization
+          - weights: None, weights of points (n_points) or of x and y 
+          components of final points (2 x n_points), see moments_32()
+          - chunk_size: max number of cells evaluated at once (limits 
+          memory usage)
+
+        Returns transformation (like find_32()) having additional 
+        attribute certificate (sp.optimize.OptimizeResult):
+          - certified: flag indicating the solution is the global minimum 
+          within tol
+          - lower_bound: lower bound of the objective function over all 
+          rotations
+          - gap: difference between the objective function of the 
+          solution and lower_bound
+          - tol: tolerance used
+          - n_cells: number of evaluated cells
+          - nit: number of branch and bound iterations
+          - alternatives: parameters of alternative minima (n_alt x 4, or 
+          5 if scale is optimized), ordered by their objective function
+          - alternatives_fun: objective function of alternative minima
+          - alternatives_angle: rotation angles between the solution and
+          alternative minima (in rad)
+        """
+
+        # moments of center of mass coordinates
+        x_cm, y_cm, xxt, yxt, tryy = cls.moments_32(
+            x=x, y=y, weights=weights)
+        if xxt.ndim == 3:
+            xxt_batch = xxt[np.newaxis]
+        else:
+            xxt_batch = xxt
+
+        def refine(e_params, s_params):
+            if scale is None:
+                inits = np.column_stack((e_params, s_params))
+            else:
+                inits = e_params
+            landscape = cls.find_32_batch_ck_moments(
+                xxt=xxt_batch, yxt=yxt, tryy=tryy, inits=inits, 
+                scale=scale, maxiter=maxiter)
+            return landscape
+
+        def select(e_params, value, dist):
+            # best cells that are further than dist from each other
+            selected = []
+            for ind in np.argsort(value):
+                if len(selected) >= n_refine:
+                    break
+                if len(selected) > 0:
+                    cos_half = np.abs(np.dot(e_params[selected], e_params[ind]))
+                    if (cos_half > np.cos(dist / 2.)).any():
+                        continue
+                selected.append(ind)
+            return np.array(selected)
+
+        # initial grid
+        faces, centers, half = cls._so3_cells(grid=grid)
+        e_cells = cls._so3_cells(faces=faces, centers=centers)
+        value, lower, s_cells, angle = cls._bound_32_cells(
+            e_params=e_cells, half=half, scale=scale, xxt=xxt, yxt=yxt, 
+            tryy=tryy)
+        n_cells = len(faces)
+
+        # refine the best cells of different regions
+        selected = select(e_cells, value, dist=2*angle)
+        landscape = refine(e_cells[selected], s_cells[selected])
+        minima_x = [landscape.x]
+        minima_fun = [landscape.fun]
+        best = np.argmin(landscape.fun)
+        best_x = landscape.x[best]
+        best_fun = landscape.fun[best]
+        best_res = (landscape.nit[best], landscape.success[best], 
+                    landscape.jac[best], landscape.init[best])
+        if tol is None:
+            tol = 1e-2 * best_fun + 1e-9 * tryy
+
+        # branch and bound
+        pruned_lower = np.inf
+        nit = 0
+        while True:
+            keep = lower < best_fun - tol
+            if (~keep).any():
+                pruned_lower = min(pruned_lower, lower[~keep].min())
+            faces, centers, lower = faces[keep], centers[keep], lower[keep]
+            if (len(faces) == 0) or (n_cells + 8 * len(faces) > max_cells):
+                break
+
+            # split cells
+            half = half / 2.
+            shifts = half * np.array(list(itertools.product([-1, 1], repeat=3)))
+            faces = np.repeat(faces, 8)
+            centers = (centers[:, np.newaxis, :] + shifts).reshape(-1, 3)
+            e_cells = cls._so3_cells(faces=faces, centers=centers)
+            bounds = [
+                cls._bound_32_cells(
+                    e_params=e_cells[start:start+chunk_size], half=half, 
+                    scale=scale, xxt=xxt, yxt=yxt, tryy=tryy)
+                for start in range(0, len(faces), chunk_size)]
+            value, lower, s_cells = [
+                np.concatenate([one[ind] for one in bounds]) 
+                for ind in range(3)]
+            angle = bounds[0][3]
+            n_cells += len(faces)
+            nit += 1
+
+            # refine cells better than the best solution
+            if value.min() < best_fun:
+                selected = select(e_cells, value, dist=2*angle)
+                landscape = refine(e_cells[selected], s_cells[selected])
+                minima_x.append(landscape.x)
+                minima_fun.append(landscape.fun)
+                new_best = np.argmin(landscape.fun)
+                if landscape.fun[new_best] < best_fun:
+                    best_x = landscape.x[new_best]
+                    best_fun = landscape.fun[new_best]
+                    best_res = (
+                        landscape.nit[new_best], landscape.success[new_best], 
+                        landscape.jac[new_best], landscape.init[new_best])
+
+        # certificate
+        if len(faces) > 0:
+            lower_bound = min(pruned_lower, lower.min())
+        else:
+            lower_bound = pruned_lower
+        lower_bound = min(lower_bound, best_fun)
+
+        # distinct minima within tolerance
+        minima_x = np.concatenate(minima_x)
+        minima_fun = np.concatenate(minima_fun)
+        order = np.argsort(minima_fun)
+        alt_ind = []
+        for ind in order:
+            if minima_fun[ind] > best_fun + tol:
+                break
+            distinct = [best_x[:4]] + [minima_x[one, :4] for one in alt_ind]
+            cos_half = np.abs(np.dot(distinct, minima_x[ind, :4]))
+            if (cos_half < np.cos(min_angle / 2.)).all():
+                alt_ind.append(ind)
+        alternatives = minima_x[alt_ind].reshape(-1, minima_x.shape[1])
+        alt_angle = 2 * np.arccos(np.minimum(
+            np.abs(np.dot(alternatives[:, :4], best_x[:4])), 1))
+
+        # make instance
+        if scale is None:
+            s = best_x[4]
+        else:
+            s = scale
+        inst = cls.make_32_ck(
+            e_params=best_x[:4], s=s, x=x, y=y, x_cm=x_cm, y_cm=y_cm)
+        nit_best, success, jac, init = best_res
+        inst.optimizeResult = sp.optimize.OptimizeResult(
+            x=best_x.copy(), fun=best_fun, nit=nit_best, success=success,
+            status=int(not success), jac=jac)
+        inst.initial_params = init
+        inst.certificate = sp.optimize.OptimizeResult(
+            certified=(best_fun - lower_bound <= tol), 
+            lower_bound=lower_bound, gap=best_fun - lower_bound, tol=tol, 
+            n_cells=n_cells, nit=nit, alternatives=alternatives, 
+            alternatives_fun=minima_fun[alt_ind], 
+            alternatives_angle=alt_angle)
+
+        return inst
+
+    @classmethod
+    def _so3_cells(cls, grid=None, faces=None, centers=None):
+        """
+        Cells covering all 3D rotations, used in find_32_global().
+
+        Because e and -e give the same rotation, each rotation can be 
+        represented by Cayley-Klein parameters e scaled so that the 
+        component with the largest absolute value is 1, that is by a 
+        point on one of the 4 faces e_k = 1 of the cube [-1, 1]^4. These 
+        faces are divided in cubic cells, given by the face (k) and by 
+        the other 3 components of the cell center. Because normalization
+        does not increase distances outside the unit sphere, normalized 
+        e of all points of a cell having half-width h are within 
+        sqrt(3) h of the normalized e of its center, so the rotation
+        angle from the center is at most 4 arcsin(sqrt(3) h / 2).
+
+        If arg grid is given, returns (faces, centers, half-width) of 
+        the 4 grid^3 cells of the initial grid. Otherwise returns 
+        normalized Cayley-Klein parameters (n_cells x 4) of the centers 
+        of cells given by args faces and centers.
+        """
+
+        if grid is not None:
+            half = 1. / grid
+            ticks = np.linspace(-1 + half, 1 - half, grid)
+            centers = np.array(list(itertools.product(ticks, repeat=3)))
+            faces = np.repeat(np.arange(4), len(centers))
+            centers = np.tile(centers, (4, 1))
+            return faces, centers, half
+
+        others = np.array([[1, 2, 3], [0, 2, 3], [0, 1, 3], [0, 1, 2]])
+        e_params = np.ones((len(faces), 4))
+        e_params[np.arange(len(faces))[:, np.newaxis], others[faces]] = centers
+        e_params /= np.sqrt((e_params**2).sum(axis=1))[:, np.newaxis]
+        return e_params
+
+    @classmethod
+    def _bound_32_cells(cls, e_params, half, scale, xxt, yxt, tryy):
+        """
+        Objective function of find_32() (see sq_diff_ck_23()) at the 
+        centers of cells given by their Cayley-Klein parameters (arg 
+        e_params, n_cells x 4) and its lower bound within the cells 
+        having half-width half (see _so3_cells()).
+
+        The objective function E = tr(y^T y) + s^2 a(r) - 2 s b(r) 
+        depends on the rotation through a = tr(r x x^T r^T) and 
+        b = tr(y x^T r^T) (first two rows of r). Rotations in a cell are 
+        r = r_c exp(t w) where r_c is the center rotation, w the 
+        antisymmetric matrix of a unit vector and t <= theta (the max 
+        angle). Because the rows of r_c exp(t w) and of their derivatives
+        by t have norm <= 1, the second derivatives by t are bounded by 
+        |a''| <= 4 |x x^T| and |b''| <= sum_i |(y x^T)_i|, so that for 
+        fixed scale:
+
+          E(r) >= E(r_c) - theta |dE/dw| - theta^2 (s^2 |a''| + 2 s |b''|) / 2
+
+        where dE/dw are the derivatives of E in respect to rotations 
+        around x, y and z axes at r_c. If scale is optimized, the optimal 
+        scale b / a is bounded in each cell by the first order bounds of 
+        a and b and the bound is taken over that scale interval.
+
+        Returns (value, lower, scale, angle): values at the centers, lower
+        bounds, optimal (or fixed) scales at the centers (n_cells each) 
+        and the max rotation angle theta from the center within a cell.
+        """
+
+        # rotations, a and b at the centers
+        r = cls.make_r_ck(e_params)[:, :2, :]
+        per_axis = (xxt.ndim == 3)
+        if per_axis:
+            rxxt = np.einsum('nij,ijk->nik', r, xxt)
+        else:
+            rxxt = np.einsum('nij,jk->nik', r, xxt)
+        a = (rxxt * r).sum(axis=(1, 2))
+        b = (yxt * r).sum(axis=(1, 2))
+
+        # derivatives by rotations around x, y and z (r G_k)
+        gen = np.zeros((3, 3, 3))
+        gen[0, 1, 2], gen[0, 2, 1] = -1, 1
+        gen[1, 2, 0], gen[1, 0, 2] = -1, 1
+        gen[2, 0, 1], gen[2, 1, 0] = -1, 1
+        r_gen = np.einsum('nij,kjl->nkil', r, gen)
+        a_deriv = 2 * np.einsum('nkil,nil->nk', r_gen, rxxt)
+        b_deriv = np.einsum('nkil,il->nk', r_gen, yxt)
+
+        # bounds of second derivatives and global bounds of a and b 
+        if per_axis:
+            a_deriv2 = 4 * sum(np.linalg.norm(one, 2) for one in xxt)
+            a_min = sum(np.linalg.eigvalsh(one)[0] for one in xxt)
+        else:
+            # a = tr(x x^T) - r_3 x x^T r_3^T, r_3 the third row
+            a_deriv2 = 4 * np.linalg.norm(xxt, 2)
+            a_min = np.linalg.eigvalsh(xxt)[:2].sum()
+        b_deriv2 = np.sqrt((yxt**2).sum(axis=1)).sum()
+        a_min = max(a_min, 0)
+
+        # first order ranges of a and b
+        angle = 4 * np.arcsin(min(np.sqrt(3) * half / 2., 1))
+        a_diff = (np.sqrt((a_deriv**2).sum(axis=1)) * angle 
+                  + a_deriv2 * angle**2 / 2.)
+        b_diff = (np.sqrt((b_deriv**2).sum(axis=1)) * angle 
+                  + b_deriv2 * angle**2 / 2.)
+
+        # scale range
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if scale is None:
+                s = np.maximum(b, 0) / a
+                a_low = np.maximum(a - a_diff, a_min)
+                s_low = np.maximum(b - b_diff, 0) / (a + a_diff)
+                s_high = np.maximum(np.minimum(b + b_diff, b_deriv2), 0) / a_low
+            else:
+                s = scale * np.ones(len(e_params))
+                s_low = s
+                s_high = s
+            value = tryy + s**2 * a - 2 * s * b
+
+            # lower bound
+            grad = np.sqrt(((s[:, np.newaxis] * a_deriv - 2 * b_deriv)**2
+                            ).sum(axis=1))
+            grad_s = np.sqrt((a_deriv**2).sum(axis=1))
+            lower = (value - angle * s_high * (
+                    grad + np.maximum(s_high - s, s - s_low) * grad_s)
+                - angle**2 * (s_high**2 * a_deriv2 + 2 * s_high * b_deriv2) 
+                / 2.)
+        lower[~np.isfinite(lower)] = 0
+        lower = np.maximum(lower, 0)
+
+        return value, lower, s, angle
+
+    @classmethod
+    def make_32_ck(cls, e_params, s, x, y, x_cm=None, y_cm=None):
+        """
+        Makes transformation from Cayley-Klein parameters and scale found 
+        for center of mass initial (x) and final (y) coordinates. 
+
+        The translation is calculated so that the center of mass of 
+        initial points is transformed to the center of mass of final 
+        points (x and y components only, z component of translation is 0).
+        
+        Arguments:
+          - e_params: Cayley-Klein parameters
+          - s: (scalar) scale
+          - x: initial points coordinates (3 x n_points martix)
+          - y: final points coordinates (2 x n_points matrix)
+          - x_cm, y_cm: centers of mass, if None calculated as mean of x 
+          and y (weighted centers can be given here, x_cm also for each 
+          axis as returned by moments_32())
+
+        Returns transformation (instance of this group) with attributes 
+        gl, q, ck, s, s_scalar, d, y (transformed initial points) and error.
+        """
+
+        if x_cm is None:
+            x_cm = x.mean(axis=-1)
+        if y_cm is None:
+            y_cm = y.mean(axis=-1)
+        r_33 = cls.make_r_ck(e_params)
+
+        inst = cls()
+        inst.gl = s * r_33
+        inst.q = r_33
+        inst.s_scalar = s
+        inst.s = s * np.identity(3)
+        inst.ck = np.asarray(e_params)
+        inst.d = np.hstack((
+            y_cm - s * cls._rotate_cm(r=r_33[:2,:], x_cm=x_cm), [0]))
+        inst.y = inst.transform(x=x)
+        inst.error = y - inst.y[:2,:]
+
+        return inst
+
+    @classmethod
+    def find_32_unconstr_ck(
+            cls, x, y, scale=None, init=None, cm=False, use_jac=True, 
+            maxiter=1000, weights=None):
+        """
+        Finds rigid transformation in 3D that transforms points x (initial) 
+        into points y (final) when only the first two coordinates are given 
+        for y (and all three for x).
+
+        Solves the same problem as find_32_constr_ck(), but without 
+        constraints. The optimization parameters are an unnormalized 
+        quaternion q, which is normalized inside the objective function
+        (e = q / |q|) and (if arg scale is None) the logarithm of scale, 
+        so that scale is always positive. The optimization is done by the
+        limited memory quasi-Newton method L-BFGS-B (sp.optimize.minimize(),
+        without bounds) using the analytic gradient:
+
+          dE / dq = (1 - e e^T) / |q| dE / de
+          dE / d(log s) = s dE / ds
+
+        Compared to find_32_constr_ck() (SLSQP with constraints) an 
+        iteration is cheaper, so a run is about 1.5 times faster, while 
+        the number of iterations and the rate of finding the optimal 
+        solution are similar (see cases find_32_constr_ck_solver and 
+        find_32_unconstr_ck_solver in tdct/benchmark.py).
+
+        Arguments and the returned transformation are the same as in 
+        find_32_constr_ck(). Initial parameters (arg init) are given as
+        Cayley-Klein parameters and scale (not as log scale), and 
+        attribute optimizeResult.x contains the optimized quaternion and
+        log scale.
+        """
+ 
+        # convert to CM coords
+        if cm:
+            x_prime = x - x.mean(axis=-1).reshape((3,1))
+            y_prime = y - y.mean(axis=-1).reshape((2,1))
+        else:
+            x_prime = x
+            y_prime = y
+
+        # calculate matrices
+        if weights is None:
+            xxt = np.dot(x_prime, x_prime.transpose())
+            yxt = np.dot(y_prime, x_prime.transpose())
+            tryy = (y_prime * y_prime).sum()
+        else:
+            dummy, dummy, xxt, yxt, tryy = cls.moments_32(
+                x=x, y=y, weights=weights)
+
+        # init: [1, 0, 0, ...]
+        if init is None:
+            if scale is None:
+                init = np.array([1.,0,0,0,1])
+            else:
+                init = np.array([1.,0,0,0])
+        init_unconstr = np.array(init, dtype=float)
+        if scale is None:
+            init_unconstr[4] = np.log(init_unconstr[4])
+
+        def to_constr(param):
+            """
+            Converts unconstrained to Cayley-Klein (and scale) parameters
+            """
+            q_norm = np.sqrt((param[:4]**2).sum())
+            if scale is None:
+                constr = np.hstack((param[:4] / q_norm, [np.exp(param[4])]))
+            else:
+                constr = param[:4] / q_norm
+            return constr, q_norm
+
+        # function to mimimize
+        def sq_diff(param):
+            constr, q_norm = to_constr(param)
+            return cls.sq_diff_ck_23(
+                constr, scale=scale, xxt=xxt, yxt=yxt, make_r=cls.make_r_ck,
+                const=tryy)
+
+        # derivatives
+        def sq_diff_deriv(param):
+            constr, q_norm = to_constr(param)
+            derivs = cls.sq_diff_ck_23_deriv(
+                constr, scale=scale, yxt=yxt, xxt=xxt, make_r=cls.make_r_ck, 
+                make_r_deriv=cls.make_r_ck_deriv)
+            e_params = constr[:4]
+            derivs[:4] = (
+                derivs[:4] - np.dot(derivs[:4], e_params) * e_params) / q_norm
+            if scale is None:
+                derivs[4] = constr[4] * derivs[4]
+            return derivs
+
+        # check if should use derivatives
+        if use_jac:
+            jac = sq_diff_deriv
+        else:
+            jac = None
+
+        # solve
+        res = sp.optimize.minimize(
+            sq_diff, init_unconstr, jac=jac, method='L-BFGS-B',
+            options={'maxiter' : maxiter})
+
+        # optimized parameters
+        constr, q_norm = to_constr(res.x)
+        e_params = constr[:4]
+        if scale is None:
+            s = constr[4]
+        else:
+            s = scale
+
+        # calculate missing r and y components
+        r_33 = cls.make_r_ck(e_params)
+        y_3 = s * np.dot(r_33[2,:], x_prime)
+        y_33 = np.vstack((y_prime, y_3))
+
+        # make instance 
+        inst = cls()
+        inst.gl = s * r_33
+        inst.q = r_33
+        inst.y = y_33
+        inst.s_scalar = s
+        inst.s = s * np.identity(3)
+        inst.ck = e_params
+        inst.optimizeResult = res
+        inst.initial_params = init
+        inst.error = y_prime - np.dot(inst.gl[:2,:], x_prime)
+
+        return inst
+
+    @classmethod
+    def find_32_multi(
+            cls, x, y, view_rotations, scale=None, ninit=10, maxiter=1000,
+            random_state=None):
+        """
+        Finds one 3D rotation that correlates the same 3D (initial) points
+        to several 2D views (final points), such as SEM and FIB images of 
+        the same sample, when the views are related by known rotations.
+
+        View k is modeled as:
+
+          y_k = s_k (r_k q x)_xy + d_k
+
+        where q is the rotation that is found (common for all views), r_k 
+        the known rotation of view k (arg view_rotations), s_k the scale and 
+        d_k the (2D) translation of view k. For example, if the FIB view is 
+        tilted by angle theta around the x axis relative to the SEM view, 
+        the view rotations are np.identity(3) and 
+        make_r_euler([0, theta, 0]).
+
+        All views are fitted together by minimizing the sum of the square 
+        differences of all views (see sq_diff_ck_23()), so less markers are 
+        needed in each view than for separate find_32() runs (the rotation
+        has 3 parameters in total, each view adds a scale and a 2D 
+        translation). Translations are eliminated by using the center of 
+        mass coordinates of each view. The optimization is done like in 
+        find_32_unconstr_ck() (unnormalized quaternion and log scales, 
+        L-BFGS-B) from several initial rotations: the approximate solutions
+        of the views having at least 3 markers (approx_gl2_to_ck3() rotated 
+        back by r_k) and quasi-random rotations (to ninit in total, see
+        make_quasi_random_ck()).
+
+        Arguments:
+          - x: list of initial points coordinates (3 x n_points matrix) for 
+          each view (the points may differ between views)
+          - y: list of final points coordinates (2 x n_points matrix) for 
+          each view
+          - view_rotations: list of view rotation matrices r_k (3 x 3)
+          - scale: None to optimize the scale of each view, a number for a 
+          fixed scale of all views or a list of fixed scales (one per view)
+          - ninit: (min) number of initial rotations
+          - maxiter: maximum number of iterations of one optimization
+          - random_state: None for deterministic quasi-random rotations, 
+          otherwise they are randomized (see make_quasi_random_ck())
+
+        Returns list of transformations (instances of this class), one for 
+        each view, that have the same attributes as the ones returned by 
+        find_32(). In addition, they have attributes:
+          - q_joint: common rotation q
+          - view_rotation: r_k
+          - optimizeResult: result of the best optimization (the same 
+          for all views)
+          - initial_params: initial parameters of the best optimization
+        """
+
+        # parse arguments
+        n_views = len(x)
+        if (len(y) != n_views) or (len(view_rotations) != n_views):
+            raise ValueError(
+                "Arguments x, y and view_rotations need to have the same "
+                + "number of views.")
+        view_rotations = [np.asarray(r_k, dtype=float) 
+                          for r_k in view_rotations]
+        if (scale is None) or np.isscalar(scale):
+            scales = [scale] * n_views
+        else:
+            scales = list(scale)
+        fit_scale = scale is None
+
+        # center of mass moments of each view
+        moments = []
+        for x_k, y_k in zip(x, y):
+            x_cm, y_cm, xxt, yxt, tryy = cls.moments_32(x=x_k, y=y_k)
+            moments.append((xxt, yxt, tryy))
+
+        # rotations and derivatives in the views
+        def make_r_view(r_k):
+            return lambda e: np.dot(r_k, cls.make_r_ck(e))
+        def make_r_deriv_view(r_k):
+            return lambda e: np.einsum(
+                'ij,ujk->uik', r_k, cls.make_r_ck_deriv(e))
+        make_rs = [make_r_view(r_k) for r_k in view_rotations]
+        make_r_derivs = [make_r_deriv_view(r_k) for r_k in view_rotations]
+
+        def to_constr(param):
+            """
+            Converts unconstrained to Cayley-Klein parameters and scales
+            """
+            q_norm = np.sqrt((param[:4]**2).sum())
+            if fit_scale:
+                s = np.exp(param[4:])
+            else:
+                s = scales
+            return param[:4] / q_norm, s, q_norm
+
+        # function to minimize and derivatives
+        def sq_diff(param):
+            e_params, s, q_norm = to_constr(param)
+            return sum(
+                cls.sq_diff_ck_23(
+                    e_params, scale=s_k, xxt=xxt, yxt=yxt, make_r=make_r,
+                    const=tryy)
+                for (xxt, yxt, tryy), s_k, make_r 
+                in zip(moments, s, make_rs))
+
+        def sq_diff_deriv(param):
+            e_params, s, q_norm = to_constr(param)
+            e_derivs = np.zeros(4)
+            s_derivs = []
+            for (xxt, yxt, tryy), s_k, make_r, make_r_deriv in zip(
+                    moments, s, make_rs, make_r_derivs):
+                derivs = cls.sq_diff_ck_23_deriv(
+                    np.hstack((e_params, [s_k])), scale=None, yxt=yxt, 
+                    xxt=xxt, make_r=make_r, make_r_deriv=make_r_deriv)
+                e_derivs += derivs[:4]
+                s_derivs.append(s_k * derivs[4])
+            e_derivs = (
+                e_derivs - np.dot(e_derivs, e_params) * e_params) / q_norm
+            if fit_scale:
+                return np.hstack((e_derivs, s_derivs))
+            else:
+                return e_derivs
+
+        # initial rotations from the views that have enough markers
+        inits = []
+        s_init = []
+        for x_k, y_k, r_k in zip(x, y, view_rotations):
+            if x_k.shape[1] < 3:
+                continue
+            e_k, s_k = cls.approx_gl2_to_ck3(x=x_k, y=y_k, ret='both')
+            s_init.append(s_k)
+            for e_one in e_k:
+                q = np.dot(r_k.transpose(), cls.make_r_ck(e_one))
+                inits.append(cls.extract_ck(q))
+        if len(inits) < ninit:
+            inits.extend(cls.make_quasi_random_ck(
+                size=ninit-len(inits), random_state=random_state))
+        if len(s_init) > 0:
+            s_init = np.mean(s_init)
+        else:
+            s_init = 1.
+
+        # optimize from all initial rotations
+        best = None
+        for e_init in inits:
+            init = np.asarray(e_init, dtype=float)
+            if fit_scale:
+                init = np.hstack((init, np.log([s_init] * n_views)))
+            if not np.isfinite(init).all():
+                continue
+            res = sp.optimize.minimize(
+                sq_diff, init, jac=sq_diff_deriv, method='L-BFGS-B',
+                options={'maxiter' : maxiter})
+            if not (np.isfinite(res.fun) and np.isfinite(res.x).all()):
+                continue
+            if (best is None) or (res.fun < best[0].fun):
+                best = (res, init)
+        if best is None:
+            raise ValueError(
+                "Optimization did not converge to a finite solution from "
+                + "any of the initial rotations")
+        res, init = best
+        e_params, s, q_norm = to_constr(res.x)
+        q = cls.make_r_ck(e_params)
+
+        # make transformations of all views
+        res_transf = []
+        for x_k, y_k, r_k, s_k in zip(x, y, view_rotations, s):
+            q_k = np.dot(r_k, q)
+            inst = cls()
+            inst.q = q_k
+            inst.q_joint = q
+            inst.view_rotation = r_k
+            inst.s_scalar = s_k
+            inst.s = s_k * np.identity(3)
+            inst.gl = s_k * q_k
+            inst.ck = cls.extract_ck(q_k)
+            inst.d = np.hstack((
+                y_k.mean(axis=-1) - s_k * np.dot(q_k[:2,:], x_k.mean(axis=-1)),
+                [0]))
+            inst.y = inst.transform(x=x_k)
+            inst.error = y_k - inst.y[:2,:]
+            inst.optimizeResult = res
+            inst.initial_params = init
+            res_transf.append(inst)
+
+        return res_transf
+
+    @classmethod
+    def moments_32(cls, x, y, weights=None):
+        """
+        Calculates the (weighted) centers of mass of initial (x) and final 
+        (y) points and the matrices the sum of squared differences between
+        y and the transformed x depends on (see sq_diff_ck_23()).
+
+        Weights can be given for each point (arg weights n_points), or 
+        separately for x and y components of each final point (2 x 
+        n_points), for example as inverse variances of the localization 
+        of points. In the latter case the sum of squared differences is:
+
+          E = sum_a sum_i w_ai (y_ai - (s r x_i + d)_a)^2,  a = x, y
+
+        so the center of mass of x and x x^T are different for each axis:
+
+          x_cm_a = sum_i w_ai x_i / sum_i w_ai 
+          (x x^T)_a = sum_i w_ai (x_i - x_cm_a) (x_i - x_cm_a)^T
+
+        Arguments:
+          - x: initial points coordinates (3 x n_points martix)
+          - y: final points coordinates (2 x n_points matrix)
+          - weights: None (all 1), weights of points (n_points) or of 
+          x and y components of final points (2 x n_points)
+
+        Returns (x_cm, y_cm, xxt, yxt, tryy):
+          - x_cm: center of mass of x (3), or for each axis (3 x 2) 
+          - y_cm: center of mass of y (2)
+          - xxt: x x^T (3 x 3), or for each axis (2 x 3 x 3)
+          - yxt: y x^T (2 x 3)
+          - tryy: tr(y^T y)
+        """
+
+        if weights is None:
+            weights = np.ones(x.shape[1])
+        weights = np.asarray(weights, dtype=float)
+
+        if weights.ndim == 1:
+            x_cm = np.dot(x, weights) / weights.sum()
+            y_cm = np.dot(y, weights) / weights.sum()
+            x_prime = x - x_cm.reshape((3,1))
+            y_prime = y - y_cm.reshape((2,1))
+            xxt = np.dot(weights * x_prime, x_prime.transpose())
+            yxt = np.dot(weights * y_prime, x_prime.transpose())
+
+        else:
+            w_sum = weights.sum(axis=1)
+            x_cm = np.dot(x, weights.transpose()) / w_sum
+            y_cm = (weights * y).sum(axis=1) / w_sum
+            x_prime = x[np.newaxis, :, :] - x_cm.transpose()[:, :, np.newaxis]
+            y_prime = y - y_cm.reshape((2,1))
+            xxt = np.einsum('an,ain,ajn->aij', weights, x_prime, x_prime)
+            yxt = np.einsum('an,an,ain->ai', weights, y_prime, x_prime)
+
+        tryy = (weights * y_prime * y_prime).sum()
+
+        return x_cm, y_cm, xxt, yxt, tryy
+
+    @classmethod
+    def _rotate_cm(cls, r, x_cm):
+        """
+        Returns r x_cm (2), where r are the first two rows of a rotation
+        and x_cm is a center of mass (3), or centers of mass for each 
+        axis (3 x 2, see moments_32()).
+        """
+        x_cm = np.asarray(x_cm)
+        if x_cm.ndim == 2 and x_cm.shape[1] == 2:
+            return (r * x_cm.transpose()).sum(axis=1)
+        else:
+            return np.dot(r, x_cm.reshape(3))
+
+    @classmethod
+    def _r_xxt(cls, r, xxt):
+        """
+        Returns r x x^T (2 x 3), where r are the first two rows of a 
+        rotation and x x^T is given once (3 x 3) or for each axis 
+        (2 x 3 x 3, see moments_32()).
+        """
+        if xxt.ndim == 3:
+            return np.einsum('ij,ijk->ik', r, xxt)
+        else:
+            return np.dot(r, xxt)
+
     @classmethod
     def sq_diff_ck_23(cls, param, scale, xxt, yxt, make_r, const):
         """
@@ -686,6 +2201,10 @@ class Rigid3D(Affine):
         using:
 
           E = tr( y^T y + s^2 x x^T r^T r - 2 s x y^T r)
+
+        Arg xxt can also be given separately for each (2D) axis (2 x 3 x 3,
+        see moments_32()), in which case the first term is 
+        s^2 sum_a r_a (x x^T)_a r_a^T, where r_a are rows of r.
         """
         
         # parameters
@@ -700,8 +2219,7 @@ class Rigid3D(Affine):
         r = r_33[:2,:]
        
         # square differences: s^2 tr(x x_t r_t r) - 2 s tr(x y_t r)
-        rtr = np.dot(r.transpose(), r)
-        term_1 = s**2 * (xxt * rtr).sum()
+        term_1 = s**2 * (cls._r_xxt(r=r, xxt=xxt) * r).sum()
         term_2 = -2 * s * (yxt * r).sum()
         res = const + term_1 + term_2
 
@@ -716,6 +2234,8 @@ class Rigid3D(Affine):
 
           dE / de_u = 2 ((r x x^T)_pi - (y x^T)_pi) dr_pi / de_u 
           dE / ds = 2 tr(s x x^T r^T r - x y^T r)
+
+        Arg xxt can also be given for each axis, see sq_diff_ck_23().
         """
 
         # parameters
@@ -730,19 +2250,87 @@ class Rigid3D(Affine):
         dr_de = make_r_deriv(e=e_params)[:,:2,:]
         
         # calculate derivatives by e
-        temp = 2 * s * (s * np.dot(r, xxt) - yxt)
+        rxxt = cls._r_xxt(r=r, xxt=xxt)
+        temp = 2 * s * (s * rxxt - yxt)
         e_derivs = (temp * dr_de).sum(axis=1).sum(axis=1)
         
         # derivative by scale, if needed
         if scale is None:
-            rtr = np.dot(r.transpose(), r)
-            s_deriv = 2 * (s * (xxt * rtr).sum() - (yxt * r).sum())
+            s_deriv = 2 * (s * (rxxt * r).sum() - (yxt * r).sum())
             derivs = np.hstack((e_derivs, [s_deriv]))
         else:
             derivs = e_derivs
 
         return derivs
 
+    @classmethod
+    def sq_diff_ck_23_batch(cls, param, scale, xxt, yxt, const):
+        """
+        Calculates sum of square differences (see sq_diff_ck_23()), its 
+        derivatives (see sq_diff_ck_23_deriv()) and the Gauss-Newton 
+        approximation of its Hessian for multiple sets of Cayley-Klein 
+        (and scale) parameters at once.
+
+        The Gauss-Newton Hessian is 2 J^T J, where J is the derivative of 
+        s r x (first two rows of r) in respect to the parameters:
+
+          (J^T J)_ab = tr(D_a x x^T D_b^T),  D_u = s dr / de_u,  D_s = r
+
+        Arguments:
+          - param: parameters (n_sets x 4, or 5 if arg scale is None)
+          - scale: None if scale is the fifth parameter, otherwise scale
+          - xxt, yxt, const: x x^T, y x^T and tr(y^T y), either the same 
+          for all parameter sets or one for each set (shapes n_sets x 3 x 3,
+          n_sets x 2 x 3 and n_sets); xxt can also be given for each axis 
+          (see sq_diff_ck_23()), it then has shape n_sets (or 1) x 2 x 3 x 3
+
+        Returns (value, derivs, j_t_j):
+          - value: values of the objective function (n_sets)
+          - derivs: derivatives (n_sets x n_params)
+          - j_t_j: J^T J (n_sets x n_params x n_params)
+        """
+
+        # parameters
+        e_params = param[:, :4]
+        if scale is None:
+            s = param[:, 4]
+        else:
+            s = scale * np.ones(param.shape[0])
+
+        # rotations and their derivatives
+        r = cls.make_r_ck(e_params)[:, :2, :]
+        dr_de = cls.make_r_ck_deriv(e_params)[:, :, :2, :]
+        per_axis = (np.ndim(xxt) == 4)
+        if per_axis:
+            xxt = np.broadcast_to(xxt, (param.shape[0], 2, 3, 3))
+            rxxt = np.einsum('nij,nijk->nik', r, xxt)
+        else:
+            xxt = np.broadcast_to(xxt, (param.shape[0], 3, 3))
+            rxxt = np.einsum('nij,njk->nik', r, xxt)
+        
+        # value: const + s^2 tr(x x_t r_t r) - 2 s tr(x y_t r)
+        value = (const + s**2 * (rxxt * r).sum(axis=(1, 2)) 
+                 - 2 * s * (yxt * r).sum(axis=(1, 2)))
+
+        # derivatives of s r
+        if scale is None:
+            d_sr = np.concatenate(
+                (s[:, np.newaxis, np.newaxis, np.newaxis] * dr_de, 
+                 r[:, np.newaxis, :, :]), axis=1)
+        else:
+            d_sr = s[:, np.newaxis, np.newaxis, np.newaxis] * dr_de
+
+        # derivatives of the objective and J^T J
+        diff = s[:, np.newaxis, np.newaxis] * rxxt - yxt
+        derivs = 2 * np.einsum('npij,nij->np', d_sr, diff)
+        if per_axis:
+            d_sr_xxt = np.einsum('npij,nijk->npik', d_sr, xxt)
+        else:
+            d_sr_xxt = np.einsum('npij,njk->npik', d_sr, xxt)
+        j_t_j = np.einsum('npik,nqik->npq', d_sr_xxt, d_sr)
+
+        return value, derivs, j_t_j
+
     @classmethod
     def approx_gl2_to_ck3(cls, x, y, xy_axes='dim_point', ret='both'):
         """
@@ -855,8 +2443,14 @@ class Rigid3D(Affine):
         pg 153, Rotation matrix Wikipedia and with quaterinion-based rotation
         on Quaternion Wikipedia where 
         (q_k, q_i, q_j, q_k) = (e_0, e_1, e_2, e_3).
+
+        Arg e can also contain multiple sets of parameters (shape (..., 4)), 
+        in which case the returned array contains the corresponding 
+        rotation matrices (shape (..., 3, 3)).
         """
 
+        e = np.asarray(e)
+        e = [e[..., 0], e[..., 1], e[..., 2], e[..., 3]]
         r = np.array(
             [[e[0]**2 + e[1]**2 - e[2]**2 - e[3]**2,
               2 * (e[1]*e[2] - e[0]*e[3]), 2 * (e[1]*e[3] + e[0]*e[2])],
@@ -864,6 +2458,8 @@ class Rigid3D(Affine):
               2 * (e[2]*e[3] - e[0]*e[1])],
              [2 * (e[1]*e[3] - e[0]*e[2]), 2 * (e[2]*e[3] + e[0]*e[1]),
               e[0]**2 - e[1]**2 - e[2]**2 + e[3]**2]])
+        if r.ndim > 2:
+            r = np.moveaxis(r, [0, 1], [-2, -1])
 
         return r
 
@@ -875,9 +2471,12 @@ class Rigid3D(Affine):
 
         The returned value is 4x3x3 ndarray, where the first index denotes 
         component of Cayley-Klein parameters in respect to which the 
-        derivatives are taken.
+        derivatives are taken. For multiple sets of parameters (arg e of
+        shape (..., 4)) the shape of the returned array is (..., 4, 3, 3).
         """
 
+        e = np.asarray(e)
+        e = [e[..., 0], e[..., 1], e[..., 2], e[..., 3]]
         dr_de = 2 * np.array(
             # dr / de_0
             [[[e[0], -e[3], e[2]], [e[3], e[0], -e[1]], [-e[2], e[1], e[0]]],
@@ -888,6 +2487,8 @@ class Rigid3D(Affine):
              # dr / dr_3
              [[-e[3], -e[0], e[1]], [e[0], -e[3], e[2]], [e[1], e[2], e[3]]]]
         )
+        if dr_de.ndim > 3:
+            dr_de = np.moveaxis(dr_de, [0, 1, 2], [-3, -2, -1])
         
         return dr_de
 
@@ -910,14 +2511,20 @@ class Rigid3D(Affine):
         form from Goldstein, Classical Mechanics, pg 147 when signs of all 
         angles changed.
         
+        Arg angles can also contain multiple sets of angles (shape (..., 3)),
+        in which case the returned array contains the corresponding 
+        rotation matrices (shape (..., 3, 3)).
+
         Arguments:
           - angles: [phi, theta, psi]
           - mode: Euler angles convention
         """
 
+        angles = np.asarray(angles)
+        phi, theta, psi = angles[..., 0], angles[..., 1], angles[..., 2]
+
         if mode == 'x':
 
-            phi, theta, psi = angles
             r = np.array(
                 [[(np.cos(psi) * np.cos(phi) 
                    - np.cos(theta) * np.sin(phi) * np.sin(psi)),
@@ -935,7 +2542,6 @@ class Rigid3D(Affine):
  
         elif mode == 'test':
 
-            phi, theta, psi = angles
             r = np.array(
                 [[(np.cos(psi) * np.cos(phi) 
                    - np.cos(theta) * np.sin(phi) * np.sin(psi)),
@@ -955,6 +2561,8 @@ class Rigid3D(Affine):
             raise ValueError(
                 "Mode " + mode + "is not defined. Currently implemented is "
                 + " mode 'x'")
+        if r.ndim > 2:
+            r = np.moveaxis(r, [0, 1], [-2, -1])
 
         return r
 
@@ -968,64 +2576,95 @@ class Rigid3D(Affine):
 
         In case theta = 0 (degenerate case) the two calculated cases are
         [phi + psi, 0, 0] and [0, 0, phi + psi].
-        """
-
-        if mode == 'x':
-
-            theta_1 = np.arccos(r[2,2])
-            theta_2 = -theta_1
 
-            if theta_1 != 0:
-
-                psi_1 = np.arctan2(
-                    r[0,2] / np.sin(theta_1), -r[1,2] / np.sin(theta_1))
-                psi_2 = np.arctan2(
-                    r[0,2] / np.sin(-theta_1), -r[1,2] / np.sin(-theta_1))
-
-                phi_1 = np.arctan2(
-                    r[2,0] / np.sin(theta_1), r[2,1] / np.sin(theta_1))
-                phi_2 = np.arctan2(
-                    r[2,0] / np.sin(-theta_1), r[2,1] / np.sin(-theta_1))
-
-            else:
-
-                # degenerate case
-                psi_1 = 0.
-                phi_1 = np.arctan2(-r[0,1], r[0,0])
+        Arg r can also contain multiple rotation matrices (shape 
+        (..., 3, 3)), in which case the returned array has shape (..., 3)
+        (arg ret 'one') or (..., 2, 3) (arg ret 'both').
+        """
 
-                phi_2 = 0.
-                psi_2 = np.arctan2(r[1,0], r[0,0])
+        r = np.asarray(r)
+        # roundoff can put r_33 slightly outside [-1, 1]
+        theta_1 = np.arccos(np.clip(r[..., 2, 2], -1., 1.))
+        theta_2 = -theta_1
+        sin_1 = np.sin(theta_1)
+        sin_2 = np.sin(-theta_1)
+        degenerate = (theta_1 == 0)
+
+        # angles from the third column and the third row
+        with np.errstate(divide='ignore', invalid='ignore'):
+            col_1 = np.arctan2(r[..., 0, 2] / sin_1, -r[..., 1, 2] / sin_1)
+            col_2 = np.arctan2(r[..., 0, 2] / sin_2, -r[..., 1, 2] / sin_2)
+            row_1 = np.arctan2(r[..., 2, 0] / sin_1, r[..., 2, 1] / sin_1)
+            row_2 = np.arctan2(r[..., 2, 0] / sin_2, r[..., 2, 1] / sin_2)
 
+        if mode == 'x':
+            psi_1, psi_2, phi_1, phi_2 = col_1, col_2, row_1, row_2
         elif mode == 'test':
+            phi_1, phi_2, psi_1, psi_2 = col_1, col_2, row_1, row_2
+        else:
+            raise ValueError(
+                "Mode " + mode + "is not defined. Currently implemented is "
+                + " mode 'x'")
 
-            theta_1 = np.arccos(r[2,2])
-            theta_2 = -theta_1
-
-            if theta_1 != 0:
+        # degenerate case
+        psi_1 = np.where(degenerate, 0., psi_1)
+        phi_1 = np.where(
+            degenerate, np.arctan2(-r[..., 0, 1], r[..., 0, 0]), phi_1)
+        phi_2 = np.where(degenerate, 0., phi_2)
+        psi_2 = np.where(
+            degenerate, np.arctan2(r[..., 1, 0], r[..., 0, 0]), psi_2)
 
-                phi_1 = np.arctan2(
-                    r[0,2] / np.sin(theta_1), -r[1,2] / np.sin(theta_1))
-                phi_2 = np.arctan2(
-                    r[0,2] / np.sin(-theta_1), -r[1,2] / np.sin(-theta_1))
+        one_1 = np.stack((phi_1, theta_1, psi_1), axis=-1)
+        if ret == 'one':
+            return one_1
+        elif ret == 'both':
+            one_2 = np.stack((phi_2, theta_2, psi_2), axis=-1)
+            return np.stack((one_1, one_2), axis=-2)
 
-                psi_1 = np.arctan2(
-                    r[2,0] / np.sin(theta_1), r[2,1] / np.sin(theta_1))
-                psi_2 = np.arctan2(
-                    r[2,0] / np.sin(-theta_1), r[2,1] / np.sin(-theta_1))
+    @classmethod
+    def extract_ck(cls, r):
+        """
+        Calculates Cayley-Klein parameters (quaternion) from a rotation 
+        matrix, so that make_r_ck() of the result gives back r.
 
-            else:
+        Unlike going through Euler angles (extract_euler() and 
+        euler_to_ck()), this is numerically stable also for rotations 
+        around (or close to) the z axis. The parameters are computed from 
+        the largest of the four diagonal combinations of r and normalized,
+        the sign is chosen so that e_0 >= 0.
 
-                # degenerate case
-                psi_1 = 0.
-                phi_1 = np.arctan2(-r[0,1], r[0,0])
+        Arg r can also contain multiple rotation matrices (shape 
+        (..., 3, 3)), in which case the returned array has shape (..., 4).
+        """
 
-                phi_2 = 0.
-                psi_2 = np.arctan2(r[1,0], r[0,0])
-
-        if ret == 'one':
-            return np.array([phi_1, theta_1, psi_1])
-        elif ret == 'both':
-            return np.array([[phi_1, theta_1, psi_1], [phi_2, theta_2, psi_2]])
+        r = np.asarray(r, dtype=float)
+        r11, r12, r13 = r[..., 0, 0], r[..., 0, 1], r[..., 0, 2]
+        r21, r22, r23 = r[..., 1, 0], r[..., 1, 1], r[..., 1, 2]
+        r31, r32, r33 = r[..., 2, 0], r[..., 2, 1], r[..., 2, 2]
+
+        # 4 e_k^2 for k = 0, 1, 2, 3 and the candidate vectors 4 e_k e
+        diag = np.stack(
+            (1 + r11 + r22 + r33, 1 + r11 - r22 - r33, 
+             1 - r11 + r22 - r33, 1 - r11 - r22 + r33), axis=-1)
+        candidates = np.stack(
+            (np.stack((diag[..., 0], r32 - r23, r13 - r31, r21 - r12), 
+                      axis=-1),
+             np.stack((r32 - r23, diag[..., 1], r12 + r21, r13 + r31), 
+                      axis=-1),
+             np.stack((r13 - r31, r12 + r21, diag[..., 2], r23 + r32), 
+                      axis=-1),
+             np.stack((r21 - r12, r13 + r31, r23 + r32, diag[..., 3]), 
+                      axis=-1)), 
+            axis=-2)
+
+        # use the best conditioned candidate
+        best = np.asarray(np.argmax(diag, axis=-1))
+        e = np.choose(
+            best[..., np.newaxis], np.moveaxis(candidates, -2, 0))
+        e = e / np.sqrt((e**2).sum(axis=-1))[..., np.newaxis]
+        e = np.where(e[..., 0:1] < 0, -e, e)
+
+        return e
 
     @classmethod
     def euler_to_ck(cls, angles, mode='x'):
@@ -1033,10 +2672,14 @@ class Rigid3D(Affine):
         Converts euler angles to Cayley-Klein parameters.
 
         Currently only for 'x' Euler rotation convention.
+
+        Arg angles can also contain multiple sets of angles (shape (..., 3)),
+        in which case the returned array has shape (..., 4).
         """
 
         # unpack angles
-        fi, theta, psi = angles
+        angles = np.asarray(angles)
+        fi, theta, psi = angles[..., 0], angles[..., 1], angles[..., 2]
 
         if mode == 'x':
 
@@ -1060,12 +2703,15 @@ class Rigid3D(Affine):
             raise ValueError(
                 "Mode " + mode + "is not defined. Currently implemented is "
                 + " mode 'x'")
+        if res.ndim > 1:
+            res = np.moveaxis(res, 0, -1)
 
         return res
         
 
     @classmethod
-    def make_random_ck(cls, center=None, distance=0.1):
+    def make_random_ck(
+            cls, center=None, distance=0.1, size=None, random_state=None):
         """
         Generates and returns Caley-Klein parameters for a random 3D rotation.
 
@@ -1079,36 +2725,157 @@ class Rigid3D(Affine):
         Arg distance is in "Caley-Klein parameter units". It should not be 
         larger than 0.57, while the value of 0.1 corresponds roughly to 15 deg.
 
+        If arg size is specified, size rotations are generated at once. They
+        are the same as the ones generated by size consecutive calls 
+        without arg size.
+
         Arguments:
           - center: (ndarray) 3D rotation parameters in terms of Caley-Klein 
           parameters
           - distance: (float) size (radius) of the neighborhood of center
           (in "Caley-Klein parameter units")
+          - size: number of rotations, None for one rotation
+          - random_state: None (numpy global random state), seed (int) or 
+          np.random.RandomState, see get_random_state()
 
-        Returns Caley-Klein parameters for the generated 3D rotation.
+        Returns Caley-Klein parameters for the generated 3D rotation 
+        (shape 4), or rotations (size x 4).
         """
 
+        random_state = cls.get_random_state(random_state)
+        if size is None:
+            shape = ()
+        else:
+            shape = (size,)
+
         if center is None:
 
             # make random and normalize
-            e_random = np.random.random(4) * 2 - 1
-            e_random = e_random / np.sqrt(np.square(e_random).sum())
+            e_random = random_state.random_sample(shape + (4,)) * 2 - 1
+            e_random = (
+                e_random / np.sqrt(np.square(e_random).sum(axis=-1))[..., None])
 
         else:
             
             # random around initial
-            e_small_123 = (np.random.random(3) * 2. - 1) * distance
-            e_small_0 = np.sqrt(1 - np.square(e_small_123).sum())
-            e_small = np.hstack(([e_small_0], e_small_123))
-            center = np.asarray(center)
-            r_e_random = np.dot(
-                Rigid3D.make_r_ck(center), Rigid3D.make_r_ck(e_small))
-            e_random_euler = Rigid3D.extract_euler(
-                r_e_random, mode='x', ret='one')
-            e_random = Rigid3D.euler_to_ck(e_random_euler, mode='x')
+            e_small_123 = (
+                (random_state.random_sample(shape + (3,)) * 2. - 1) * distance)
+            e_random = cls._perturb_ck(center=center, e_small_123=e_small_123)
 
         return e_random
 
+    @classmethod
+    def make_quasi_random_ck(
+            cls, center=None, distance=0.1, size=1, start=1, 
+            random_state=None):
+        """
+        Generates Caley-Klein parameters for size quasi-random 3D rotations.
+
+        Quasi-random (low discrepancy, Halton sequence in bases 2, 3 and 5) 
+        points cover the space more evenly than random ones, so fewer 
+        initial rotations are needed to start near each local minimum. If 
+        arg center is None, the points are mapped to rotations uniformly
+        distributed on SO(3):
+
+          e = [sqrt(1-u0) sin(2 pi u1), sqrt(1-u0) cos(2 pi u1), 
+               sqrt(u0) sin(2 pi u2), sqrt(u0) cos(2 pi u2)]
+
+        (K. Shoemake, Graphics Gems III, 1992). Otherwise, they fill the 
+        neighborhood of size distance around center, like in 
+        make_random_ck().
+
+        The rotations are deterministic. If arg random_state is given, the 
+        sequence is randomized by a random shift (modulo 1) of all points, 
+        which is drawn from random_state (Cranley-Patterson rotation).
+
+        Arguments:
+          - center, distance: as in make_random_ck()
+          - size: number of rotations
+          - start: index of the first point of the Halton sequence (the 
+          0-th point is 0 in all dimensions)
+          - random_state: None for deterministic rotations, otherwise seed
+          (int) or np.random.RandomState
+
+        Returns Caley-Klein parameters (size x 4).
+        """
+
+        # Halton points in the unit cube
+        u = cls._halton(size=size, start=start)
+        if random_state is not None:
+            shift = cls.get_random_state(random_state).random_sample(3)
+            u = (u + shift) % 1.
+
+        if center is None:
+            angle_1 = 2 * np.pi * u[:, 1]
+            angle_2 = 2 * np.pi * u[:, 2]
+            e_quasi = np.column_stack((
+                np.sqrt(1 - u[:, 0]) * np.sin(angle_1),
+                np.sqrt(1 - u[:, 0]) * np.cos(angle_1),
+                np.sqrt(u[:, 0]) * np.sin(angle_2),
+                np.sqrt(u[:, 0]) * np.cos(angle_2)))
+
+        else:
+            e_quasi = cls._perturb_ck(
+                center=center, e_small_123=(u * 2. - 1) * distance)
+
+        return e_quasi
+
+    @classmethod
+    def _perturb_ck(cls, center, e_small_123):
+        """
+        Returns Caley-Klein parameters of rotations center followed by small
+        rotations given by their (last three) Caley-Klein parameters 
+        e_small_123 (shape (..., 3)).
+        """
+        e_small_0 = np.sqrt(1 - np.square(e_small_123).sum(axis=-1))
+        e_small = np.concatenate(
+            (e_small_0[..., np.newaxis], e_small_123), axis=-1)
+        center = np.asarray(center)
+        r_e_random = np.einsum(
+            'ij,...jk->...ik', Rigid3D.make_r_ck(center), 
+            Rigid3D.make_r_ck(e_small))
+        e_random_euler = Rigid3D.extract_euler(
+            r_e_random, mode='x', ret='one')
+        return Rigid3D.euler_to_ck(e_random_euler, mode='x')
+
+    @classmethod
+    def _halton(cls, size, start=1, bases=(2, 3, 5)):
+        """
+        Returns points start to start+size-1 of the Halton sequence (shape
+        size x len(bases)) in the unit cube.
+        """
+        index = np.arange(start, start + size)
+        res = np.zeros((size, len(bases)))
+        for dim, base in enumerate(bases):
+            rest = index.copy()
+            fraction = 1.
+            while (rest > 0).any():
+                fraction /= base
+                res[:, dim] += fraction * (rest % base)
+                rest //= base
+        return res
+
+    @classmethod
+    def get_random_state(cls, random_state):
+        """
+        Returns np.random.RandomState corresponding to arg random_state:
+          - None: numpy global random state (the same random numbers as
+          the np.random functions)
+          - int: new RandomState seeded by random_state
+          - np.random.RandomState: random_state itself
+        """
+        if random_state is None:
+            return np.random.mtrand._rand
+        elif isinstance(random_state, (int, long, np.integer)):
+            return np.random.RandomState(random_state)
+        elif isinstance(random_state, np.random.RandomState):
+            return random_state
+        else:
+            raise ValueError(
+                "Argument random_state " + str(random_state) + " was not "
+                + "understood. It can be None, int or "
+                + "np.random.RandomState.")
+
     #########################################################
     #
     # Other methods
@@ -1118,7 +2885,9 @@ class Rigid3D(Affine):
         """
         Applies transformation defined by q, s and d to points x. 
 
-        If q, s or d are None the corresponding attributes are used.
+        If q, s or d are None the corresponding attributes are used. If q 
+        is None and this instance has parity matrix (attribute p, see 
+        find()), q p is used instead of q.
 
         If the arg xy_axes is 'point_dim' / 'dim_point', points used in this 
         instance should be specified as n_point x 3 / 3 x n_point 
@@ -1144,6 +2913,8 @@ class Rigid3D(Affine):
             xy_axes = self.xy_axes
         if q is None:
             q = self.q
+            if getattr(self, 'p', None) is not None:
+                q = np.dot(q, self.p)
         if s is None:
             s = self.s_scalar
         if d is None:
@@ -1211,6 +2982,35 @@ class Rigid3D(Affine):
 
         return trans        
 
+    def shift_initial(self, shift):
+        """
+        Returns transformation that transforms initial points shifted by
+        arg shift (x + shift) to the same final points to which this 
+        transformation transforms the unshifted initial points (x). 
+
+        Because a constant shift of the initial points changes only the
+        translation (d_new = d - s q p shift), the new transformation is 
+        obtained directly from this one and there is no need to find
+        it again from the shifted initial points.
+
+        Argument:
+          - shift: (list or ndarray) shift of initial points (1d, length 3)
+
+        Returns new instance of this class, rotation and scale related 
+        attributes are the same as in this instance.
+        """
+
+        shift = np.asarray(shift, dtype='float').reshape(3)
+        if self.d is None:
+            d = np.zeros(3)
+        else:
+            d = self.d
+        new = deepcopy(self)
+        new.d = d - self.transform(
+            x=shift.reshape((3,1)), d=0, xy_axes='dim_point').reshape(3)
+
+        return new
+
 
     #########################################################
     #
@@ -1595,3 +3395,88 @@ class Rigid3D(Affine):
             options={'disp': True, 'maxiter' : maxiter})
 
         return res
+
+
+def _find_32_ck_task(task):
+    """
+    Runs find_32_constr_ck() or find_32_unconstr_ck() for one set of 
+    initial parameters.
+
+    Module level function (and not a method) because it has to be 
+    pickled when run in a process pool.
+
+    Argument:
+      - task: (cls, mode, kwargs) where cls is the (sub)class of Rigid3D,
+      mode is 'constr_ck' or 'unconstr_ck' and kwargs are the keyword 
+      arguments for cls.find_32_constr_ck() or cls.find_32_unconstr_ck()
+    """
+    cls, mode, kwargs = task
+    return getattr(cls, 'find_32_' + mode)(**kwargs)
+
+def _executor_map(func, tasks, executor=None):
+    """
+    Applies func to all tasks sequentially (arg executor None), in a pool
+    of threads ('thread') or processes ('process') of the size of the 
+    number of cpus, or using the map() method of arg executor (a pool is
+    not closed here). 
+
+    Returns list of results in the order of tasks.
+    """
+
+    if executor is None:
+        results = map(func, tasks)
+    elif isinstance(executor, str):
+        if executor == 'thread':
+            pool = ThreadPool(multiprocessing.cpu_count())
+        elif executor == 'process':
+            pool = multiprocessing.Pool(multiprocessing.cpu_count())
+        else:
+            raise ValueError(
+                "Argument executor " + executor + " was not understood."
+                + " Valid options are None, 'thread', 'process' or an "
+                + "object that has map() method.")
+        try:
+            results = pool.map(func, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = executor.map(func, tasks)
+
+    return list(results)
+
+
+def _find_32_ransac_task(task):
+    """
+    Makes RANSAC hypotheses for one subset of points (see 
+    find_32_ransac()) using approx_gl2_to_ck3().
+
+    Argument:
+      - task: (cls, x, y, scale) where cls is the (sub)class of Rigid3D,
+      x and y initial and final coordinates of the subset and scale
+      None or fixed scale
+
+    Returns list of hypotheses (ndarrays containing Cayley-Klein 
+    parameters, scale and x and y translation), empty if the subset
+    is degenerate.
+    """
+    cls, x, y, scale = task
+    x_cm = x.mean(axis=-1)
+    y_cm = y.mean(axis=-1)
+    try:
+        e_params, s = cls.approx_gl2_to_ck3(
+            x=x - x_cm.reshape((3,1)), y=y - y_cm.reshape((2,1)), 
+            xy_axes='dim_point', ret='both')
+    except (np.linalg.LinAlgError, ValueError):
+        return []
+    if scale is not None:
+        s = scale
+
+    hypotheses = []
+    for e in e_params:
+        one = np.hstack((
+            e, [s], y_cm - s * np.dot(cls.make_r_ck(e)[:2,:], x_cm)))
+        if np.isfinite(one).all():
+            hypotheses.append(one)
+
+    return hypotheses
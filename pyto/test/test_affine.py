@@ -73,6 +73,53 @@ class TestAffine(np_test.TestCase):
         desired = numpy.inner(self.x1, af.gl) + af.d
         np_test.assert_almost_equal(self.y1m, desired)
         
+    def testFindBatch(self):
+        """
+        Tests findBatch() and decomposeQRBatch()
+        """
+
+        # same as find() for random 3D sets, one with negative parity
+        numpy.random.seed(5)
+        x = numpy.random.random((6, 5, 3)) * 10
+        gl = numpy.identity(3) + numpy.random.random((6, 3, 3)) - 0.5
+        gl[2] = numpy.dot(gl[2], numpy.diag([1, 1, -1]))
+        y = (numpy.einsum('knj,kij->kni', x, gl)
+             + numpy.random.random((6, 1, 3))
+             + numpy.random.random((6, 5, 3)) * 0.1)
+        for order in ['qpsm', 'psmq', 'usv']:
+            batch = Affine.findBatch(x=x, y=y, order=order)
+            for x_one, y_one, af_batch in zip(x, y, batch):
+                af = Affine.find(x=x_one, y=y_one, order=order)
+                np_test.assert_almost_equal(af_batch.gl, af.gl)
+                np_test.assert_almost_equal(af_batch.d, af.d)
+                np_test.assert_almost_equal(af_batch.error, af.error)
+                np_test.assert_almost_equal(af_batch.rmsError, af.rmsError)
+                np_test.assert_equal(af_batch.rank, af.rank)
+                np_test.assert_almost_equal(af_batch.resids, af.resids)
+                for name in ['q', 'p', 's', 'm', 'u', 'v']:
+                    if getattr(af, name) is None:
+                        continue
+                    np_test.assert_almost_equal(
+                        getattr(af_batch, name), getattr(af, name))
+
+        # xy_axes 'dim_point' and given reference points
+        batch = Affine.findBatch(
+            x=x.transpose((0, 2, 1)), y=y.transpose((0, 2, 1)),
+            xy_axes='dim_point', x_ref=[1, 2, 3], y_ref=y[:, 0])
+        af = Affine.find(
+            x=x[3].transpose(), y=y[3].transpose(), xy_axes='dim_point',
+            x_ref=numpy.array([1, 2, 3]), y_ref=y[3, 0])
+        np_test.assert_almost_equal(batch[3].gl, af.gl)
+        np_test.assert_almost_equal(batch[3].error, af.error)
+
+        # rank deficient set (points on a line)
+        x[1] = numpy.outer(numpy.arange(5), [1, 2, 3])
+        batch = Affine.findBatch(x=x, y=y)
+        af = Affine.find(x=x[1], y=y[1])
+        np_test.assert_equal(batch[1].rank, 1)
+        np_test.assert_almost_equal(batch[1].gl, af.gl)
+        np_test.assert_almost_equal(batch[3].gl, Affine.find(x[3], y[3]).gl)
+
     def testFindTranslation(self):
         """
         Tests findTranslation()
@@ -322,6 +369,45 @@ class TestAffine(np_test.TestCase):
         desired = numpy.inner(self.x1, af.gl) + af.d
         np_test.assert_almost_equal(af.transform(self.x1), desired)
 
+    def testTransformChunked(self):
+        """
+        Tests transformChunked() and getHomogeneous()
+        """
+        af = Affine.find(x=self.x2, y=self.y2m)
+        homo = af.getHomogeneous()
+        np_test.assert_almost_equal(homo[:2, :2], af.gl)
+        np_test.assert_almost_equal(homo[:2, 2], af.d)
+        np_test.assert_almost_equal(homo[2], [0, 0, 1])
+
+        # many points, chunk size not dividing the number of points
+        numpy.random.seed(3)
+        x = numpy.random.random((1001, 2)) * 100
+        desired = af.transform(x)
+        np_test.assert_almost_equal(
+            af.transformChunked(x, chunk_size=100), desired)
+        x_h = numpy.vstack((x.transpose(), numpy.ones(len(x))))
+        np_test.assert_almost_equal(
+            numpy.dot(homo, x_h)[:2], desired.transpose())
+
+        # dim_point
+        np_test.assert_almost_equal(
+            af.transformChunked(
+                x.transpose(), chunk_size=64, xy_axes='dim_point'),
+            desired.transpose())
+
+        # float32 output, out buffer and in place
+        res = af.transformChunked(x, dtype=numpy.float32, chunk_size=333)
+        np_test.assert_equal(res.dtype, numpy.float32)
+        np_test.assert_almost_equal(res, desired, decimal=3)
+        out = numpy.zeros((1001, 2))
+        res = af.transformChunked(x, out=out, chunk_size=100)
+        np_test.assert_equal(res is out, True)
+        np_test.assert_almost_equal(out, desired)
+        x_in = x.transpose().copy()
+        af.transformChunked(
+            x_in, out=x_in, chunk_size=100, xy_axes='dim_point')
+        np_test.assert_almost_equal(x_in, desired.transpose())
+
     def testRemoveMasked(self):
         """
         Tests removeMasked()
@@ -456,6 +456,32 @@ class TestAffine2D(np_test.TestCase):
         np_test.assert_almost_equal(af2mrs.scale, desired_scale)
         np_test.assert_almost_equal(af2mrs.parity, -1)
 
+    def testFindBatch(self):
+        """
+        Tests findBatch()
+        """
+
+        x = numpy.array([self.x1, self.x2, self.x2, self.x3])
+        y = numpy.array([self.y1, self.y2, self.y2m, self.y3])
+        for type_ in ['gl', 'rs']:
+            batch = Affine2D.findBatch(x=x, y=y, type_=type_)
+            for x_one, y_one, af_batch in zip(x, y, batch):
+                af = Affine2D.find(x=x_one, y=y_one, type_=type_)
+                np_test.assert_equal(isinstance(af_batch, Affine2D), True)
+                np_test.assert_almost_equal(af_batch.gl, af.gl)
+                np_test.assert_almost_equal(af_batch.d, af.d)
+                np_test.assert_almost_equal(af_batch.phi, af.phi)
+                np_test.assert_almost_equal(af_batch.scale, af.scale)
+                np_test.assert_almost_equal(af_batch.parity, af.parity)
+                np_test.assert_almost_equal(af_batch.shear, af.shear)
+                np_test.assert_almost_equal(af_batch.rmsError, af.rmsError)
+
+        # exact
+        batch = Affine2D.findBatch(x=x, y=y)
+        np_test.assert_almost_equal(batch[0].phi, self.af1_phi)
+        np_test.assert_almost_equal(batch[0].scale, self.af1_scale)
+        np_test.assert_almost_equal(batch[0].error, numpy.zeros((4, 2)))
+
     def testInverse(self):
         """
         Tests inverse
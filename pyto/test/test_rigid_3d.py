@@ -922,6 +922,554 @@ class TestRigid3D(np_test.TestCase):
         np_test.assert_almost_equal(res.optimizeResult.fun, 0, decimal=3)
         np_test.assert_almost_equal(res.y[:2,:], y[:2,:], decimal=3)
 
+    def test_find_32_executor(self):
+        """
+        Tests find_32() and find_32_constr_ck_multi() with concurrent 
+        execution (arg executor)
+        """
+
+        x = np.array([[3.2, 7.8, 0.3, 4, 5],
+                      [1.3, 3.6, 5.4, 6, 3.8],
+                      [0.1, 0.5, 0.8, 0.2, 0.3]])
+        angles = np.array([-123, 32, 168]) * np.pi / 180
+        scale = 56.
+        d = np.array([3, -4., 5])
+        r = Rigid3D.make_r_euler(angles, mode='x')
+        y = scale * np.dot(r, x) + np.expand_dims(d, 1)
+
+        # same best solution for sequential, thread and process execution
+        results = []
+        for executor in [None, 'thread', 'process']:
+            np.random.seed(12)
+            res = Rigid3D.find_32(
+                x=x, y=y[:2,:], scale=None, use_jac=True, ninit=self.ninit,
+                randome=True, einit='gl2', randoms=True, sinit='gl2', 
+                executor=executor)
+            results.append(res)
+        for res in results:
+            np_test.assert_almost_equal(res.q, r, decimal=3)
+            np_test.assert_almost_equal(res.s_scalar, scale, decimal=3)
+            np_test.assert_almost_equal(res.y[:2,:], y[:2,:], decimal=3)
+            np_test.assert_equal(
+                res.initial_params, results[0].initial_params)
+            np_test.assert_equal(
+                res.optimizeResult.fun, results[0].optimizeResult.fun)
+
+        # all solutions, existing pool
+        x_cm = x - x.mean(axis=-1).reshape((3,1))
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(2)
+        np.random.seed(12)
+        best, all = Rigid3D.find_32_constr_ck_multi(
+            x=x_cm, y=scale * np.dot(r, x_cm)[:2,:], scale=None, cm=False, 
+            use_jac=True, ninit=self.ninit, randome=True, randoms=True, 
+            return_all=True, executor=pool)
+        pool.close()
+        np_test.assert_equal(len(all), self.ninit)
+        np_test.assert_equal(
+            best.optimizeResult.fun, 
+            min(one.optimizeResult.fun for one in all))
+        np_test.assert_almost_equal(best.q, r, decimal=3)
+
+        # wrong executor
+        self.assertRaises(
+            ValueError, Rigid3D.find_32_constr_ck_multi, x=x_cm, 
+            y=np.dot(r, x_cm)[:2,:], executor='cluster')
+
+    def test_find_32_random_state(self):
+        """
+        Tests that find_32() and find_32_ransac() are reproducible with
+        arg random_state
+        """
+
+        np.random.seed(6)
+        x = np.random.random((3, 8)) * 100
+        r = Rigid3D.make_r_euler(np.array([-123, 32, 168]) * np.pi / 180)
+        y = 1.7 * np.dot(r, x)[:2] + np.random.normal(0, 1, (2, 8))
+        y[:, 2] += 40
+        for randome in [True, 'quasi']:
+            res = [Rigid3D.find_32(
+                    x=x, y=y, randome=randome, randoms=True, ninit=4, 
+                    mode='batch_ck', random_state=5) for ind in range(2)]
+            np_test.assert_almost_equal(res[0].gl, res[1].gl)
+            np_test.assert_almost_equal(res[0].initial_params, 
+                                        res[1].initial_params)
+        res = [Rigid3D.find_32_ransac(
+                x=x, y=y, n_hypotheses=20, randome=True, randoms=True, 
+                ninit=4, mode='batch_ck', random_state=5) 
+               for ind in range(2)]
+        np_test.assert_almost_equal(res[0].gl, res[1].gl)
+        np_test.assert_equal(res[0].outliers, [2])
+
+    def test_find_32_ransac(self):
+        """
+        Tests find_32_ransac() and make_32_ck()
+        """
+
+        np.random.seed(1)
+        x = np.random.rand(3, 12) * np.array([[500], [500], [100]])
+        angles = np.array([-123, 32, 168]) * np.pi / 180
+        r = Rigid3D.make_r_euler(angles, mode='x')
+        scale = 1.7
+        d = np.array([[300.], [-40.]])
+        y = scale * np.dot(r, x)[:2,:] + d
+
+        # exact, no outliers
+        res = Rigid3D.find_32_ransac(
+            x=x, y=y, randome=True, einit='gl2', randoms=True, sinit='gl2')
+        np_test.assert_equal(res.inliers.all(), True)
+        np_test.assert_equal(len(res.outliers), 0)
+        np_test.assert_almost_equal(res.q, r, decimal=4)
+
+        # two outliers, for all losses and executors
+        y_out = y.copy()
+        y_out[:,3] += [40, -25]
+        y_out[:,8] += [0, 15]
+        for loss in [None, 'huber', 'tukey']:
+            for executor in [None, 'thread']:
+                res = Rigid3D.find_32_ransac(
+                    x=x, y=y_out, loss=loss, executor=executor, randome=True,
+                    einit='gl2', randoms=True, sinit='gl2')
+                np_test.assert_equal(res.outliers, [3, 8])
+                np_test.assert_equal(res.inliers.sum(), 10)
+                if loss == 'huber':
+
+                    # outliers have small but non-zero weights
+                    np_test.assert_almost_equal(res.q, r, decimal=2)
+                    np_test.assert_equal((res.weights[[3, 8]] > 0).all(), True)
+                    np_test.assert_equal(
+                        (res.weights[[3, 8]] < 0.1).all(), True)
+                    continue
+                np_test.assert_almost_equal(res.q, r, decimal=4)
+                np_test.assert_almost_equal(res.s_scalar, scale, decimal=4)
+                np_test.assert_almost_equal(res.d[:2], d[:,0], decimal=2)
+                np_test.assert_almost_equal(res.rmsError, 0, decimal=3)
+                if loss == 'tukey':
+                    np_test.assert_equal(res.weights[[3, 8]], [0, 0])
+
+        # exact, few points, default find_32() arguments
+        for n_points in [6, 12]:
+            res = Rigid3D.find_32_ransac(
+                x=x[:, :n_points], y=y[:, :n_points], random_state=3)
+            np_test.assert_almost_equal(res.s_scalar, scale, decimal=4)
+            np_test.assert_almost_equal(res.rmsError, 0, decimal=3)
+            np_test.assert_equal(len(res.outliers), 0)
+
+        # inliers are the points fitted, also if refinement runs out 
+        res = Rigid3D.find_32_ransac(
+            x=x, y=y_out, max_refine=0, randome=True, einit='gl2')
+        np_test.assert_equal(res.error.shape, (2, res.inliers.sum()))
+        np_test.assert_equal(res.outliers, np.flatnonzero(~res.inliers))
+
+        # weights from the final residuals
+        res = Rigid3D.find_32_ransac(
+            x=x, y=y_out, loss='huber', loss_param=2., randome=True, 
+            einit='gl2')
+        res_all = np.sqrt(((res.transform(x=x)[:2] - y_out)**2).sum(axis=0))
+        np_test.assert_almost_equal(
+            res.weights, np.where(res_all <= 2., 1., 2. / res_all))
+
+        # fixed threshold, fixed scale
+        y_noise = y + 0.5 * np.random.randn(2, 12)
+        y_noise[:,5] += [3, 4]
+        res = Rigid3D.find_32_ransac(
+            x=x, y=y_noise, scale=scale, threshold=2.5, randome=True,
+            einit='gl2')
+        np_test.assert_equal(res.outliers, [5])
+        np_test.assert_equal(res.threshold, 2.5)
+        np_test.assert_equal(res.s_scalar, scale)
+
+        # wrong loss
+        self.assertRaises(
+            ValueError, Rigid3D.find_32_ransac, x=x, y=y_out, loss='cauchy')
+
+        # make_32_ck
+        e = Rigid3D.euler_to_ck(angles, mode='x')
+        res = Rigid3D.make_32_ck(e_params=e, s=scale, x=x, y=y)
+        np_test.assert_almost_equal(res.q, r)
+        np_test.assert_almost_equal(res.d, [300, -40, 0])
+        np_test.assert_almost_equal(res.error, 0)
+
+    def test_find_32_weighted(self):
+        """
+        Tests moments_32() and find_32() with weights
+        """
+
+        np.random.seed(2)
+        x = np.random.rand(3, 8) * np.array([[500], [500], [100]])
+        angles = np.array([-123, 32, 168]) * np.pi / 180
+        r = Rigid3D.make_r_euler(angles, mode='x')
+        scale = 1.7
+        d = np.array([300., -40.])
+        y = scale * np.dot(r, x)[:2,:] + d[:, np.newaxis]
+
+        # moments: no weights, integer weights same as repeated points
+        x_cm, y_cm, xxt, yxt, tryy = Rigid3D.moments_32(x=x, y=y)
+        x_prime = x - x.mean(axis=-1).reshape((3,1))
+        y_prime = y - y.mean(axis=-1).reshape((2,1))
+        np_test.assert_almost_equal(x_cm, x.mean(axis=-1))
+        np_test.assert_almost_equal(xxt, np.dot(x_prime, x_prime.T))
+        np_test.assert_almost_equal(yxt, np.dot(y_prime, x_prime.T))
+        np_test.assert_almost_equal(tryy, (y_prime**2).sum())
+        weights = np.array([1, 2, 1, 1, 3, 1, 1, 1.])
+        repeat = [0, 1, 1, 2, 3, 4, 4, 4, 5, 6, 7]
+        desired = Rigid3D.moments_32(x=x[:, repeat], y=y[:, repeat])
+        for actual, des in zip(
+                Rigid3D.moments_32(x=x, y=y, weights=weights), desired):
+            np_test.assert_almost_equal(actual, des)
+
+        # moments for each axis
+        weights_2 = np.vstack((weights, weights[::-1]))
+        x_cm, y_cm, xxt, yxt, tryy = Rigid3D.moments_32(
+            x=x, y=y, weights=weights_2)
+        np_test.assert_equal(x_cm.shape, (3, 2))
+        np_test.assert_equal(xxt.shape, (2, 3, 3))
+        for axis, w in enumerate(weights_2):
+            desired = Rigid3D.moments_32(x=x, y=y, weights=w)
+            np_test.assert_almost_equal(x_cm[:, axis], desired[0])
+            np_test.assert_almost_equal(y_cm[axis], desired[1][axis])
+            np_test.assert_almost_equal(xxt[axis], desired[2])
+            np_test.assert_almost_equal(yxt[axis], desired[3][axis])
+
+        # objective and derivatives for each axis
+        y_noise = y + np.random.randn(2, 8)
+        x_cm, y_cm, xxt, yxt, tryy = Rigid3D.moments_32(
+            x=x, y=y_noise, weights=weights_2)
+        param = np.hstack((Rigid3D.euler_to_ck(angles + 0.1, mode='x'), [2.]))
+        r_2 = Rigid3D.make_r_ck(param[:4])[:2,:]
+        trans = y_cm - param[4] * (r_2 * x_cm.T).sum(axis=1)
+        desired = (weights_2 * (
+            y_noise - param[4] * np.dot(r_2, x) - trans[:, np.newaxis])**2
+                   ).sum()
+        value = Rigid3D.sq_diff_ck_23(
+            param=param, scale=None, xxt=xxt, yxt=yxt,
+            make_r=Rigid3D.make_r_ck, const=tryy)
+        np_test.assert_almost_equal(value, desired, decimal=6)
+        deriv = Rigid3D.sq_diff_ck_23_deriv(
+            param=param, scale=None, xxt=xxt, yxt=yxt,
+            make_r=Rigid3D.make_r_ck, make_r_deriv=Rigid3D.make_r_ck_deriv)
+        for ind in range(5):
+            delta = np.zeros(5)
+            delta[ind] = 1e-6
+            num_deriv = (
+                Rigid3D.sq_diff_ck_23(
+                    param=param+delta, scale=None, xxt=xxt, yxt=yxt,
+                    make_r=Rigid3D.make_r_ck, const=tryy)
+                - Rigid3D.sq_diff_ck_23(
+                    param=param-delta, scale=None, xxt=xxt, yxt=yxt,
+                    make_r=Rigid3D.make_r_ck, const=tryy)) / 2e-6
+            np_test.assert_almost_equal(
+                deriv[ind] / desired, num_deriv / desired, decimal=5)
+        batch = Rigid3D.sq_diff_ck_23_batch(
+            param=param[np.newaxis], scale=None, xxt=xxt[np.newaxis],
+            yxt=yxt, const=tryy)
+        np_test.assert_almost_equal(batch[0][0] / desired, 1)
+        np_test.assert_almost_equal(batch[1][0] / desired, deriv / desired)
+
+        # badly localized x coordinate of one point gets small weight
+        y_bad = y.copy()
+        y_bad[0, 3] += 30
+        weights_bad = np.ones((2, 8))
+        weights_bad[0, 3] = 1e-8
+        for mode in ['constr_ck', 'unconstr_ck', 'batch_ck']:
+            np.random.seed(3)
+            res = Rigid3D.find_32(
+                x=x, y=y_bad, mode=mode, weights=weights_bad, randome=True,
+                einit='gl2', randoms=True, sinit='gl2')
+            np_test.assert_almost_equal(res.q, r, decimal=5)
+            np_test.assert_almost_equal(res.s_scalar, scale, decimal=5)
+            np_test.assert_almost_equal(res.d[:2], d, decimal=3)
+            np_test.assert_almost_equal(res.error[1], 0, decimal=3)
+            np_test.assert_almost_equal(res.error[0, 3], 30, decimal=3)
+
+        # same for a point (one weight per point)
+        y_bad[1, 3] -= 20
+        res = Rigid3D.find_32(
+            x=x, y=y_bad, weights=weights_bad[0], randome=True,
+            einit='gl2', randoms=True, sinit='gl2')
+        np_test.assert_almost_equal(res.q, r, decimal=5)
+        np_test.assert_almost_equal(res.d[:2], d, decimal=3)
+
+        # unweighted is affected
+        res = Rigid3D.find_32(
+            x=x, y=y_bad, randome=True, einit='gl2', randoms=True,
+            sinit='gl2')
+        np_test.assert_equal(np.abs(res.d[:2] - d).max() > 0.1, True)
+
+    def test_find_32_unconstr_ck(self):
+        """
+        Tests find_32_unconstr_ck() and find_32() with mode 'unconstr_ck'
+        """
+
+        # coord system-like points
+        x_cs = np.array([[0., 1, 0, 0],
+                         [0, 0, 2, 0],
+                         [0, 0, 0, 3]])
+
+        # identity
+        res = Rigid3D.find_32_unconstr_ck(
+            x=x_cs, y=x_cs[:2,:], scale=None, cm=False, use_jac=False)
+        np_test.assert_almost_equal(res.gl, np.identity(3), decimal=3)
+        np_test.assert_almost_equal(res.y, x_cs, decimal=3)
+        np_test.assert_almost_equal(res.s_scalar, 1, decimal=3)
+        np_test.assert_almost_equal(res.optimizeResult.fun, 0, decimal=3)
+
+        # pi/2 rotation around z axis
+        y = np.array([[0., 0, -2, 0],
+                      [0, 1, 0, 0],
+                      [0, 0, 0, 3]])
+        r_desired = np.array([[0., -1, 0], [1, 0, 0], [0, 0, 1]])
+        res = Rigid3D.find_32_unconstr_ck(
+            x=x_cs, y=y[:2,:], scale=None, cm=False, use_jac=True)
+        np_test.assert_almost_equal(np.dot(res.gl, x_cs), y, decimal=3)
+        np_test.assert_almost_equal(res.q, r_desired, decimal=3)
+        np_test.assert_almost_equal(res.s_scalar, 1, decimal=3)
+
+        # 8 pi/9 rotation around x axis, scale
+        r = Rigid3D.make_r_euler([8 * np.pi/9, 0, 0])
+        scale = 12.3
+        y = scale * np.dot(r, x_cs)
+        res = Rigid3D.find_32_unconstr_ck(
+            x=x_cs, y=y[:2,:], scale=None, cm=False, use_jac=True)
+        np_test.assert_almost_equal(res.y[2,:], y[2,:], decimal=3)
+        np_test.assert_almost_equal(res.q, r, decimal=3)
+        np_test.assert_almost_equal(res.s_scalar, scale, decimal=3)
+        np_test.assert_almost_equal(res.ck, Rigid3D.euler_to_ck(
+            [8 * np.pi/9, 0, 0]) * np.sign(res.ck[0]), decimal=3)
+
+        # same, fixed scale, non-normalized initial 
+        res = Rigid3D.find_32_unconstr_ck(
+            x=x_cs, y=y[:2,:], scale=scale, cm=False, use_jac=True,
+            init=[2., 0, 0, 0])
+        np_test.assert_almost_equal(res.q, r, decimal=3)
+        np_test.assert_equal(res.s_scalar, scale)
+        np_test.assert_almost_equal((res.ck**2).sum(), 1)
+
+        # find_32
+        x = np.array([[3.2, 7.8, 0.3, 4, 5],
+                      [1.3, 3.6, 5.4, 6, 3.8],
+                      [0.1, 0.5, 0.8, 0.2, 0.3]])
+        angles = np.array([-123, 32, 168]) * np.pi / 180
+        scale = 56.
+        d = np.array([3, -4., 5])
+        r = Rigid3D.make_r_euler(angles, mode='x')
+        y = scale * np.dot(r, x) + np.expand_dims(d, 1)
+        np.random.seed(12)
+        res = Rigid3D.find_32(
+            x=x, y=y[:2,:], scale=None, mode='unconstr_ck', ninit=self.ninit,
+            randome=True, einit='gl2', randoms=True, sinit='gl2')
+        np_test.assert_almost_equal(res.q, r, decimal=3)
+        np_test.assert_almost_equal(res.s_scalar, scale, decimal=3)
+        np_test.assert_almost_equal(res.y[:2,:], y[:2,:], decimal=3)
+
+    def test_find_32_multi(self):
+        """
+        Tests find_32_multi()
+        """
+
+        # SEM and FIB views (FIB tilted by 52 deg around x)
+        np.random.seed(12)
+        q = Rigid3D.make_r_euler(np.array([-123, 32, 168]) * np.pi / 180)
+        view_rotations = [
+            np.identity(3),
+            Rigid3D.make_r_euler(np.array([0, 52, 0]) * np.pi / 180)]
+        x = [np.random.random((3, 4)) * 100, np.random.random((3, 3)) * 100]
+        scales = [1.7, 2.3]
+        d = [np.array([[300.], [-40]]), np.array([[10.], [20]])]
+        y = [s_k * np.dot(np.dot(r_k, q), x_k)[:2] + d_k
+             for x_k, r_k, s_k, d_k in zip(x, view_rotations, scales, d)]
+
+        # exact
+        transfs = Rigid3D.find_32_multi(
+            x=x, y=y, view_rotations=view_rotations)
+        for transf, x_k, y_k, r_k, s_k, d_k in zip(
+                transfs, x, y, view_rotations, scales, d):
+            np_test.assert_almost_equal(transf.q_joint, q, decimal=5)
+            np_test.assert_almost_equal(transf.q, np.dot(r_k, q), decimal=5)
+            np_test.assert_almost_equal(transf.s_scalar, s_k, decimal=5)
+            np_test.assert_almost_equal(transf.d[:2], d_k[:, 0], decimal=3)
+            np_test.assert_almost_equal(transf.error, 0, decimal=3)
+            np_test.assert_almost_equal(
+                transf.transform(x=x_k)[:2], y_k, decimal=3)
+
+        # only two markers in the second view, fixed scales
+        x[1] = x[1][:, :2]
+        y[1] = y[1][:, :2]
+        transfs = Rigid3D.find_32_multi(
+            x=x, y=y, view_rotations=view_rotations, scale=scales)
+        np_test.assert_almost_equal(transfs[1].q_joint, q, decimal=5)
+        np_test.assert_almost_equal(transfs[1].s_scalar, 2.3)
+
+        # identity SEM view and untilted sample (r_33 = 1 up to roundoff)
+        for seed in range(10):
+            rs = np.random.RandomState(seed)
+            q_z = Rigid3D.make_r_euler([rs.rand() * 2 * np.pi, 0, 0])
+            x_z = [rs.random_sample((3, 5)) * 100 for r_k in view_rotations]
+            y_z = [np.dot(np.dot(r_k, q_z), x_k)[:2]
+                   for x_k, r_k in zip(x_z, view_rotations)]
+            transfs = Rigid3D.find_32_multi(
+                x=x_z, y=y_z, view_rotations=view_rotations, 
+                random_state=seed)
+            for transf in transfs:
+                np_test.assert_equal(np.isfinite(transf.ck).all(), True)
+                np_test.assert_almost_equal(
+                    Rigid3D.make_r_ck(transf.ck), transf.q)
+            np_test.assert_almost_equal(transfs[0].q_joint, q_z, decimal=5)
+
+        # wrong number of views
+        self.assertRaises(
+            ValueError, Rigid3D.find_32_multi, x=x, y=y[:1],
+            view_rotations=view_rotations)
+
+    def test_find_32_global(self):
+        """
+        Tests find_32_global() and find_32() with mode 'global'
+        """
+
+        np.random.seed(3)
+        q = Rigid3D.make_r_euler(np.array([-123, 32, 168]) * np.pi / 180)
+        x = np.random.random((3, 6)) * 100
+        y = 1.7 * np.dot(q, x)[:2] + np.array([[300.], [-40]])
+
+        # exact
+        transf = Rigid3D.find_32_global(x=x, y=y)
+        np_test.assert_almost_equal(transf.q, q, decimal=5)
+        np_test.assert_almost_equal(transf.s_scalar, 1.7, decimal=5)
+        np_test.assert_almost_equal(transf.d[:2], [300, -40], decimal=3)
+        np_test.assert_almost_equal(transf.error, 0, decimal=3)
+        np_test.assert_equal(transf.certificate.certified, True)
+
+        # noisy, compare with find_32() and with objective on random 
+        # rotations
+        y_noise = y + np.random.normal(0, 2, y.shape)
+        transf = Rigid3D.find_32(x=x, y=y_noise, mode='global')
+        cert = transf.certificate
+        np_test.assert_equal(cert.certified, True)
+        np_test.assert_equal(cert.gap <= cert.tol, True)
+        np_test.assert_equal(cert.n_cells > 4 * 6**3, True)
+        np_test.assert_equal(len(cert.alternatives_fun), 0)
+        np_test.assert_almost_equal(
+            (transf.error**2).sum(), transf.optimizeResult.fun)
+        transf_32 = Rigid3D.find_32(
+            x=x, y=y_noise, einit='gl2', randome='quasi', ninit=10)
+        np_test.assert_equal(
+            transf.optimizeResult.fun <= (transf_32.error**2).sum() + 1e-6,
+            True)
+        x_cm, y_cm, xxt, yxt, tryy = Rigid3D.moments_32(x=x, y=y_noise)
+        r = Rigid3D.make_r_ck(
+            Rigid3D.make_random_ck(size=2000, random_state=4))[:, :2, :]
+        a = np.einsum('nij,jk,nik->n', r, xxt, r)
+        b = (yxt * r).sum(axis=(1, 2))
+        sq_diff = tryy - np.maximum(b, 0)**2 / a
+        np_test.assert_equal(
+            (sq_diff >= cert.lower_bound).all(), True)
+
+        # fixed scale
+        transf = Rigid3D.find_32_global(x=x, y=y_noise, scale=1.7)
+        np_test.assert_almost_equal(transf.s_scalar, 1.7)
+        np_test.assert_equal(transf.certificate.certified, True)
+        np_test.assert_almost_equal(transf.q, q, decimal=1)
+
+        # initial points on a plane, mirrored rotation is alternative
+        x[2] = 0
+        y = 1.7 * np.dot(q, x)[:2] + np.array([[300.], [-40]])
+        transf = Rigid3D.find_32_global(x=x, y=y)
+        cert = transf.certificate
+        np_test.assert_equal(cert.certified, True)
+        np_test.assert_equal(len(cert.alternatives_fun), 1)
+        np_test.assert_almost_equal(cert.alternatives_fun[0], 0, decimal=6)
+        np_test.assert_equal(cert.alternatives_angle[0] > 0.1, True)
+        mirror = Rigid3D.make_r_ck(cert.alternatives[0, :4])
+        np_test.assert_almost_equal(
+            cert.alternatives[0, 4] * np.dot(mirror, x)[:2], 
+            transf.s_scalar * np.dot(transf.q, x)[:2], decimal=3)
+
+        # too few cells to certify
+        transf = Rigid3D.find_32_global(x=x, y=y_noise, max_cells=1000)
+        np_test.assert_equal(transf.certificate.certified, False)
+        np_test.assert_equal(transf.certificate.gap > 0, True)
+
+    def test_find_32_batch_ck(self):
+        """
+        Tests find_32_batch_ck() and find_32() with mode 'batch_ck'
+        """
+
+        x = np.array([[3.2, 7.8, 0.3, 4, 5],
+                      [1.3, 3.6, 5.4, 6, 3.8],
+                      [0.1, 0.5, 0.8, 0.2, 0.3]])
+        x_cm = x - x.mean(axis=-1).reshape((3,1))
+        angles = np.array([-123, 32, 168]) * np.pi / 180
+        scale = 56.
+        r = Rigid3D.make_r_euler(angles, mode='x')
+        y_cm = scale * np.dot(r, x_cm)
+
+        # same as find_32_constr_ck() for the same initial params
+        np.random.seed(5)
+        inits = Rigid3D.make_init_ck_multi(
+            ninit=self.ninit, randome=True, randoms=True)
+        best, landscape = Rigid3D.find_32_batch_ck(
+            x=x_cm, y=y_cm[:2,:], inits=inits, return_all=True)
+        np_test.assert_almost_equal(best.q, r, decimal=5)
+        np_test.assert_almost_equal(best.s_scalar, scale, decimal=5)
+        np_test.assert_almost_equal(best.y, y_cm, decimal=3)
+        np_test.assert_almost_equal(best.optimizeResult.fun, 0, decimal=3)
+        np_test.assert_equal(landscape.x.shape, (self.ninit, 5))
+        np_test.assert_equal(landscape.fun.shape, (self.ninit,))
+        np_test.assert_equal(landscape.init, inits)
+        np_test.assert_equal(best.optimizeResult.fun, landscape.fun.min())
+        np_test.assert_equal((landscape.x[:,0] >= 0).all(), True)
+        best_constr = Rigid3D.find_32_constr_ck_inits(
+            x=x_cm, y=y_cm[:2,:], inits=inits)[0]
+        np_test.assert_almost_equal(
+            best.optimizeResult.fun, best_constr.optimizeResult.fun, 
+            decimal=3)
+
+        # all converged solutions are local minima (tangent gradient 0)
+        np_test.assert_equal(landscape.success.any(), True)
+        xxt = np.dot(x_cm, x_cm.transpose())
+        yxt = np.dot(y_cm[:2,:], x_cm.transpose())
+        for one_x, one_success in zip(landscape.x, landscape.success):
+            if not one_success: continue
+            deriv = Rigid3D.sq_diff_ck_23_deriv(
+                param=one_x, scale=None, yxt=yxt, xxt=xxt, 
+                make_r=Rigid3D.make_r_ck, 
+                make_r_deriv=Rigid3D.make_r_ck_deriv)
+            deriv[:4] -= np.dot(deriv[:4], one_x[:4]) * one_x[:4]
+            np_test.assert_almost_equal(deriv / (scale**2), 0, decimal=3)
+
+        # fixed scale
+        best = Rigid3D.find_32_batch_ck(
+            x=x_cm, y=y_cm[:2,:], inits=[[1., 0, 0, 0], [0, 1., 0, 0]], 
+            scale=scale)
+        np_test.assert_almost_equal(best.q, r, decimal=5)
+        np_test.assert_equal(best.s_scalar, scale)
+
+        # separate moments for each initial parameter set
+        scale_2 = 12.
+        y_cm_2 = scale_2 * np.dot(r, x_cm)
+        xxt_2 = np.array([xxt, xxt])
+        yxt_2 = np.array([yxt, np.dot(y_cm_2[:2,:], x_cm.transpose())])
+        tryy_2 = np.array([(y_cm[:2,:]**2).sum(), (y_cm_2[:2,:]**2).sum()])
+        init = np.hstack((best.ck, [30.]))
+        landscape = Rigid3D.find_32_batch_ck_moments(
+            xxt=xxt_2, yxt=yxt_2, tryy=tryy_2, inits=[init, init])
+        np_test.assert_almost_equal(landscape.x[:,4], [scale, scale_2])
+        np_test.assert_almost_equal(
+            landscape.x[:,:4], [best.ck, best.ck], decimal=5)
+
+        # find_32
+        d = np.array([3, -4., 5])
+        y = scale * np.dot(r, x) + np.expand_dims(d, 1)
+        np.random.seed(12)
+        res = Rigid3D.find_32(
+            x=x, y=y[:2,:], scale=None, mode='batch_ck', ninit=100,
+            randome=True, einit='gl2', randoms=True, sinit='gl2')
+        np_test.assert_almost_equal(res.q, r, decimal=5)
+        np_test.assert_almost_equal(res.s_scalar, scale, decimal=5)
+        np_test.assert_almost_equal(res.y[:2,:], y[:2,:], decimal=3)
+        self.assertRaises(
+            ValueError, Rigid3D.find_32, x=x, y=y[:2,:], mode='batch')
+
     def test_approx_gl2_to_ck3(self):
         """
         Test approx_gl2_to_ck3()
@@ -1047,6 +1595,20 @@ class TestRigid3D(np_test.TestCase):
         np_test.assert_almost_equal(res, np.identity(3))
         np_test.assert_almost_equal(res, np.identity(3))
 
+        # multiple parameter sets
+        e = np.array([[0.2, 0.4, 0.3, np.sqrt(0.71)],
+                      [0.5, -0.4, -0.6, -np.sqrt(0.23)],
+                      [1., 0, 0, 0]])
+        res = Rigid3D.make_r_ck(e)
+        np_test.assert_equal(res.shape, (3, 3, 3))
+        for ind in range(3):
+            np_test.assert_almost_equal(res[ind], Rigid3D.make_r_ck(e[ind]))
+        res = Rigid3D.make_r_ck_deriv(e)
+        np_test.assert_equal(res.shape, (3, 4, 3, 3))
+        for ind in range(3):
+            np_test.assert_almost_equal(
+                res[ind], Rigid3D.make_r_ck_deriv(e[ind]))
+
     def test_make_r_euler(self):
         """
         Tests make_r_euler()
@@ -1062,6 +1624,17 @@ class TestRigid3D(np_test.TestCase):
                      Rigid3D.make_r_euler([-2.8, -1.2, 0.5]))
         np_test.assert_almost_equal(res, np.identity(3))
 
+        # multiple angle sets
+        angles = np.array([[1., 2, 3], [-0.5, 1.2, 2.8], [0, 0, 0]])
+        for mode in ['x', 'test']:
+            res = Rigid3D.make_r_euler(angles, mode=mode)
+            np_test.assert_equal(res.shape, (3, 3, 3))
+            for ind in range(3):
+                np_test.assert_almost_equal(
+                    res[ind], Rigid3D.make_r_euler(angles[ind], mode=mode))
+        res = Rigid3D.make_r_euler(angles.reshape((3, 1, 3)))
+        np_test.assert_equal(res.shape, (3, 1, 3, 3))
+
     def test_extract_euler(self):
         """
         Tests extract_euler()
@@ -1085,6 +1658,51 @@ class TestRigid3D(np_test.TestCase):
         np_test.assert_almost_equal(res[0], [1.1, 0, 0])
         np_test.assert_almost_equal(res[1], [0, 0, 1.1])
 
+        # multiple rotations, including a degenerate one
+        angles = np.array([[1.5, 0.7, -0.4], [1.5, 0., -0.4], [-2, 2.5, 1]])
+        r = Rigid3D.make_r_euler(angles)
+        for mode in ['x', 'test']:
+            for ret in ['one', 'both']:
+                res = Rigid3D.extract_euler(r, mode=mode, ret=ret)
+                for ind in range(3):
+                    np_test.assert_almost_equal(
+                        res[ind], 
+                        Rigid3D.extract_euler(r[ind], mode=mode, ret=ret))
+        np_test.assert_equal(
+            Rigid3D.extract_euler(r, ret='both').shape, (3, 2, 3))
+        np_test.assert_almost_equal(
+            Rigid3D.make_r_euler(Rigid3D.extract_euler(r)), r)
+
+        # roundoff above 1
+        r = np.identity(3)
+        r[2, 2] = 1 + 1e-15
+        np_test.assert_equal(
+            np.isfinite(Rigid3D.extract_euler(r, ret='both')).all(), True)
+
+    def test_extract_ck(self):
+        """
+        Tests extract_ck()
+        """
+
+        # identity, z and x axis rotations, rotation by pi
+        np_test.assert_almost_equal(
+            Rigid3D.extract_ck(np.identity(3)), [1, 0, 0, 0])
+        r = Rigid3D.make_r_euler([0.3, 0, 0])
+        np_test.assert_almost_equal(
+            Rigid3D.extract_ck(r), [np.cos(0.15), 0, 0, np.sin(0.15)])
+        r = Rigid3D.make_r_euler([0, np.pi, 0])
+        np_test.assert_almost_equal(Rigid3D.make_r_ck(Rigid3D.extract_ck(r)), r)
+
+        # random rotations, multiple at once
+        e = Rigid3D.make_random_ck(size=20, random_state=3)
+        r = Rigid3D.make_r_ck(e)
+        res = Rigid3D.extract_ck(r)
+        np_test.assert_equal(res.shape, (20, 4))
+        np_test.assert_almost_equal(Rigid3D.make_r_ck(res), r)
+        np_test.assert_almost_equal(np.abs((res * e).sum(axis=-1)), 1)
+        np_test.assert_equal((res[:, 0] >= 0).all(), True)
+        np_test.assert_almost_equal(res[4], Rigid3D.extract_ck(r[4]))
+
     def test_euler_to_ck(self):
         """
         Tests euler_to_ck(). 
@@ -1098,6 +1716,18 @@ class TestRigid3D(np_test.TestCase):
         r_ck = Rigid3D.make_r_ck(e)
         np_test.assert_almost_equal(r_ck, r_euler)
 
+        # multiple angle sets
+        angles = np.array([[-0.5, 1.2, 2.3], [1., -2, 0.3]])
+        for mode in ['x', 'test']:
+            e = Rigid3D.euler_to_ck(angles, mode=mode)
+            np_test.assert_equal(e.shape, (2, 4))
+            for ind in range(2):
+                np_test.assert_almost_equal(
+                    e[ind], Rigid3D.euler_to_ck(angles[ind], mode=mode))
+        np_test.assert_almost_equal(
+            Rigid3D.make_r_ck(Rigid3D.euler_to_ck(angles)), 
+            Rigid3D.make_r_euler(angles))
+
     def test_make_random_ck(self):
         """
         Tests make_random_ck()
@@ -1131,6 +1761,89 @@ class TestRigid3D(np_test.TestCase):
             np_test.assert_almost_equal(np.square(rt_res).sum(), 1)
             np_test.assert_almost_equal((rt_res[1:] <= distance).all(), True)
 
+        # multiple rotations at once, same as one by one
+        for center in [None, [0.5, -0.7, 0.2, -np.sqrt(0.22)]]:
+            np.random.seed(7)
+            res = Rigid3D.make_random_ck(center=center, size=20)
+            np_test.assert_equal(res.shape, (20, 4))
+            np.random.seed(7)
+            desired = [Rigid3D.make_random_ck(center=center) 
+                       for ind in range(20)]
+            np_test.assert_almost_equal(res, desired)
+
+        # make_init_ck_multi() same as without making all at once
+        for einit in [None, [0.5, -0.7, 0.2, -np.sqrt(0.22)]]:
+            for ninit in [1, 2, 10]:
+                np.random.seed(7)
+                res = Rigid3D.make_init_ck_multi(
+                    ninit=ninit, randome=True, einit=einit, randoms=False)
+                np_test.assert_equal(len(res), ninit)
+                np.random.seed(7)
+                desired = []
+                for ind in range(ninit):
+                    if (einit is not None) and (ind == 1):
+                        desired.append(np.hstack((einit, [1.])))
+                    else:
+                        desired.append(np.hstack((
+                            Rigid3D.make_random_ck(center=einit), [1.])))
+                np_test.assert_almost_equal(res, desired)
+
+        # random_state
+        res = Rigid3D.make_random_ck(size=5, random_state=3)
+        np_test.assert_almost_equal(
+            Rigid3D.make_random_ck(
+                size=5, random_state=np.random.RandomState(3)), res)
+        np.random.seed(3)
+        np_test.assert_almost_equal(Rigid3D.make_random_ck(size=5), res)
+        res = Rigid3D.make_init_ck_multi(
+            ninit=6, randome=True, randoms=True, sinit=2., random_state=4)
+        desired = Rigid3D.make_init_ck_multi(
+            ninit=6, randome=True, randoms=True, sinit=2., random_state=4)
+        np_test.assert_almost_equal(res, desired)
+
+    def test_make_quasi_random_ck(self):
+        """
+        Tests make_quasi_random_ck()
+        """
+
+        # Halton sequence
+        np_test.assert_almost_equal(
+            Rigid3D._halton(size=4, start=1), 
+            [[1/2., 1/3., 1/5.], [1/4., 2/3., 2/5.], [3/4., 1/9., 3/5.],
+             [1/8., 4/9., 4/5.]])
+
+        # deterministic, normalized and evenly spread over rotations
+        res = Rigid3D.make_quasi_random_ck(size=200)
+        np_test.assert_equal(res.shape, (200, 4))
+        np_test.assert_almost_equal(Rigid3D.make_quasi_random_ck(size=200), res)
+        np_test.assert_almost_equal(np.square(res).sum(axis=1), 1)
+        np_test.assert_almost_equal(
+            np.dot(res.transpose(), res) / 200., np.identity(4) / 4, 
+            decimal=2)
+
+        # randomized by random_state
+        res_1 = Rigid3D.make_quasi_random_ck(size=10, random_state=2)
+        np_test.assert_almost_equal(
+            Rigid3D.make_quasi_random_ck(size=10, random_state=2), res_1)
+        np_test.assert_equal(np.abs(res_1 - res[:10]).max() > 0.01, True)
+
+        # around center
+        center = [0.5, -0.7, 0.2, -np.sqrt(0.22)] 
+        res = Rigid3D.make_quasi_random_ck(
+            center=center, distance=0.1, size=20)
+        np_test.assert_almost_equal(np.square(res).sum(axis=1), 1)
+        r_rt_res = np.einsum(
+            'ji,njk->nik', Rigid3D.make_r_ck(center), Rigid3D.make_r_ck(res))
+        rt_res = Rigid3D.euler_to_ck(
+            Rigid3D.extract_euler(r=r_rt_res, ret='one', mode='x'))
+        np_test.assert_equal((np.abs(rt_res[:, 1:]) <= 0.1 + 1e-8).all(), True)
+
+        # used by make_init_ck_multi()
+        res = Rigid3D.make_init_ck_multi(
+            ninit=5, randome='quasi', einit=None, scale=1.)
+        np_test.assert_almost_equal(
+            res, Rigid3D.make_quasi_random_ck(size=5))
+
     def test_transform(self):
         """
         Tests transform()
@@ -1190,6 +1903,22 @@ class TestRigid3D(np_test.TestCase):
         y = rigid3d.transform(x=x_cs.transpose(), q=r, s=s, xy_axes='point_dim')
         np_test.assert_almost_equal(y, y_desired)
         
+        # homogeneous and chunked, with parity
+        rigid3d = Rigid3D()
+        rigid3d.q = r
+        rigid3d.p = Rigid3D.makeP(parity=-1)
+        rigid3d.s_scalar = s
+        rigid3d.d = d
+        y_desired = rigid3d.transform(x=x_cs)
+        homo = rigid3d.getHomogeneous()
+        np_test.assert_almost_equal(
+            np.dot(homo, np.vstack((x_cs, np.ones(4))))[:3], y_desired)
+        np_test.assert_almost_equal(
+            rigid3d.transformChunked(x=x_cs, chunk_size=3), y_desired)
+        rigid3d.d = None
+        np_test.assert_almost_equal(
+            rigid3d.homogeneous[:3, 3], [0, 0, 0])
+
     def test_recalculate_translation(self):
         """
         Tests recalculate_translation()
@@ -1277,6 +2006,116 @@ class TestRigid3D(np_test.TestCase):
             r3d.s_scalar * (np.dot(r3d.q, x-center) + center) 
             + r3d.recalculate_translation(rotation_center=center))
         np_test.assert_almost_equal(y_actual, y_desired)
+
+    def test_shift_initial(self):
+        """
+        Tests shift_initial()
+        """
+
+        # shifted initial points transformed to the same final points
+        r3d = Rigid3D()
+        r3d.s_scalar = 2.
+        angles = np.array([90, 30, 0]) * np.pi / 180
+        r3d.q = Rigid3D.make_r_euler(angles, mode='x')
+        r3d.d = np.array([1,3,1])
+        x = np.array([[-1, 2, 1], [3, 0, 2.]]).transpose()
+        shift = np.array([4, -2, 5.])
+        shifted = r3d.shift_initial(shift=shift)
+        np_test.assert_almost_equal(
+            shifted.transform(x=x + shift.reshape((3,1))), r3d.transform(x=x))
+        np_test.assert_equal(shifted.q, r3d.q)
+        np_test.assert_equal(r3d.d, [1,3,1])
+
+        # no translation
+        r3d.d = None
+        shifted = r3d.shift_initial(shift=[1, 0, 0])
+        np_test.assert_almost_equal(shifted.d, -2 * r3d.q[:,0])
+
+    def test_find(self):
+        """
+        Tests find()
+        """
+
+        np.random.seed(4)
+        x = np.random.rand(3, 7) * 100
+        angles = np.array([-123, 32, 168]) * np.pi / 180
+        r = Rigid3D.make_r_euler(angles, mode='x')
+        scale = 2.3
+        d = np.array([10., -20, 5])
+        y = scale * np.dot(r, x) + d.reshape((3,1))
+
+        # exact
+        res = Rigid3D.find(x=x, y=y)
+        np_test.assert_almost_equal(res.q, r)
+        np_test.assert_almost_equal(res.s_scalar, scale)
+        np_test.assert_almost_equal(res.d, d)
+        np_test.assert_almost_equal(res.parity, 1)
+        np_test.assert_almost_equal(res.rmsError, 0)
+        np_test.assert_almost_equal(Rigid3D.make_r_ck(res.ck), r)
+        np_test.assert_almost_equal(res.transform(x=x), y)
+
+        # identity and pure z rotations (r_33 = 1 up to roundoff)
+        for angle in [0] + list(np.linspace(0.1, 2 * np.pi, 40)):
+            r_z = Rigid3D.make_r_euler([angle, 0, 0])
+            res = Rigid3D.find(x=x, y=np.dot(r_z, x))
+            np_test.assert_equal(np.isfinite(res.ck).all(), True)
+            np_test.assert_almost_equal(Rigid3D.make_r_ck(res.ck), res.q)
+            np_test.assert_almost_equal(res.q, r_z)
+
+        # point_dim, fixed scale
+        res = Rigid3D.find(
+            x=x.transpose(), y=y.transpose(), scale=scale, 
+            xy_axes='point_dim')
+        np_test.assert_almost_equal(res.q, r)
+        np_test.assert_equal(res.s_scalar, scale)
+        np_test.assert_almost_equal(res.d, d)
+
+        # mirror image
+        p = Rigid3D.makeP(parity=-1)
+        y_mirror = scale * np.dot(np.dot(r, p), x) + d.reshape((3,1))
+        res = Rigid3D.find(x=x, y=y_mirror, parity=-1)
+        np_test.assert_almost_equal(res.q, r)
+        np_test.assert_almost_equal(res.p, p)
+        np_test.assert_almost_equal(res.parity, -1)
+        np_test.assert_almost_equal(res.s_scalar, scale)
+        np_test.assert_almost_equal(res.transform(x=x), y_mirror)
+        np_test.assert_almost_equal(
+            res.shift_initial(shift=[1, 2, 3]).transform(
+                x=x + np.array([[1], [2], [3]])), y_mirror)
+        res = Rigid3D.find(x=x, y=y_mirror, parity=None)
+        np_test.assert_almost_equal(res.parity, -1)
+        np_test.assert_almost_equal(res.rmsError, 0)
+        res = Rigid3D.find(x=x, y=y_mirror, parity=1)
+        np_test.assert_equal(res.rmsError > 1, True)
+        np_test.assert_almost_equal(np.linalg.det(res.q), 1)
+        self.assertRaises(ValueError, Rigid3D.find, x=x, y=y, parity=0)
+
+        # noise, same as the optimization of the squared differences
+        y_noise = y + np.random.randn(3, 7)
+        res = Rigid3D.find(x=x, y=y_noise)
+        def sq_diff(param):
+            e_param = param[:4] / np.sqrt((param[:4]**2).sum())
+            y_param = (param[4] * np.dot(Rigid3D.make_r_ck(e_param), x) 
+                       + param[5:].reshape((3,1)))
+            return ((y_noise - y_param)**2).sum()
+        init = np.hstack((res.ck, [res.s_scalar], res.d))
+        np_test.assert_almost_equal(sq_diff(init), (res.error**2).sum())
+        for ind in range(len(init)):
+            for delta in [-1e-4, 1e-4]:
+                param = init.copy()
+                param[ind] += delta
+                np_test.assert_equal(sq_diff(param) > sq_diff(init), True)
+
+        # weights: misplaced point with small weight
+        y_bad = y.copy()
+        y_bad[:, 2] += [20, -10, 5]
+        weights = np.ones(7)
+        weights[2] = 1e-10
+        res = Rigid3D.find(x=x, y=y_bad, weights=weights)
+        np_test.assert_almost_equal(res.q, r)
+        np_test.assert_almost_equal(res.s_scalar, scale)
+        np_test.assert_almost_equal(res.d, d, decimal=5)
+        np_test.assert_almost_equal(res.error[:, 2], [20, -10, 5], decimal=5)
  
 
 if __name__ == '__main__':
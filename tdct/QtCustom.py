@@ -7,6 +7,7 @@ Custom Qt classes. Some widgets in QT Designer are promoted to these classes:
 	- QStandardItemModel
 	- QGraphicsScene
 	- a custom QWidget for Matplotlib integration
+A TimingDialog shows the instrument timing summary.
 
 # @Title			: QtCustom
 # @Project			: 3DCTv2
@@ -18,7 +19,7 @@ Custom Qt classes. Some widgets in QT Designer are promoted to these classes:
 # @Credits			:
 # @Maintainer		: Jan Arnold
 # @Date				: 2016/02/27
-# @Version			: 3DCT 2.3.0 module rev. 47
+# @Version			: 3DCT 2.3.0 module rev. 50
 # @Status			: stable
 # @Usage			: part of 3D Correlation Toolbox
 # @Notes			: Some widgets in QT Designer are promoted to these classes
@@ -26,7 +27,9 @@ Custom Qt classes. Some widgets in QT Designer are promoted to these classes:
 """
 # ======================================================================================================================
 
+import os
 import sys
+import time
 from PyQt4 import QtCore, QtGui
 import numpy as np
 
@@ -39,8 +42,11 @@ from mpl_toolkits.axes_grid1 import make_axes_locatable
 
 import math
 import beadPos
+import beadDetect
+import beadPos2D
 import clrmsg
 import TDCT_debug
+import instrument
 
 debug = TDCT_debug.debug
 style.use('fivethirtyeight')
@@ -63,6 +69,10 @@ class QTableViewCustom(QtGui.QTableView):
 			self.mainParent = self.parent().parent().parent()
 
 		self._drop = False
+		## localization results and smoothed volumes of getz, see beadPos.FitCache
+		self.zCache = beadPos.FitCache()
+		## image stacks of layer 1-3 (img1, img2, img3)
+		self._images = [None, None, None]
 
 		## Enable Drag'n'Drop
 		self.setDragDropOverwriteMode(False)
@@ -71,6 +81,15 @@ class QTableViewCustom(QtGui.QTableView):
 
 		'''associated model and scene are passed from TDCT_correlation and are available as self._model and self._scene'''
 
+	def _setImage(self,layer,img):
+		## cached results of replaced (closed) stacks are dropped right away, so the stacks can be freed
+		self._images[layer] = img
+		self.zCache.prune(self._images)
+
+	img1 = property(lambda self: self._images[0], lambda self, img: self._setImage(0,img))
+	img2 = property(lambda self: self._images[1], lambda self, img: self._setImage(1,img))
+	img3 = property(lambda self: self._images[2], lambda self, img: self._setImage(2,img))
+
 	def mouseMoveEvent(self,event):
 		super(QTableViewCustom, self).mouseMoveEvent(event)
 		## Drop Flag to trigger item update only when there was a row move
@@ -164,6 +183,13 @@ class QTableViewCustom(QtGui.QTableView):
 			cmGetZgaussL3.triggered.connect(lambda: self.getz(self.img3, gauss=True))
 			cmGetZgaussOptL3 = QtGui.QAction('Get x,y,z gauss layer 3', self)
 			cmGetZgaussOptL3.triggered.connect(lambda: self.getz(self.img3, gauss=True,optimize=True))
+			# Robust (low SNR)
+			cmGetZrobustL1 = QtGui.QAction('Get x,y,z robust layer 1 (low SNR)', self)
+			cmGetZrobustL1.triggered.connect(lambda: self.getz(self.img1, robust=True,optimize=True))
+			cmGetZrobustL2 = QtGui.QAction('Get x,y,z robust layer 2 (low SNR)', self)
+			cmGetZrobustL2.triggered.connect(lambda: self.getz(self.img2, robust=True,optimize=True))
+			cmGetZrobustL3 = QtGui.QAction('Get x,y,z robust layer 3 (low SNR)', self)
+			cmGetZrobustL3.triggered.connect(lambda: self.getz(self.img3, robust=True,optimize=True))
 
 			# broken and not used atm
 			# cmGetZpoly = QtGui.QAction('Get z poly (deprecated)', self)
@@ -173,12 +199,15 @@ class QTableViewCustom(QtGui.QTableView):
 			if self.img1 is None:
 				cmGetZgaussL1.setEnabled(False)
 				cmGetZgaussOptL1.setEnabled(False)
+				cmGetZrobustL1.setEnabled(False)
 			if self.img2 is None:
 				cmGetZgaussL2.setEnabled(False)
 				cmGetZgaussOptL2.setEnabled(False)
+				cmGetZrobustL2.setEnabled(False)
 			if self.img3 is None:
 				cmGetZgaussL3.setEnabled(False)
 				cmGetZgaussOptL3.setEnabled(False)
+				cmGetZrobustL3.setEnabled(False)
 				# cmGetZpoly.setEnabled(False)  # broken atm
 				# cmGetZpolyOpt.setEnabled(False)  # broken atm
 			self.contextMenu = QtGui.QMenu(self)
@@ -191,11 +220,74 @@ class QTableViewCustom(QtGui.QTableView):
 			self.contextMenu.addAction(cmGetZgaussOptL1)
 			self.contextMenu.addAction(cmGetZgaussOptL2)
 			self.contextMenu.addAction(cmGetZgaussOptL3)
+			self.contextMenu.addSeparator()
+			self.contextMenu.addAction(cmGetZrobustL1)
+			self.contextMenu.addAction(cmGetZrobustL2)
+			self.contextMenu.addAction(cmGetZrobustL3)
 			# self.contextMenu.addAction(cmGetZpoly)  # broken atm
 			# self.contextMenu.addAction(cmGetZpolyOpt)  # broken atm
+			self.contextMenu.addSeparator()
+			for action in self.detectBeadsActions():
+				self.contextMenu.addAction(action)
+			self.contextMenu.addSeparator()
+			for action in self.refine2DActions():
+				self.contextMenu.addAction(action)
+			self.contextMenu.popup(QtGui.QCursor.pos())
+		else:
+			self.contextMenu = QtGui.QMenu(self)
+			for action in self.detectBeadsActions():
+				self.contextMenu.addAction(action)
+			self.contextMenu.addSeparator()
+			for action in self.refine2DActions():
+				self.contextMenu.addAction(action)
 			self.contextMenu.popup(QtGui.QCursor.pos())
 
-	def getz(self,img,optimize=False,gauss=False):
+	def detectBeadsActions(self):
+		actions = []
+		for layer, img in enumerate([getattr(self, 'img%d' % i, None) for i in (1, 2, 3)]):
+			cmDetectBeads = QtGui.QAction('Detect beads layer %d' % (layer + 1), self)
+			cmDetectBeads.triggered.connect(lambda checked=False, img=img: self.detectBeads(img))
+			if img is None:
+				cmDetectBeads.setEnabled(False)
+			actions.append(cmDetectBeads)
+		return actions
+
+	def detectBeads(self,img):
+		"""Automatically detect beads in img and add them as markers to the scene/model"""
+		markers = beadDetect.findBeads(img,radius=self._scene.markerSize)
+		if debug is True: print clrmsg.DEBUG + 'Detected beads:', len(markers)
+		for x, y, z in markers:
+			self._scene.addCircle(x,y,z)
+		self._scene.itemsToModel()
+
+	def refine2DActions(self):
+		actions = []
+		for method, label in [
+				('centroid', 'Refine all x,y 2D centroid'),
+				('gauss', 'Refine all x,y 2D gauss'),
+				('radialsymmetry', 'Refine all x,y 2D radial symmetry')]:
+			cmRefine2D = QtGui.QAction(label, self)
+			cmRefine2D.triggered.connect(lambda checked=False, method=method: self.refine2D(method))
+			if self._model.rowCount() == 0:
+				cmRefine2D.setEnabled(False)
+			actions.append(cmRefine2D)
+		return actions
+
+	def refine2D(self,method='radialsymmetry'):
+		"""Refine x,y of all markers in the (projected) 2D image in one batch"""
+		img = getattr(self.mainParent, 'img_%s_layer1' % self._scene.side)
+		activeitems = []
+		for item in self._scene.items():
+			if isinstance(item, QtGui.QGraphicsEllipseItem):
+				activeitems.append(item)
+		coords = np.array([[item.x(), item.y()] for item in activeitems])
+		refined = beadPos2D.refine(img,coords,method=method,cutout=self._scene.markerSize)
+		if debug is True: print clrmsg.DEBUG + '2D refinement shifts:', refined - coords
+		for item, (x, y) in zip(activeitems, refined):
+			item.setPos(x,y)
+		self._scene.itemsToModel()
+
+	def getz(self,img,optimize=False,gauss=False,robust=False):
 		indices = self.selectedIndexes()
 		## Determine z for selected rows
 		if indices:
@@ -205,6 +297,8 @@ class QTableViewCustom(QtGui.QTableView):
 					activeitems.append(item)
 			## Filter selected rows
 			rows = set(index.row() for index in indices)
+			## Only the fit of the current marker is drawn, all others are just fitted
+			plotRow = self.currentIndex().row() if self.currentIndex().row() in rows else max(rows)
 			## Delete selected rows in scene.
 			for row in rows:
 				if debug is True:
@@ -214,10 +308,32 @@ class QTableViewCustom(QtGui.QTableView):
 						self._model.data(self._model.index(row, 2)).toString()
 				x = float(self._model.data(self._model.index(row, 0)).toString())
 				y = float(self._model.data(self._model.index(row, 1)).toString())
-
-				if gauss is True:
+				## Fits are cached with the results and drawn here, so that they are shown on cache hits as well
+				parent = self.mainParent if row == plotRow else None
+
+				if robust is True:
+					(xopt,yopt,zopt,confidence), fits = self.zCache.lookup(
+						img,x,y,'robust',self._scene.markerSize,None,
+						beadPos.getzRobust,x,y,img,optimize=True,cutout=self._scene.markerSize,
+						cache=self.zCache,returnFits=True)
+					if parent is not None: beadPos.plotFits(parent,fits)
+					if debug is True: print clrmsg.DEBUG + str(img.shape), xopt,yopt,zopt,confidence
+					if confidence >= 0.5 and 0 <= zopt <= img.shape[-3]:
+						self._scene.zValuesDict[activeitems[row]][1] = (0,0,0)
+						self._model.itemFromIndex(self._model.index(row, 2)).setForeground(QtCore.Qt.black)
+					else:
+						self._scene.zValuesDict[activeitems[row]][1] = (255,0,0)
+						self._model.itemFromIndex(self._model.index(row, 2)).setForeground(QtCore.Qt.red)
+					self._model.itemFromIndex(self._model.index(row, 0)).setText(str(xopt))
+					self._model.itemFromIndex(self._model.index(row, 1)).setText(str(yopt))
+					self._model.itemFromIndex(self._model.index(row, 2)).setText(str(zopt))
+					self._model.itemFromIndex(self._model.index(row, 2)).setToolTip('confidence: %.2f' % confidence)
+				elif gauss is True:
 					if optimize is False:
-						zopt = beadPos.getzGauss(x,y,img,parent=self.mainParent)
+						zopt, fits = self.zCache.lookup(
+							img,x,y,'gauss',None,None,
+							beadPos.getzGauss,x,y,img,returnFits=True)
+						if parent is not None: beadPos.plotFits(parent,fits)
 						if debug is True: print clrmsg.DEBUG + str(img.shape), zopt
 						if 0 <= zopt <= img.shape[-3]:
 							self._scene.zValuesDict[activeitems[row]][1] = (0,0,0)
@@ -227,9 +343,12 @@ class QTableViewCustom(QtGui.QTableView):
 							self._model.itemFromIndex(self._model.index(row, 2)).setForeground(QtCore.Qt.red)
 						self._model.itemFromIndex(self._model.index(row, 2)).setText(str(zopt))
 					else:
-						xopt,yopt,zopt = beadPos.getzGauss(
-							x,y,img,parent=self.mainParent,optimize=True,threshold=True,
-							threshVal=self.mainParent.doubleSpinBox_treshVal.value(),cutout=self._scene.markerSize)
+						threshVal = self.mainParent.doubleSpinBox_treshVal.value()
+						(xopt,yopt,zopt), fits = self.zCache.lookup(
+							img,x,y,'gaussOpt',self._scene.markerSize,threshVal,
+							beadPos.getzGauss,x,y,img,optimize=True,threshold=True,
+							threshVal=threshVal,cutout=self._scene.markerSize,returnFits=True)
+						if parent is not None: beadPos.plotFits(parent,fits)
 						if debug is True: print clrmsg.DEBUG + str(img.shape), xopt,yopt,zopt
 						if (
 							abs(x - xopt) <= 2 * self._scene.markerSize and
@@ -245,7 +364,7 @@ class QTableViewCustom(QtGui.QTableView):
 						self._model.itemFromIndex(self._model.index(row, 1)).setText(str(yopt))
 						self._model.itemFromIndex(self._model.index(row, 2)).setText(str(zopt))
 				elif optimize is False:
-					zopt = beadPos.getzPoly(x,y,img,n=None)
+					zopt = self.zCache.lookup(img,x,y,'poly',None,None,beadPos.getzPoly,x,y,img,n=None)
 					if debug is True: print clrmsg.DEBUG + str(img.shape), zopt
 					if 0 <= zopt <= img.shape[-3]:
 						self._scene.zValuesDict[activeitems[row]][1] = (0,0,0)
@@ -255,7 +374,8 @@ class QTableViewCustom(QtGui.QTableView):
 						self._model.itemFromIndex(self._model.index(row, 2)).setForeground(QtCore.Qt.red)
 					self._model.itemFromIndex(self._model.index(row, 2)).setText(str(zopt))
 				elif optimize is True:
-					xopt,yopt,zopt = beadPos.getzPoly(x,y,img,n=None,optimize=True)
+					xopt,yopt,zopt = self.zCache.lookup(
+						img,x,y,'polyOpt',None,None,beadPos.getzPoly,x,y,img,n=None,optimize=True)
 					if debug is True: print clrmsg.DEBUG + str(img.shape), xopt,yopt,zopt
 					if 0 <= xopt <= img.shape[-1] and 0 <= yopt <= img.shape[-2] and 0 <= zopt <= img.shape[-3]:
 						self._scene.zValuesDict[activeitems[row]][1] = (255,0,0)
@@ -710,3 +830,65 @@ class QLineEditFilePath(QtGui.QLineEdit):
 			objc.NULL
 		)
 		return QtCore.QUrl(str(absCFURL[0])).toLocalFile()
+
+
+##############################
+## Timing summary
+
+
+class TimingDialog(QtGui.QDialog):
+	"""Non-modal dialog showing the instrument timer/counter summary with controls to toggle recording,
+	reset the counters and export them to a JSON file (default directory: workingdir)"""
+	def __init__(self,parent=None,workingdir=''):
+		super(TimingDialog, self).__init__(parent)
+		self.workingdir = workingdir
+		self.setWindowTitle('Timing')
+		self.resize(720, 400)
+
+		self.checkBox_record = QtGui.QCheckBox('record timings', self)
+		self.checkBox_record.setChecked(instrument.enabled)
+		self.checkBox_record.toggled.connect(self.setRecording)
+
+		self.textEdit = QtGui.QPlainTextEdit(self)
+		self.textEdit.setReadOnly(True)
+		self.textEdit.setLineWrapMode(QtGui.QPlainTextEdit.NoWrap)
+		font = QtGui.QFont('Monospace')
+		font.setStyleHint(QtGui.QFont.TypeWriter)
+		self.textEdit.setFont(font)
+
+		buttons = QtGui.QHBoxLayout()
+		for text, slot in [
+				('Refresh', self.refresh), ('Reset', self.reset), ('Export JSON...', self.export), ('Close', self.close)]:
+			button = QtGui.QPushButton(text, self)
+			button.setAutoDefault(False)
+			button.clicked.connect(slot)
+			buttons.addWidget(button)
+
+		layout = QtGui.QVBoxLayout(self)
+		layout.addWidget(self.checkBox_record)
+		layout.addWidget(self.textEdit)
+		layout.addLayout(buttons)
+		self.refresh()
+
+	def setRecording(self,state):
+		instrument.enable(state)
+		self.refresh()
+
+	def refresh(self):
+		lines = instrument.summary()
+		if len(lines) == 1 and not instrument.enabled:
+			lines.append('\nRecording is disabled. Check "record timings" and use the correlation window.')
+		self.textEdit.setPlainText('\n'.join(lines))
+
+	def reset(self):
+		instrument.reset()
+		self.refresh()
+
+	def export(self):
+		path = str(QtGui.QFileDialog.getSaveFileName(
+			self, 'Export timings as',
+			os.path.join(self.workingdir, time.strftime("%Y-%m-%d_%H-%M-%S")+'_timing.json'),
+			"JSON (*.json)"))
+		if path:
+			instrument.export(path)
+			if clrmsg and debug is True: print clrmsg.DEBUG + 'Timings exported to:', path
@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Automatic detection of spherical fiducial markers (beads) in 3D image stacks (tiff z-stack)
+import beadDetect.py and call markers = beadDetect.findBeads(img,radius=5) to get a list of
+bead candidates as x,y,z coordinates, i.e. in the same column order as the marker tables.
+
+The stack is filtered with a difference of Gaussians (DoG) using separable 1D convolutions.
+Beads are several px wide, so the stack is first binned to the bead scale (e.g. 2x2x2 for
+radius 5, binned sigma >= 1.4 px), which cuts the filter work by the number of voxels per
+bin. To keep memory usage bounded and to make use of multiple cores, the binned stack is
+split in z,y,x blocks (plus a halo big enough for the filter kernels) that are processed
+in a thread pool. Local maxima are picked by non-maximum suppression. Every candidate is
+then located at full resolution: the DoG is evaluated around it from the original stack
+with small separable convolutions and the maximum is refined to sub-pixel precision with
+a 3 point parabolic fit along every axis.
+
+# @Title			: beadDetect
+# @Project			: 3DCTv2
+# @Description		: Automatic bead detection in 3D image stacks (tiff z-stack)
+# @Author			: Jan Arnold
+# @Email			: jan.arnold (at) coraxx.net
+# @Copyright		: Copyright (C) 2016  Jan Arnold
+# @License			: GPLv3 (see LICENSE file)
+# @Credits			:
+# @Maintainer		: Jan Arnold
+# @Date				: 2016/10
+# @Version			: 3DCT 2.3.0 module rev. 4
+# @Status			: development
+# @Usage			: import beadDetect.py and call markers = beadDetect.findBeads(img,radius=5)
+# 					  markers is a numpy array with one x,y,z row per detected bead
+# @Notes			: 2D images are handled as stacks with a single slice (z = 0)
+# @Python_version	: 2.7.11
+"""
+# ======================================================================================================================
+
+import time
+import math
+import itertools
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import numpy as np
+from scipy import ndimage
+from scipy.spatial import cKDTree
+import tifffile as tf
+
+try:
+	import clrmsg
+	import TDCT_debug
+	import instrument
+except:
+	pass
+
+debug = TDCT_debug.debug
+
+
+@instrument.timed('localization.findBeads')
+def findBeads(
+		img,radius=5.,threshVal=0.1,minDistance=None,ratio=1.6,chunksize=(128,512,512),threads=None,maxBeads=None,
+		binning=None):
+	"""Detect bead candidates in a 3D image stack.
+
+	img is the path to the z-stack tiff file or a numpy.ndarray from tifffile.py imread function
+	radius is the approximate bead radius in px. It sets the smaller DoG sigma to radius/sqrt(3)
+	(for 2D images radius/sqrt(2)). A sequence of 3 values (z,y,x) can be passed for anisotropic stacks.
+	threshVal is the cut-off relative to the strongest filter response (between 0 and 1)
+	minDistance is the minimum distance between two beads in px (defaults to radius)
+	ratio is the ratio between the two sigmas of the difference of Gaussians
+	chunksize is the size (z,y,x, in px of the original stack) of the blocks filtered in one go, a single
+	value is used for all axes
+	threads is the number of worker threads (defaults to the number of cpus)
+	maxBeads limits the number of returned candidates (strongest first)
+	binning is the binning (z,y,x or a single value) of the stack before filtering. None picks it from the
+	bead size (binned sigma >= 1.4 px), 1 filters at full resolution.
+
+	Returns a numpy.ndarray of shape (n,3) with x,y,z coordinates sorted by descending filter response."""
+
+	if not isinstance(img, str) and not isinstance(img, np.ndarray):
+		if clrmsg and debug is True: print clrmsg.ERROR
+		raise TypeError('I can only handle an image path as string or an image volume as numpy.ndarray imported from tifffile.py')
+	elif isinstance(img, str):
+		img = tf.imread(img)
+
+	if img.ndim == 2:
+		img = img[np.newaxis]
+	elif img.ndim != 3:
+		raise ValueError('Expected a single channel 2D image or 3D image stack, got an array with shape {0}'.format(img.shape))
+
+	if debug is True: ping = time.time()
+
+	sigma = np.array(np.broadcast_to(radius, (3,)), dtype=np.float64)
+	if img.shape[0] == 1:
+		sigma = sigma/math.sqrt(2)
+		sigma[0] = 0
+	else:
+		sigma = sigma/math.sqrt(3)
+	if minDistance is None:
+		minDistance = max(1, int(round(np.max(np.broadcast_to(radius, (3,))))))
+	if binning is None:
+		binning = np.maximum(1, (sigma/1.4).astype(int))
+	binning = np.broadcast_to(binning, (3,)).astype(int)
+	if img.shape[0] == 1:
+		binning[0] = 1
+	binned = binning.max() > 1
+
+	## DoG, non-maximum suppression and blocks in binned px
+	data = binStack(img, binning) if binned else img
+	sigmaBinned = sigma/binning
+	nmsSize = 2*np.maximum(1, np.round(float(minDistance)/binning).astype(int))+1
+	if img.shape[0] == 1:
+		nmsSize[0] = 1
+	## Halo along every axis has to cover the larger gaussian kernel (truncated at 4 sigma), the non-maximum
+	## suppression window and the neighbours needed for the parabolic refinement
+	halo = [
+		int(4.0*sd+0.5) + int(4.0*math.sqrt(ratio**2-1)*sd+0.5) + size//2 + 1
+		for sd, size in zip(sigmaBinned, nmsSize)]
+	chunksize = np.maximum(1, np.broadcast_to(chunksize, (3,)).astype(int)//binning)
+	chunks = list(itertools.product(*[
+		[(start, min(start+step, length)) for start in range(0, length, step)]
+		for length, step in zip(data.shape, chunksize)]))
+
+	if threads is None:
+		threads = multiprocessing.cpu_count()
+	pool = ThreadPool(threads) if threads > 1 else None
+	mapper = pool.map if pool is not None else map
+	try:
+		results = mapper(lambda chunk: _findBeadsChunk(data,chunk,halo,sigmaBinned,ratio,nmsSize), chunks)
+		coords = np.concatenate([result[0] for result in results])
+		response = np.concatenate([result[1] for result in results])
+
+		if response.size > 0:
+			keep = response >= threshVal*response.max()
+			coords, response = coords[keep], response[keep]
+			order = np.argsort(response)[::-1]
+			if maxBeads is not None:
+				order = order[:maxBeads]
+			coords = coords[order]
+
+		if binned and len(coords) > 0:
+			## center of the bin in full resolution px, then the maximum within one bin at full resolution
+			centers = coords*binning + (binning-1)/2.
+			batches = [centers[start:start+256] for start in range(0, len(centers), 256)]
+			coords = np.concatenate(mapper(lambda batch: refineDoG(img,batch,sigma,ratio,binning), batches))
+			coords = _dropDuplicates(coords)
+	finally:
+		if pool is not None:
+			pool.close()
+			pool.join()
+
+	if clrmsg and debug is True:
+		print clrmsg.DEBUG + 'Bead detection: %.f candidates in %.f chunks (binning %s) found in %.3f s' % (
+			len(coords), len(chunks), binning, time.time()-ping)
+
+	## z,y,x -> x,y,z (column order of the marker tables)
+	return coords[:,::-1].copy()
+
+
+def binStack(img,binning):
+	"""Mean of img over blocks of binning (z,y,x) voxels (float32). The stack is padded with its border
+	values to a multiple of binning. The stack is binned plane by plane with strided sums, so only the
+	binned stack is allocated in full."""
+	binning = np.asarray(binning)
+	shape = -(-np.array(img.shape)//binning)
+	out = np.empty(shape, dtype=np.float32)
+	pad = [(0, int(n*b-length)) for n, b, length in zip(shape[1:], binning[1:], img.shape[1:])]
+	for z in range(shape[0]):
+		plane = np.zeros(img.shape[1:], dtype=np.float32)
+		for k in range(binning[0]):
+			plane += img[min(z*binning[0]+k, img.shape[0]-1)]
+		if pad[0][1] or pad[1][1]:
+			plane = np.pad(plane, pad, mode='edge')
+		rows = plane[0::binning[1]].copy()
+		for k in range(1, binning[1]):
+			rows += plane[k::binning[1]]
+		out[z] = rows[:,0::binning[2]]
+		for k in range(1, binning[2]):
+			out[z] += rows[:,k::binning[2]]
+	out /= binning.prod()
+	return out
+
+
+def refineDoG(img,centers,sigma,ratio=1.6,search=1):
+	"""Sub-pixel position of the DoG (sigma, ratio*sigma) maximum of img within search px (per axis) of the
+	rounded centers (array of shape (n,3) with z,y,x).
+
+	The DoG is only evaluated in the search window: the patch around every center (window plus kernel radius,
+	padded with the border values) is convolved along z, y and x with the kernels restricted to the output
+	positions, for all centers at once. The maximum is refined with a 3 point parabolic fit along every axis.
+	Returns a numpy.ndarray of shape (n,3) with z,y,x."""
+	centers = np.round(np.asarray(centers, dtype=np.float64)).astype(int)
+	n = len(centers)
+	search = np.broadcast_to(search, (3,)).astype(int)
+	## half width of the window (search plus the neighbours for the parabolic fit) and of the kernels per axis
+	window = [s+1 if length > 1 and sd > 0 else 0 for s, length, sd in zip(search, img.shape, sigma)]
+	radius = [int(4.0*ratio*sd+0.5) for sd in sigma]
+
+	indices = []
+	valid = []
+	for axis in range(3):
+		offsets = np.arange(-window[axis]-radius[axis], window[axis]+radius[axis]+1)
+		index = centers[:,axis,np.newaxis] + offsets
+		indices.append(np.clip(index, 0, img.shape[axis]-1))
+		inner = index[:,radius[axis]:len(offsets)-radius[axis]]
+		valid.append((inner >= 0) & (inner < img.shape[axis]))
+	patch = img[
+		indices[0][:,:,np.newaxis,np.newaxis], indices[1][:,np.newaxis,:,np.newaxis],
+		indices[2][:,np.newaxis,np.newaxis,:]].astype(np.float32)
+
+	resp = 0
+	for scale, sign in ((1., 1), (ratio, -1)):
+		out = patch
+		for axis in range(3):
+			if radius[axis] == 0:
+				continue
+			t = np.arange(-radius[axis], radius[axis]+1)
+			kernel = np.exp(-t**2/(2*(scale*sigma[axis])**2))
+			kernel = (kernel/kernel.sum()).astype(np.float32)
+			## (output position, patch position) matrix of the valid correlation
+			size = 2*window[axis]+1
+			matrix = np.zeros((size, size+2*radius[axis]), dtype=np.float32)
+			for k in range(size):
+				matrix[k,k:k+len(kernel)] = kernel
+			out = np.moveaxis(np.tensordot(matrix, out, axes=([1], [axis+1])), 0, axis+1)
+		resp = resp + sign*out
+
+	## maximum in the window without its outermost px (neighbours of the parabolic fit), not outside the image
+	resp = np.where(
+		valid[0][:,:,np.newaxis,np.newaxis] & valid[1][:,np.newaxis,:,np.newaxis] &
+		valid[2][:,np.newaxis,np.newaxis,:], resp, -np.inf)
+	inner = (slice(None),) + tuple(slice(1, -1) if w > 0 else slice(None) for w in window)
+	flat = resp[inner].reshape(n, -1).argmax(axis=1)
+	loc = np.array(np.unravel_index(flat, resp[inner].shape[1:])) + np.array([w > 0 for w in window])[:,np.newaxis]
+
+	rows = np.arange(n)
+	f0 = resp[(rows,) + tuple(loc)]
+	coords = (centers - window + loc.T).astype(np.float64)
+	for axis in range(3):
+		if window[axis] == 0:
+			continue
+		lower, upper = loc.copy(), loc.copy()
+		lower[axis] -= 1
+		upper[axis] += 1
+		fl, fu = resp[(rows,) + tuple(lower)], resp[(rows,) + tuple(upper)]
+		denom = fl - 2*f0 + fu
+		with np.errstate(divide='ignore', invalid='ignore'):
+			offset = np.where(np.isfinite(denom) & (denom < 0), 0.5*(fl-fu)/denom, 0)
+		coords[:,axis] += np.clip(offset, -0.5, 0.5)
+	return coords
+
+
+def _dropDuplicates(coords,distance=1.):
+	"""Remove coordinates closer than distance to a preceding (stronger) one"""
+	if len(coords) < 2:
+		return coords
+	pairs = cKDTree(coords).query_pairs(distance)
+	drop = set(max(pair) for pair in pairs)
+	return coords[[i for i in range(len(coords)) if i not in drop]]
+
+
+def dog(img,sigma,ratio=1.6):
+	"""Difference of Gaussians of img with sigma and ratio*sigma (separable, float32)
+
+	The wider Gaussian is not calculated from img but by blurring the narrow one with
+	sqrt(ratio**2-1)*sigma, which needs a shorter kernel."""
+	g1 = ndimage.gaussian_filter(img, sigma, output=np.float32, mode='nearest')
+	g2 = ndimage.gaussian_filter(g1, np.asarray(sigma)*math.sqrt(ratio**2-1), output=np.float32, mode='nearest')
+	g1 -= g2
+	return g1
+
+
+def _findBeadsChunk(img,chunk,halo,sigma,ratio,nmsSize):
+	"""Filter one z,y,x block (plus halo) and return z,y,x coordinates and filter response of its local maxima.
+	chunk is a (start,end) pair per axis, halo the halo size per axis."""
+	hstart = np.array([max(0, start-h) for (start, end), h in zip(chunk, halo)])
+	hend = np.array([min(length, end+h) for (start, end), h, length in zip(chunk, halo, img.shape)])
+
+	resp = dog(img[tuple(slice(*bounds) for bounds in zip(hstart, hend))], sigma, ratio)
+	peaks = (resp == ndimage.maximum_filter(resp, size=nmsSize, mode='nearest')) & (resp > 0)
+	## only keep maxima from the block itself, the halo belongs to the neighbouring blocks
+	inner = tuple(slice(start-h, end-h) for (start, end), h in zip(chunk, hstart))
+
+	idx = np.array(np.nonzero(peaks[inner])) + (np.array([start for start, end in chunk]) - hstart)[:,np.newaxis]
+	coords = idx.T.astype(np.float64)
+	values = resp[tuple(idx)]
+	coords += refineParabolic(resp, idx)
+	coords += hstart
+	return coords, values
+
+
+def refineParabolic(data,idx):
+	"""Sub-pixel offsets of the maxima at the indices idx (array of shape (ndim,n)) of data
+
+	Fits a parabola through the maximum and its two direct neighbours along every axis.
+	Maxima at the border of an axis are not refined along that axis.
+	Returns a numpy.ndarray of shape (n,ndim)."""
+	offsets = np.zeros(idx.T.shape)
+	for axis in range(data.ndim):
+		inside = (idx[axis] > 0) & (idx[axis] < data.shape[axis]-1)
+		if not inside.any():
+			continue
+		center = idx[:,inside]
+		lower = center.copy()
+		lower[axis] -= 1
+		upper = center.copy()
+		upper[axis] += 1
+		f0 = data[tuple(center)].astype(np.float64)
+		fl = data[tuple(lower)]
+		fu = data[tuple(upper)]
+		denom = fl - 2*f0 + fu
+		with np.errstate(divide='ignore', invalid='ignore'):
+			offset = np.where(denom < 0, 0.5*(fl-fu)/denom, 0)
+		offsets[inside, axis] = np.clip(offset, -0.5, 0.5)
+	return offsets
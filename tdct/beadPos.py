@@ -17,34 +17,119 @@ to get an optimized bead position (optimization of x, y and z)
 # 					  2D Gaussian fit from http://scipy.github.io/old-wiki/pages/Cookbook/FittingData
 # @Maintainer		: Jan Arnold
 # @Date				: 2015/12
-# @Version			: 3DCT 2.3.0 module rev. 2
+# @Version			: 3DCT 2.3.0 module rev. 7
 # @Status			: stable
 # @Usage			: import beadPos.py and call z = beadPos.getz(x,y,img,n=None,optimize=False) to get z position
 # 					  at the given x and y pixel coordinate or call x,y,z = beadPos.getz(x,y,img,n=None,optimize=True)
 # 					  to get an optimized bead position (optimization of x, y and z)
-# @Notes			: stable, but problems with low SNR <- needs revisiting
+# 					  For low SNR data use z,confidence = beadPos.getzRobust(x,y,img) (robust fit with background model)
+# @Notes			: getzPoly/getzGauss have problems with low SNR, use getzRobust instead
 # @Python_version	: 2.7.11
 """
 # ======================================================================================================================
 
-import time
 import math
+import collections
 import numpy as np
-from scipy.optimize import curve_fit, leastsq
+from scipy.optimize import curve_fit, leastsq, least_squares
+from scipy import ndimage
 import matplotlib.pyplot as plt
 import tifffile as tf
 import parabolic
+import beadPos2D
 
 try:
 	import clrmsg
 	import TDCT_debug
+	import instrument
 except:
 	pass
 
 repeat = 0
 debug = TDCT_debug.debug
-
-
+## Result of the numeric fitting functions (fitGauss1D, fitGauss2D, fitzRobust), independent of any plotting.
+## params: fitted parameters, cov: covariance matrix of params (None if not available),
+## residuals: data - model, model: fitted model evaluated at the data points
+FitResult = collections.namedtuple('FitResult', ['params', 'cov', 'residuals', 'model'])
+
+
+class FitCache(object):
+	"""Per session cache for bead localization results.
+
+	Results are stored per volume (compared by identity, i.e. the same numpy.ndarray object) and keyed by
+	the rounded x,y coordinate, the localization method, the cutout and the threshold. The smoothed volumes
+	of getzRobust (passed the cache as cache=) are kept here as well. Entries of volumes that are not loaded
+	anymore are dropped with prune(). Volumes changed in place need a clear(), as they are the same object.
+
+	Usage:
+		cache = FitCache()
+		z = cache.lookup(img,x,y,'gauss',None,None,getzGauss,x,y,img)
+		z, confidence = getzRobust(x,y,img,cache=cache)
+		## fits cached with the result, so that they can be drawn again on a cache hit
+		z, fits = cache.lookup(img,x,y,'gaussFits',None,None,getzGauss,x,y,img,returnFits=True)
+		plotFits(parent,fits)
+	"""
+
+	def __init__(self,decimals=1):
+		## x,y are rounded to this number of decimals for the key
+		self.decimals = decimals
+		## list of (volume, {key: result}) pairs. A list (and not a dict keyed by id()) keeps a reference
+		## to the volume, so the id of a cached volume can not be reused by a newly loaded one.
+		self._volumes = []
+		## list of (volume, smooth, smoothed volume) of smoothVolume()
+		self._smoothed = []
+		self.hits = 0
+		self.misses = 0
+
+	def __len__(self):
+		return sum(len(entries) for vol, entries in self._volumes)
+
+	def _entries(self,img):
+		for vol, entries in self._volumes:
+			if vol is img:
+				return entries
+		entries = {}
+		self._volumes.append((img, entries))
+		return entries
+
+	def key(self,x,y,method,cutout=None,threshold=None):
+		return (round(x,self.decimals), round(y,self.decimals), method, cutout, threshold)
+
+	def lookup(self,img,x,y,method,cutout,threshold,func,*args,**kwargs):
+		"""Return the cached result for img at x,y or call func(*args,**kwargs) and cache its result"""
+		entries = self._entries(img)
+		key = self.key(x,y,method,cutout,threshold)
+		if key in entries:
+			self.hits += 1
+			instrument.count('localization.cacheHit')
+			if clrmsg and debug is True: print clrmsg.DEBUG + 'Localization cache hit:', key
+			return entries[key]
+		self.misses += 1
+		instrument.count('localization.cacheMiss')
+		result = func(*args,**kwargs)
+		entries[key] = result
+		return result
+
+	def smoothVolume(self,img,smooth=1.):
+		"""Return smoothVolume(img,smooth), calculated only once per volume and sigma"""
+		for vol, sigma, smoothed in self._smoothed:
+			if vol is img and sigma == smooth and smoothed.shape == img.shape:
+				return smoothed
+		smoothed = smoothVolume(img,smooth)
+		self._smoothed.append((img, smooth, smoothed))
+		return smoothed
+
+	def prune(self,volumes):
+		"""Drop all entries of volumes that are not in volumes (e.g. after loading a new image stack)"""
+		self._volumes = [(vol, entries) for vol, entries in self._volumes if any(vol is v for v in volumes)]
+		self._smoothed = [entry for entry in self._smoothed if any(entry[0] is v for v in volumes)]
+
+	def clear(self):
+		self._volumes = []
+		self._smoothed = []
+
+
+@instrument.timed('localization.getzPoly')
 def getzPoly(x,y,img,n=None,optimize=False):
 	"""x and y are coordinates
 	img is the path to the z-stack tiff file or a numpy.ndarray from tifffile.py imread function
@@ -91,12 +176,15 @@ def getzPoly(x,y,img,n=None,optimize=False):
 		return data_z_xp_poly
 
 
-def getzGauss(x,y,img,parent=None,optimize=False,threshold=None,threshVal=0.6,cutout=15):
+@instrument.timed('localization.getzGauss')
+def getzGauss(x,y,img,parent=None,optimize=False,threshold=None,threshVal=0.6,cutout=15,returnFits=False):
 	"""x and y are coordinates
 	img is the path to the z-stack tiff file or a numpy.ndarray from tifffile.py imread function
 	optimize == True kicks off the 2D Gaussian fit and this function will return x,y,z
 	threshold == True filters the image where it cuts off at max - min * threshVal (threshVal between 0.1 and 1)
-	cutout specifies the FOV for the 2D Gaussian fit"""
+	cutout specifies the FOV for the 2D Gaussian fit
+	returnFits == True additionally returns the final fits (see plotFits), e.g. to cache them with the result
+	and draw them again later: z,fits or (x,y,z),fits"""
 
 	if not isinstance(img, str) and not isinstance(img, np.ndarray):
 		if clrmsg and debug is True: print clrmsg.ERROR
@@ -104,36 +192,169 @@ def getzGauss(x,y,img,parent=None,optimize=False,threshold=None,threshVal=0.6,cu
 	elif isinstance(img, str):
 		img = tf.imread(img)
 
+	def finish(value,fits):
+		## Only fitting in the loop, the final fit is drawn once in parent (if given)
+		if parent is not None:
+			plotFits(parent,fits)
+		return (value, fits) if returnFits else value
+
 	data_z = img[:,y,x]
-	data = np.array([np.arange(len(data_z)), data_z])
-	poptZ, pcov = gaussfit(data,parent)
+	dataZ = np.array([np.arange(len(data_z)), data_z])
+	resultZ = fitGauss1D(dataZ)
 
 	if optimize is False:
-		return poptZ[1]
+		return finish(resultZ.params[1], [(plotGauss1D, (dataZ, resultZ), {})])
 	else:
 		repeats = 5
-		if clrmsg and debug is True: print clrmsg.DEBUG + '2D Gaussian xy optimization running %.f at z = %.f' % (repeats,round(poptZ[1]))
+		if clrmsg and debug is True: print clrmsg.DEBUG + '2D Gaussian xy optimization running %.f at z = %.f' % (repeats,round(resultZ.params[1]))
 		for repeat in range(repeats):
-			data = np.copy(img[
-						round(poptZ[1]),
+			dataXY = np.copy(img[
+						round(resultZ.params[1]),
 						y-cutout:y+cutout,
 						x-cutout:x+cutout])
 			if threshold is not None:
-				threshold = data < data.max()-(data.max()-data.min())*threshVal
-				data[threshold] = 0
-			poptXY = fitgaussian(data,parent)
-			if poptXY is None:
-				return x, y, poptZ[1]
-			(height, xopt, yopt, width_x, width_y) = poptXY
+				mask = dataXY < dataXY.max()-(dataXY.max()-dataXY.min())*threshVal
+				dataXY[mask] = 0
+			resultXY = fitGauss2D(dataXY)
+			if np.isnan(resultXY.params).any():
+				return finish(
+					(x, y, resultZ.params[1]), [(plotGauss1D, (dataZ, resultZ), {}), (plotGauss2D, (dataXY, resultXY), {})])
+			(height, xopt, yopt, width_x, width_y) = resultXY.params
 			## x and y are switched when applying the offset
 			x = x-cutout+yopt
 			y = y-cutout+xopt
 			data_z = img[:,y,x]
-			data = np.array([np.arange(len(data_z)), data_z])
-			poptZ, pcov = gaussfit(data,parent,hold=True)
-			if parent: parent.refreshUI()
-			time.sleep(0.01)
-		return x, y, poptZ[1]
+			dataZ = np.array([np.arange(len(data_z)), data_z])
+			resultZ = fitGauss1D(dataZ)
+		return finish(
+			(x, y, resultZ.params[1]), [(plotGauss1D, (dataZ, resultZ), {}), (plotGauss2D, (dataXY, resultXY), {})])
+
+
+@instrument.timed('localization.getzRobust')
+def getzRobust(x,y,img,parent=None,optimize=False,cutout=15,smooth=1.,cache=None,returnFits=False):
+	"""Robust z localization for low SNR data.
+	x and y are coordinates
+	img is the path to the z-stack tiff file or a numpy.ndarray from tifffile.py imread function
+	optimize == True additionally refines x,y with a 2D Gaussian fit (beadPos2D) in the slice at z
+	cutout specifies the FOV for the x,y refinement
+	smooth is the sigma (in px) of the Gaussian smoothing of the volume
+	cache is an optional FitCache. With a cache, the whole volume is smoothed once and kept for all following
+	calls with the same volume. Without, only a block around x,y (cutout plus the Gaussian kernel, all
+	slices) is smoothed, which gives the same result.
+	returnFits == True additionally returns the final fit (see plotFits): (z,confidence),fits
+
+	The z profile is fitted with a Gaussian plus linear background using a robust (soft L1) loss, so
+	single outliers (hot pixels, neighbouring beads) do not pull the fit. The fit does not fail with NaN,
+	instead a confidence score between 0 and 1 is returned. It is derived from the signal to noise ratio
+	of the fit (fitted amplitude over robust spread of the residuals), 1-exp(-(snr/snrScale)**2).
+	With the default snrScale of 8 an SNR of 4 gives 0.22, an SNR of 8 0.63 and an SNR of 16 0.98.
+	Values below ~0.5 should be checked manually.
+
+	Returns z,confidence or x,y,z,confidence if optimize is True"""
+
+	if not isinstance(img, str) and not isinstance(img, np.ndarray):
+		if clrmsg and debug is True: print clrmsg.ERROR
+		raise TypeError('I can only handle an image path as string or an image volume as numpy.ndarray imported from tifffile.py')
+	elif isinstance(img, str):
+		img = tf.imread(img)
+
+	def smoothed(x,y):
+		## smoothed volume (or block around x,y) and the x,y offset of its origin
+		if cache is not None:
+			return cache.smoothVolume(img,smooth), 0, 0
+		margin = cutout + int(4.0*smooth+0.5) + 1
+		x0, y0 = max(0, int(round(x))-margin), max(0, int(round(y))-margin)
+		return smoothVolume(img[:,y0:int(round(y))+margin+1,x0:int(round(x))+margin+1],smooth), x0, y0
+
+	vol, x0, y0 = smoothed(x,y)
+	data_z = vol[:,int(round(y))-y0,int(round(x))-x0]
+	result, confidence = fitzRobust(data_z)
+
+	if optimize is True:
+		for repeat in range(3):
+			xopt, yopt = beadPos2D.refine(
+				vol[int(round(result.params[1]))],[[x-x0,y-y0]],method='gauss',cutout=cutout)[0] + (x0, y0)
+			if (xopt, yopt) == (x, y):
+				break
+			x, y = xopt, yopt
+			vol, x0, y0 = smoothed(x,y)
+			data_z = vol[:,int(round(y))-y0,int(round(x))-x0]
+			result, confidence = fitzRobust(data_z)
+
+	fits = [(plotGauss1D, (np.array([np.arange(len(data_z)), data_z]), result), dict(label='robust fit'))]
+	if parent is not None:
+		plotFits(parent,fits)
+	if optimize is False:
+		value = result.params[1], confidence
+	else:
+		value = x, y, result.params[1], confidence
+	return (value, fits) if returnFits else value
+
+
+def smoothVolume(img,smooth=1.):
+	"""Returns img smoothed with a 3 slice median along z (removes hot pixels before they get spread)
+	followed by a Gaussian of sigma smooth (float32). Use FitCache.smoothVolume() to calculate it only once
+	per volume."""
+	if clrmsg and debug is True: print clrmsg.DEBUG + 'Smoothing volume with sigma', smooth
+	vol = img.astype(np.float32)
+	if img.shape[0] > 2:
+		## median of 3 as min/max network, much faster than ndimage.median_filter
+		a, b, c = img[:-2], img[1:-1], img[2:]
+		vol[1:-1] = np.maximum(np.minimum(a,b),np.minimum(np.maximum(a,b),c))
+	if smooth > 0:
+		vol = ndimage.gaussian_filter(vol, smooth, output=np.float32, mode='nearest')
+	return vol
+
+
+def gaussLinear(x, *p):
+	# Gaussian on a linear background
+	# A "magnitude", mu "offset on x axis", sigma "width"
+	# c0, c1 "background offset and slope"
+	A, mu, sigma, c0, c1 = p
+	return A*np.exp(-(x-mu)**2/(2.*sigma**2)) + c0 + c1*x
+
+
+def fitzRobust(data_z,snrScale=8.):
+	"""Fit a Gaussian plus linear background to the z profile data_z with a soft L1 loss.
+	Returns a FitResult (params: A, mu, sigma, c0, c1, see gaussLinear) and a confidence score
+	between 0 and 1. If the fit fails, mu is the position of the maximum and the confidence is 0."""
+	data_z = np.asarray(data_z, dtype=np.float64)
+	z = np.arange(len(data_z), dtype=np.float64)
+	## robust noise estimate from the median absolute deviation of the first differences
+	noise = 1.4826*np.median(np.abs(np.diff(data_z) - np.median(np.diff(data_z))))/np.sqrt(2)
+	if noise == 0:
+		noise = max(data_z.std(), 1e-6)
+	background = np.median(data_z)
+	failed = FitResult(np.array([0., float(data_z.argmax()), 0.5, background, 0.]), None, None, None), 0.
+	p0 = [max(data_z.max()-background, noise), float(data_z.argmax()), 2., background, 0.]
+	bounds = (
+		[0, 0, 0.5, -np.inf, -np.inf],
+		[np.inf, len(data_z)-1, len(data_z), np.inf, np.inf])
+	try:
+		res = least_squares(
+			lambda p: gaussLinear(z, *p) - data_z, p0, bounds=bounds, loss='soft_l1', f_scale=noise)
+		popt = res.x
+	except Exception as e:
+		if clrmsg and debug is True: print clrmsg.ERROR + 'Robust fit failed: ' + str(e)
+		return failed
+
+	if not np.isfinite(popt).all():
+		return failed
+	## signal to noise ratio of the fit with a robust residual spread (not inflated by outliers) as noise
+	residuals = res.fun
+	spread = 1.4826*np.median(np.abs(residuals - np.median(residuals)))
+	snr = popt[0]/spread if spread > 0 else np.inf
+	confidence = 1 - np.exp(-(snr/snrScale)**2)
+	cov = np.linalg.pinv(np.dot(res.jac.T, res.jac))*spread**2
+
+	if clrmsg and debug is True:
+		print clrmsg.DEBUG + '='*15, 'ROBUST GAUSS FIT', '='*18
+		print clrmsg.DEBUG + 'Amplitude		:', popt[0]
+		print clrmsg.DEBUG + 'Location		:', popt[1]
+		print clrmsg.DEBUG + 'FWHM			:', popt[2] * 2 * math.sqrt(2 * math.log(2,math.e))
+		print clrmsg.DEBUG + 'Background		:', popt[3], popt[4]
+		print clrmsg.DEBUG + 'Confidence		:', confidence
+	return FitResult(popt, cov, -residuals, data_z + residuals), confidence
 
 
 def optimize_z(x,y,z,image,n=None):
@@ -291,22 +512,21 @@ def gauss(x, *p):
 
 
 def gaussfit(data,parent=None,hold=False):
-	## Fitting gaussian to data
-	data[1] = data[1]-data[1].min()
-	p0 = [data[1].max(), data[1].argmax(), 1]
-	popt, pcov = curve_fit(gauss, data[0], data[1], p0=p0)
-
+	"""Fit gaussian to data (data[0] = x, data[1] = y), the minimum of y is used as background.
+	Returns popt, pcov. Use fitGauss1D for the full FitResult."""
+	result = fitGauss1D(data)
 	if parent is not None:
-		## Draw graphs in GUI
-		x = []
-		y = []
-		for i in np.arange(len(data[0])):
-			x.append(i)
-			y.append(gauss(i,*popt))
-		if hold is False:
-			parent.widget_matplotlib.setupScatterCanvas(width=4,height=4,dpi=52,toolbar=False)
-		parent.widget_matplotlib.xyPlot(data[0], data[1], label='z data',clear=True)
-		parent.widget_matplotlib.xyPlot(x, y, label='gaussian fit',clear=False)
+		plotGauss1D(parent,data,result,hold=hold)
+	return result.params, result.cov
+
+
+def fitGauss1D(data):
+	"""Fit gaussian to data (data[0] = x, data[1] = y), the minimum of y is used as background.
+	Returns a FitResult with params A, mu, sigma (see gauss); residuals and model are background corrected."""
+	y = data[1]-data[1].min()
+	p0 = [y.max(), y.argmax(), 1]
+	popt, pcov = curve_fit(gauss, data[0], y, p0=p0)
+	model = gauss(data[0], *popt)
 
 	## DEBUG
 	if clrmsg and debug is True:
@@ -321,9 +541,28 @@ def gaussfit(data,parent=None,hold=False):
 		print clrmsg.DEBUG + 'Std. Amplitude	:', std_height
 		print clrmsg.DEBUG + 'Std. Location	:', std_mean
 		print clrmsg.DEBUG + 'Std. FWHM		:', std_sigma * 2 * math.sqrt(2 * math.log(2,math.e))
-		print clrmsg.DEBUG + 'Mean dy		:', np.absolute(y-data[1]).mean()
-		print clrmsg.DEBUG + str(ks_2samp(y, data[1]))
-	return popt, pcov
+		print clrmsg.DEBUG + 'Mean dy		:', np.absolute(model-y).mean()
+		print clrmsg.DEBUG + str(ks_2samp(model, y))
+	return FitResult(popt, pcov, y-model, model)
+
+
+def plotFits(parent,fits):
+	"""Draw fits in parent.widget_matplotlib. fits is a list of (plot function, args, kwargs), e.g.
+	(plotGauss1D, (data, result), {}) as returned by getzGauss and getzRobust with returnFits=True."""
+	for plot, args, kwargs in fits:
+		plot(parent,*args,**kwargs)
+
+
+def plotGauss1D(parent,data,result,hold=False,label='gaussian fit'):
+	"""Draw data (data[0] = x, data[1] = y) and the fitted model of result in parent.widget_matplotlib"""
+	if hold is False:
+		parent.widget_matplotlib.setupScatterCanvas(width=4,height=4,dpi=52,toolbar=False)
+	if result.model is None:
+		parent.widget_matplotlib.xyPlot(data[0], data[1], label='z data (fit failed)',clear=True)
+		return
+	## plot the data the way it was fitted (i.e. background corrected for fitGauss1D)
+	parent.widget_matplotlib.xyPlot(data[0], result.model+result.residuals, label='z data',clear=True)
+	parent.widget_matplotlib.xyPlot(data[0], result.model, label=label,clear=False)
 
 
 ## Gaussian 2D fit from http://scipy.github.io/old-wiki/pages/Cookbook/FittingData
@@ -353,30 +592,47 @@ def moments(data):
 
 def fitgaussian(data,parent=None):
 	"""Returns (height, x, y, width_x, width_y)
-	the Gaussian parameters of a 2D distribution found by a fit"""
+	the Gaussian parameters of a 2D distribution found by a fit
+	or None if the fit failed. Use fitGauss2D for the full FitResult."""
+	result = fitGauss2D(data)
+	if parent is not None:
+		plotGauss2D(parent,data,result)
+	if np.isnan(result.params).any():
+		return None
+	return result.params
+
+
+def fitGauss2D(data):
+	"""Fit a 2D Gaussian to data, start values from moments().
+	Returns a FitResult with params (height, x, y, width_x, width_y). If the fit failed params contain NaN."""
+	indices = np.indices(data.shape)
 
 	def errorfunction(p):
-		return np.ravel(gaussian(*p)(*np.indices(data.shape)) - data)
+		return np.ravel(gaussian(*p)(*indices) - data)
 
 	params = moments(data)
-	p, success = leastsq(errorfunction, params)
-	if np.isnan(p).any():
+	p, cov, infodict, mesg, ier = leastsq(errorfunction, params, full_output=True)
+	model = gaussian(*p)(*indices)
+	residuals = data - model
+	if cov is not None and data.size > len(p):
+		cov = cov*(residuals**2).sum()/(data.size-len(p))
+	return FitResult(p, cov, residuals, model)
+
+
+def plotGauss2D(parent,data,result):
+	"""Draw data and the contour of the fitted 2D Gaussian of result in parent.widget_matplotlib"""
+	if np.isnan(result.params).any():
 		parent.widget_matplotlib.matshowPlot(
 			mat=data,contour=np.ones(data.shape),labelContour="XY optimization failed\n" +
 			"Try reducing the\nmarker size (equates to\nFOV for gaussian fit)")
-		return None
-	if parent is not None:
-		## Draw graphs in GUI
-		fit = gaussian(*p)
-		contour = fit(*np.indices(data.shape))
-		(height, x, y, width_x, width_y) = p
-		labelContour = (
-						"      x : %.1f\n"
-						"      y : %.1f\n"
-						"width_x : %.1f\n"
-						"width_y : %.1f") % (x, y, width_x, width_y)
-		parent.widget_matplotlib.matshowPlot(mat=data,contour=contour,labelContour=labelContour)
-	return p
+		return
+	(height, x, y, width_x, width_y) = result.params
+	labelContour = (
+					"      x : %.1f\n"
+					"      y : %.1f\n"
+					"width_x : %.1f\n"
+					"width_y : %.1f") % (x, y, width_x, width_y)
+	parent.widget_matplotlib.matshowPlot(mat=data,contour=result.model,labelContour=labelContour)
 
 
 # def test1Dgauss(data=None):
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Sub-pixel refinement of marker positions in 2D images (e.g. SEM/FIB images)
+import beadPos2D.py and call coords = beadPos2D.refine(img,coords,method='radialsymmetry') to refine
+all markers in one go. coords is an array with one x,y (or x,y,z) row per marker, z is left untouched.
+
+All markers are processed at once: a (n,2*cutout+1,2*cutout+1) stack of cutouts around the markers is
+extracted and every method works on the whole stack with vectorized numpy operations.
+
+Available methods:
+	centroid		: background corrected intensity weighted centroid
+	gauss			: 2D Gaussian plus constant background fitted with a batched Gauss-Newton/Levenberg-Marquardt
+	radialsymmetry	: radial symmetry center (Parthasarathy, Nature Methods 9, 724-726 (2012))
+
+# @Title			: beadPos2D
+# @Project			: 3DCTv2
+# @Description		: Sub-pixel refinement of marker positions in 2D images
+# @Author			: Jan Arnold
+# @Email			: jan.arnold (at) coraxx.net
+# @Copyright		: Copyright (C) 2016  Jan Arnold
+# @License			: GPLv3 (see LICENSE file)
+# @Credits			: Raghuveer Parthasarathy for the radial symmetry algorithm
+# @Maintainer		: Jan Arnold
+# @Date				: 2016/10
+# @Version			: 3DCT 2.3.0 module rev. 2
+# @Status			: development
+# @Usage			: import beadPos2D.py and call coords = beadPos2D.refine(img,coords,method='radialsymmetry')
+# @Notes			: markers whose refined position moves further than cutout or can not be refined
+# 					  (NaN) keep their original position
+# @Python_version	: 2.7.11
+"""
+# ======================================================================================================================
+
+import time
+import numpy as np
+from scipy import ndimage
+import tifffile as tf
+
+try:
+	import clrmsg
+	import TDCT_debug
+	import instrument
+except:
+	pass
+
+debug = TDCT_debug.debug
+
+methods = ['centroid', 'gauss', 'radialsymmetry']
+
+
+@instrument.timed('localization.refine2D')
+def refine(img,coords,method='radialsymmetry',cutout=10):
+	"""Refine x,y of all markers in coords.
+
+	img is the path to the 2D tiff file or a numpy.ndarray (grey scale or RGB(A), RGB is averaged)
+	coords is an array like with one x,y or x,y,z row per marker, e.g. model2np() of the marker table
+	method is one of 'centroid', 'gauss' or 'radialsymmetry'
+	cutout is half the size of the area around each marker used for the refinement
+
+	Returns a numpy.ndarray with the same shape as coords and the refined x,y positions."""
+
+	if not isinstance(img, str) and not isinstance(img, np.ndarray):
+		if clrmsg and debug is True: print clrmsg.ERROR
+		raise TypeError('I can only handle an image path as string or an image as numpy.ndarray imported from tifffile.py')
+	elif isinstance(img, str):
+		img = tf.imread(img)
+	if method not in methods:
+		raise ValueError('Unknown refinement method "{0}". Choose one of {1}'.format(method, methods))
+
+	if img.ndim == 3 and img.shape[-1] in (3,4):
+		img = img[...,:3].mean(axis=-1)
+	elif img.ndim != 2:
+		raise ValueError('Expected a 2D image, got an array with shape {0}'.format(img.shape))
+
+	coords = np.array(coords, dtype=np.float64, ndmin=2)
+	refined = coords.copy()
+	if coords.size == 0:
+		return refined
+
+	if debug is True: ping = time.time()
+
+	cutout = int(cutout)
+	stack, origin = cutouts(img, coords[:,:2], cutout)
+	if method == 'centroid':
+		xy = centroid(stack)
+	elif method == 'gauss':
+		xy = gauss2D(stack)
+	elif method == 'radialsymmetry':
+		xy = radialSymmetry(stack)
+
+	xy += origin
+	valid = np.isfinite(xy).all(axis=1) & (np.abs(xy - coords[:,:2]) <= cutout).all(axis=1)
+	refined[valid,:2] = xy[valid]
+	instrument.count('localization.refine2D.markers', len(coords))
+
+	if clrmsg and debug is True:
+		print clrmsg.DEBUG + '2D refinement (%s): %.f of %.f markers refined in %.3f s' % (
+			method, valid.sum(), len(coords), time.time()-ping)
+		if not valid.all():
+			print clrmsg.DEBUG + 'Not refined (kept original position):', np.nonzero(~valid)[0] + 1
+	return refined
+
+
+def cutouts(img,xy,cutout):
+	"""Returns a stack of (2*cutout+1)x(2*cutout+1) float cutouts centered at the rounded positions xy
+	(array of shape (n,2) with x,y) and the x,y origin (upper left pixel) of each cutout.
+	Cutouts reaching over the image border are padded with the border values."""
+	center = np.round(xy).astype(int)
+	offsets = np.arange(-cutout, cutout+1)
+	rows = np.clip(center[:,1,np.newaxis] + offsets, 0, img.shape[0]-1)
+	cols = np.clip(center[:,0,np.newaxis] + offsets, 0, img.shape[1]-1)
+	stack = img[rows[:,:,np.newaxis], cols[:,np.newaxis,:]].astype(np.float64)
+	return stack, center - cutout
+
+
+def centroid(stack):
+	"""Background (minimum) corrected, intensity weighted centroid of every image in stack.
+	Returns a numpy.ndarray of shape (n,2) with x,y in cutout pixel coordinates."""
+	data = stack - stack.min(axis=(1,2))[:,np.newaxis,np.newaxis]
+	total = data.sum(axis=(1,2))
+	Y, X = np.indices(stack.shape[1:])
+	with np.errstate(divide='ignore', invalid='ignore'):
+		x = (data*X).sum(axis=(1,2))/total
+		y = (data*Y).sum(axis=(1,2))/total
+	return np.column_stack((x, y))
+
+
+def gauss2D(stack,iterations=20):
+	"""Fit a 2D Gaussian plus constant background to every image in stack.
+
+	The model is height*exp(-((x-x0)**2/(2*sx**2)+(y-y0)**2/(2*sy**2)))+background. All fits are done
+	simultaneously with a damped Gauss-Newton (Levenberg-Marquardt) iteration, the start values come
+	from the background corrected moments (see beadPos.moments()).
+	Returns a numpy.ndarray of shape (n,2) with x,y in cutout pixel coordinates."""
+	n = stack.shape[0]
+	Y, X = np.indices(stack.shape[1:])
+	X = X.ravel().astype(np.float64)
+	Y = Y.ravel().astype(np.float64)
+	data = stack.reshape(n, -1)
+
+	## start values from moments
+	background = data.min(axis=1)
+	signal = data - background[:,np.newaxis]
+	total = signal.sum(axis=1)
+	total[total == 0] = 1
+	x0 = (signal*X).sum(axis=1)/total
+	y0 = (signal*Y).sum(axis=1)/total
+	sx = np.sqrt(np.abs((signal*(X-x0[:,np.newaxis])**2).sum(axis=1)/total))
+	sy = np.sqrt(np.abs((signal*(Y-y0[:,np.newaxis])**2).sum(axis=1)/total))
+	## p = height, x0, y0, sx, sy, background
+	p = np.column_stack((signal.max(axis=1), x0, y0, np.maximum(sx, 1), np.maximum(sy, 1), background))
+
+	def residualsJacobian(p):
+		dx = X - p[:,1,np.newaxis]
+		dy = Y - p[:,2,np.newaxis]
+		sx2 = p[:,3,np.newaxis]**2
+		sy2 = p[:,4,np.newaxis]**2
+		g = np.exp(-(dx**2/(2*sx2) + dy**2/(2*sy2)))
+		hg = p[:,0,np.newaxis]*g
+		res = hg + p[:,5,np.newaxis] - data
+		jac = np.empty((n, X.size, 6))
+		jac[:,:,0] = g
+		jac[:,:,1] = hg*dx/sx2
+		jac[:,:,2] = hg*dy/sy2
+		jac[:,:,3] = hg*dx**2/(sx2*p[:,3,np.newaxis])
+		jac[:,:,4] = hg*dy**2/(sy2*p[:,4,np.newaxis])
+		jac[:,:,5] = 1
+		return res, jac
+
+	lam = np.ones(n)*1e-3
+	res, jac = residualsJacobian(p)
+	cost = (res**2).sum(axis=1)
+	for i in range(iterations):
+		JtJ = np.einsum('nki,nkj->nij', jac, jac)
+		Jtr = np.einsum('nki,nk->ni', jac, res)
+		A = JtJ + lam[:,np.newaxis,np.newaxis]*(JtJ*np.eye(6))
+		A += np.eye(6)*1e-12
+		step = np.linalg.solve(A, -Jtr[:,:,np.newaxis])[:,:,0]
+		pNew = p + step
+		resNew, jacNew = residualsJacobian(pNew)
+		costNew = (resNew**2).sum(axis=1)
+		better = np.isfinite(costNew) & (costNew < cost)
+		p[better], res[better], jac[better], cost[better] = pNew[better], resNew[better], jacNew[better], costNew[better]
+		lam = np.where(better, lam/10., lam*10.)
+	return p[:,1:3].copy()
+
+
+def radialSymmetry(stack):
+	"""Radial symmetry center of every image in stack (Parthasarathy, Nature Methods 9, 724-726 (2012)).
+
+	Intensity gradients are calculated along the 45 degree rotated axes at the pixel corners, every gradient
+	defines a line and the center is the point with the least weighted squared distance to all lines.
+	Returns a numpy.ndarray of shape (n,2) with x,y in cutout pixel coordinates."""
+	n, Ny, Nx = stack.shape
+	## coordinates of the pixel corners (between pixels), relative to the cutout center
+	xm = np.arange(-(Nx-1)/2.0+0.5, (Nx-1)/2.0)[np.newaxis,:].repeat(Ny-1, axis=0)
+	ym = np.arange(-(Ny-1)/2.0+0.5, (Ny-1)/2.0)[:,np.newaxis].repeat(Nx-1, axis=1)
+
+	dIdu = stack[:,:Ny-1,1:] - stack[:,1:,:Nx-1]
+	dIdv = stack[:,:Ny-1,:Nx-1] - stack[:,1:,1:]
+	## smoothing of the gradients (3x3 box, zero padded)
+	fdu = ndimage.uniform_filter(dIdu, size=(1,3,3), mode='constant')
+	fdv = ndimage.uniform_filter(dIdv, size=(1,3,3), mode='constant')
+	dImag2 = fdu**2 + fdv**2
+
+	## slope of the gradient lines
+	with np.errstate(divide='ignore', invalid='ignore'):
+		m = -(fdv + fdu)/(fdu - fdv)
+	m[np.isnan(m)] = 0
+	infinite = np.isinf(m)
+	if infinite.any():
+		finite = m[~infinite]
+		m[infinite] = 10*np.abs(finite).max() if finite.size else 1e10
+	## y intercept of the gradient lines
+	b = ym - m*xm
+
+	## weighting by gradient magnitude and distance to the gradient weighted centroid
+	sdI2 = dImag2.sum(axis=(1,2))
+	with np.errstate(divide='ignore', invalid='ignore'):
+		xcentroid = (dImag2*xm).sum(axis=(1,2))/sdI2
+		ycentroid = (dImag2*ym).sum(axis=(1,2))/sdI2
+		w = dImag2/np.sqrt((xm-xcentroid[:,np.newaxis,np.newaxis])**2 + (ym-ycentroid[:,np.newaxis,np.newaxis])**2)
+
+		## weighted least squares solution for the point closest to all lines
+		wm2p1 = w/(m**2+1)
+		sw = wm2p1.sum(axis=(1,2))
+		smmw = (m**2*wm2p1).sum(axis=(1,2))
+		smw = (m*wm2p1).sum(axis=(1,2))
+		smbw = (m*b*wm2p1).sum(axis=(1,2))
+		sbw = (b*wm2p1).sum(axis=(1,2))
+		det = smw**2 - smmw*sw
+		xc = (smbw*sw - smw*sbw)/det
+		yc = (smbw*smw - smmw*sbw)/det
+
+	return np.column_stack((xc + (Nx-1)/2.0, yc + (Ny-1)/2.0))
@@ -0,0 +1,617 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Reproducible benchmarks of the correlation solvers and the image pipeline.
+Every benchmark case builds synthetic data from a fixed seed (marker sets with varying number of markers,
+noise and outliers, image stacks with known bead positions), times the call and measures its accuracy
+against the known ground truth. Results are appended to a JSON history file, so that the last run can be
+compared to the previous one to catch regressions and to quantify speedups.
+
+Run all benchmarks from the command line:
+	python -m tdct.benchmark --history benchmark_history.json
+or a quick subset (smaller data, also used by the tests):
+	python -m tdct.benchmark --quick --filter find_32
+
+# @Title			: benchmark
+# @Project			: 3DCTv2
+# @Description		: Benchmark suite for the correlation solvers and the image pipeline
+# @Author			: Jan Arnold
+# @Email			: jan.arnold (at) coraxx.net
+# @Copyright		: Copyright (C) 2016  Jan Arnold
+# @License			: GPLv3 (see LICENSE file)
+# @Credits			:
+# @Maintainer		: Jan Arnold
+# @Date				: 2016/10
+# @Version			: 3DCT 2.3.0 module rev. 7
+# @Status			: development
+# @Usage			: python -m tdct.benchmark [--quick] [--history FILE] [--filter NAME] [--repeat N]
+# 					  or import benchmark.py and call run = benchmark.run(history='benchmark_history.json')
+# @Notes			: Peak memory is the increase of the peak resident set size of the process running the
+# 					  case (resource module, not available on Windows). Cases are run in a separate process
+# 					  (isolate=True), otherwise only new peaks of the current process are seen.
+# 					  Cases whose modules can not be imported (e.g. stackProcessing without PyQt4) are
+# 					  recorded as skipped.
+# @Python_version	: 2.7.11
+"""
+# ======================================================================================================================
+
+import os
+import sys
+import json
+import time
+import Queue
+import timeit
+import platform
+import argparse
+import subprocess
+import collections
+import multiprocessing
+import numpy as np
+import scipy
+
+try:
+	import resource
+except ImportError:
+	resource = None
+
+## Adding execution directory, so that the tdct modules are found if this file is run as a script
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+try:
+	import clrmsg
+	import TDCT_debug
+except:
+	pass
+
+debug = TDCT_debug.debug
+
+## name: unique name of the case (stored in the history), func: setup function returning (run, evaluate),
+## params: keyword arguments of func
+Case = collections.namedtuple('Case', ['name', 'func', 'params'])
+
+
+## Synthetic data ======================================================================================================
+
+def markerSet(n=10,noise=1.,outliers=0.,seed=0):
+	"""Synthetic 3D and 2D marker sets (dim_point layout) related by a known rigid transformation.
+
+	n markers are placed in a 3D volume of 200x200x50 px, noise is the sd of the gaussian noise (px) added
+	to the 2D markers and outliers is the fraction of markers whose 2D position is moved by 20 to 50 px.
+	Returns (x, y, truth) with truth a dict of q (rotation), s (scale), d (translation) and the indices of
+	the outliers."""
+	from pyto.rigid_3d import Rigid3D
+	random_state = np.random.RandomState(seed)
+	x = random_state.uniform([0, 0, 0], [200, 200, 50], (n, 3)).T
+	q = Rigid3D.make_r_ck(Rigid3D.make_quasi_random_ck(size=1, random_state=random_state)[0])
+	s = random_state.uniform(0.5, 2.)
+	d = random_state.uniform(-100, 100, 2)
+	y = s*np.dot(q, x)[:2] + d[:,np.newaxis] + noise*random_state.standard_normal((2, n))
+	nOutliers = int(round(outliers*n))
+	outlierIdx = random_state.choice(n, nOutliers, replace=False)
+	shift = random_state.uniform(20, 50, nOutliers)*np.sign(random_state.uniform(-1, 1, (2, nOutliers)))
+	y[:,outlierIdx] += shift
+	return x, y, dict(q=q, s=s, d=d, outliers=np.sort(outlierIdx))
+
+
+def beadStack(shape=(40,64,64),beads=8,sigma=(2.,1.5,1.5),noise=0.02,seed=0):
+	"""Synthetic z-stack (float32, z,y,x) or 2D image (shape y,x) with gaussian beads of height 1 at known
+	sub-pixel positions plus gaussian noise of sd noise. Beads are placed on a regular x,y grid (shifted by
+	up to half a pixel) at least 3 sigma + 7 px away from the x,y border, at random z at least 3 sigma away
+	from the z border. Beads are only added within 5 sigma of their center and the noise is drawn slice by
+	slice, so that large stacks (e.g. 2048x2048x100) can be built.
+	Returns (img, positions) with positions an array of x,y,z (or x,y for 2D images) rows."""
+	random_state = np.random.RandomState(seed)
+	sigma = np.array(sigma)[-len(shape):]
+	nGrid = int(np.ceil(np.sqrt(beads)))
+	ticks = [np.linspace(3*sd+7, size-8-3*sd, nGrid) for size, sd in zip(shape[-2:], sigma[-2:])]
+	centers = np.array([(y, x) for y in ticks[0] for x in ticks[1]][:beads])
+	centers += random_state.uniform(-0.5, 0.5, centers.shape)
+	if len(shape) == 3:
+		z = random_state.uniform(3*sigma[0], shape[0]-1-3*sigma[0], beads)
+		centers = np.column_stack((z, centers))
+	img = np.empty(shape, dtype=np.float32)
+	for i in range(shape[0]):
+		img[i] = noise*random_state.standard_normal(shape[1:])
+	for center in centers:
+		box = [slice(max(0, int(c-5*sd)), min(size, int(c+5*sd)+2)) for c, sd, size in zip(center, sigma, shape)]
+		bead = np.ones([one.stop-one.start for one in box], dtype=np.float32)
+		for axis, (one, c, sd) in enumerate(zip(box, center, sigma)):
+			profile = np.exp(-(np.arange(one.start, one.stop, dtype=np.float32)-c)**2/(2*sd**2))
+			bead *= profile.reshape([-1 if other == axis else 1 for other in range(len(shape))])
+		img[tuple(box)] += bead
+	return img, centers[:,::-1].copy()
+
+
+def smoothStack(shape=(20,64,64),seed=0):
+	"""Synthetic z-stack (float32, z,y,x) of a smooth function and the function itself (f(z,y,x) for
+	arrays of coordinates), used to measure the accuracy of the z interpolation."""
+	random_state = np.random.RandomState(seed)
+	phase = random_state.uniform(0, 2*np.pi, 3)
+
+	def f(z, y, x):
+		return 2 + np.sin(0.3*z+phase[0])*np.cos(0.1*y+phase[1]) + 0.5*np.sin(0.07*x+phase[2])
+	img = f(*np.indices(shape)).astype(np.float32)
+	return img, f
+
+
+## Benchmark cases =====================================================================================================
+
+def benchFind32(n=10,noise=1.,outliers=0.,mode='batch_ck',robust=False,seed=0):
+	"""Rigid3D.find_32() (or find_32_ransac() if robust) with the settings of correlation.main().
+	Accuracy: rotation error (deg), relative scale error, rms error of the inliers (px) and the error of
+	correlated points of interest (px) compared to the known transformation."""
+	from pyto.rigid_3d import Rigid3D
+	x, y, truth = markerSet(n=n, noise=noise, outliers=outliers, seed=seed)
+	findArgs = dict(
+		mode=mode, randome='quasi', einit='gl2', einit_dist=0.1, randoms=True, sinit='gl2', ninit=10,
+		random_state=seed)
+	pois = np.random.RandomState(seed+1).uniform([0, 0, 0], [200, 200, 50], (5, 3)).T
+
+	def run():
+		if robust:
+			return Rigid3D.find_32_ransac(x=x, y=y, **findArgs)
+		return Rigid3D.find_32(x=x, y=y, **findArgs)
+
+	def evaluate(transf):
+		inliers = np.setdiff1d(np.arange(n), truth['outliers'])
+		cos = (np.trace(np.dot(transf.q.T, truth['q'])) - 1)/2.
+		poisTrue = truth['s']*np.dot(truth['q'], pois)[:2] + truth['d'][:,np.newaxis]
+		return dict(
+			rotation_error=float(np.degrees(np.arccos(np.clip(cos, -1, 1)))),
+			scale_error=float(abs(transf.s_scalar/truth['s'] - 1)),
+			rms_error=float(np.sqrt(((transf.transform(x=x[:,inliers])[:2] - y[:,inliers])**2).sum(axis=0).mean())),
+			poi_error=float(np.sqrt(((transf.transform(x=pois)[:2] - poisTrue)**2).sum(axis=0)).max()))
+	return run, evaluate
+
+
+def benchCkSolver(mode='constr_ck',starts=50,seed=0):
+	"""Rigid3D.find_32_constr_ck() ('constr_ck', SLSQP) or find_32_unconstr_ck() ('unconstr_ck', L-BFGS-B)
+	started from the same random rotations and scales. The marker sets are the exact 5 markers of
+	test_rigid_3d (test_find_32_unconstr_ck) transformed by the rotation and scale used there and by three
+	further ones, each solved from starts initial parameters.
+	Accuracy: mean number of iterations (nit) and fraction of runs that find the transformation (success:
+	rotation matrix and relative scale within 1e-3)."""
+	from pyto.rigid_3d import Rigid3D
+	x = np.array([[3.2, 7.8, 0.3, 4, 5], [1.3, 3.6, 5.4, 6, 3.8], [0.1, 0.5, 0.8, 0.2, 0.3]])
+	transforms = [([-123, 32, 168], 56.), ([160, 0, 0], 12.3), ([30, -60, 45], 1.7), ([-90, 10, 200], 0.8)]
+	random_state = np.random.RandomState(seed)
+	sets = []
+	for angles, scale in transforms:
+		r = Rigid3D.make_r_euler(np.radians(angles), mode='x')
+		inits = Rigid3D.make_init_ck_multi(ninit=starts, randome=True, randoms=True, random_state=random_state)
+		sets.append((scale*np.dot(r, x)[:2], r, scale, inits))
+	solver = Rigid3D.find_32_unconstr_ck if mode == 'unconstr_ck' else Rigid3D.find_32_constr_ck
+
+	def run():
+		return [[solver(x=x, y=y, init=init, cm=True) for init in inits] for y, r, scale, inits in sets]
+
+	def evaluate(results):
+		nit = []
+		success = []
+		for (y, r, scale, inits), transfs in zip(sets, results):
+			for transf in transfs:
+				nit.append(transf.optimizeResult.nit)
+				success.append(np.abs(transf.q - r).max() < 1e-3 and abs(transf.s_scalar/scale - 1) < 1e-3)
+		return dict(nit=float(np.mean(nit)), success=float(np.mean(success)))
+	return run, evaluate
+
+
+def benchCorrelationMain(cube='analytic',seed=0):
+	"""correlation.main() with imageProps (3D markers of the volume padded to a cube) and without uncertainty,
+	on the exact markers of test_correlation. 'analytic' derives the cube transformation from the first
+	solution (cubeTransform()), 'refit' runs Rigid3D.find_32() a second time on the shifted markers (as
+	main() did before).
+	Accuracy: rms error of the markers (px) and error of the translation for the rotation center
+	(modified_translation, px) compared to the known transformation."""
+	from pyto.rigid_3d import Rigid3D
+	from tdct import correlation
+	markers_3d = np.array([
+		[32., 13., 1.], [78., 36., 5.], [3., 54., 8.], [40., 60., 2.], [50., 38., 3.], [21., 75., 6.]])
+	angles = np.array([-123, 32, 168])*np.pi/180
+	markers_2d = (1.7*np.dot(Rigid3D.make_r_euler(angles), markers_3d.T) + np.array([[300.], [-40.], [0.]])).T
+	spots_3d = np.array([[20., 30., 4.]])
+	rotationCenter = [50., 50., 50.]
+	imageProps = [(512, 512), 0.1, (81, 100, 100)]
+	## x,y,z offset of the markers in the cube (see correlation.main())
+	offset = (max(imageProps[2]) - np.array(imageProps[2][::-1]))*0.5
+	truth = Rigid3D.make_32_ck(
+		e_params=Rigid3D.euler_to_ck(angles), s=1.7, x=markers_3d.T, y=markers_2d[:,:2].T)
+	truthTranslation = correlation.cubeTransform(truth, offset).recalculate_translation(rotation_center=rotationCenter)
+
+	def run():
+		result = correlation.main(
+			markers_3d, markers_2d, spots_3d, rotationCenter, '', imageProps, uncertainty=False, random_state=seed)
+		if cube == 'refit':
+			transf_cube = Rigid3D.find_32(
+				x=markers_3d.T + offset[:,np.newaxis], y=markers_2d[:,:2].T, randome='quasi', einit='gl2',
+				einit_dist=0.1, randoms=True, sinit='gl2', ninit=10, random_state=seed)
+			result[5] = transf_cube.recalculate_translation(rotation_center=rotationCenter)
+		return result
+
+	def evaluate(result):
+		delta2D, modifiedTranslation = result[3], result[5]
+		return dict(
+			rms_error=float(np.sqrt((delta2D**2).sum(axis=0).mean())),
+			translation_error=float(np.abs(np.asarray(modifiedTranslation) - truthTranslation).max()))
+	return run, evaluate
+
+
+def benchAffineBatch(method='batch',sets=500,points=6,noise=0.5,seed=0):
+	"""Affine2D.findBatch() ('batch') versus a loop of Affine2D.find() ('loop', which also decomposes gl) for
+	many sets of 2D points, e.g. one transformation per tile of an overview image.
+	Accuracy: max error of gl and of the transformed points (px) compared to the known transformations and
+	max deviation of the decomposition (q p s m) from gl."""
+	from pyto.affine_2d import Affine2D
+	random_state = np.random.RandomState(seed)
+	gl = np.identity(2) + random_state.uniform(-0.3, 0.3, (sets, 2, 2))
+	d = random_state.uniform(-50, 50, (sets, 2))
+	x = random_state.uniform(0, 100, (sets, points, 2))
+	yTrue = np.einsum('nij,npj->npi', gl, x) + d[:,np.newaxis]
+	y = yTrue + noise*random_state.standard_normal((sets, points, 2))
+
+	def run():
+		if method == 'batch':
+			return Affine2D.findBatch(x=x, y=y, order='qpsm')
+		return [Affine2D.find(x=x_k, y=y_k) for x_k, y_k in zip(x, y)]
+
+	def evaluate(transfs):
+		glFound = np.array([transf.gl for transf in transfs])
+		dFound = np.array([transf.d for transf in transfs])
+		composed = np.array([transf.composeGl(order='qpsm') for transf in transfs])
+		yFound = np.einsum('nij,npj->npi', glFound, x) + dFound[:,np.newaxis]
+		return dict(
+			gl_error=float(np.abs(glFound - gl).max()),
+			point_error=float(np.sqrt(((yFound - yTrue)**2).sum(axis=-1)).max()),
+			decomposition_error=float(np.abs(composed - glFound).max()))
+	return run, evaluate
+
+
+def benchInterpolation(method='linear',shape=(20,64,64),ss_in=300.,ss_out=150.,seed=0):
+	"""stackProcessing.interpol() (linear or spline interpolation along z) of a smooth synthetic stack.
+	Accuracy: max and rms error of the interpolated slices relative to the value range of the stack."""
+	from tdct import stackProcessing
+	img, f = smoothStack(shape=shape, seed=seed)
+
+	def run():
+		return stackProcessing.interpol(img, ss_in, ss_out, method, False)
+
+	def evaluate(img_int):
+		## interpolated slices (the last original slice is not extrapolated)
+		zNew = np.arange(0, shape[0]-1, ss_out/ss_in)
+		Z, Y, X = np.meshgrid(zNew, np.arange(shape[1]), np.arange(shape[2]), indexing='ij')
+		diff = (img_int[:len(zNew)] - f(Z, Y, X))/np.ptp(img)
+		return dict(max_error=float(np.abs(diff).max()), rms_error=float(np.sqrt((diff**2).mean())))
+	return run, evaluate
+
+
+def benchNormImg(shape=(50,256,256),dtype='uint16',seed=0):
+	"""stackProcessing.norm_img() of a stack with slices of different brightness.
+	Accuracy: max relative deviation of the slice maxima from the full range of the data type."""
+	from tdct import stackProcessing
+	random_state = np.random.RandomState(seed)
+	fullRange = 65535 if dtype in ('uint16', 'int16') else 255 if dtype in ('uint8', 'int8') else 1
+	img = random_state.uniform(0, 1, shape)*random_state.uniform(0.05, 0.5, shape[0])[:,np.newaxis,np.newaxis]
+	img = (img*fullRange).astype(dtype)
+
+	def run():
+		return stackProcessing.norm_img(img)
+
+	def evaluate(img_norm):
+		maxima = img_norm.reshape(shape[0], -1).max(axis=1).astype(np.float64)
+		return dict(range_error=float(np.abs(1 - maxima/fullRange).max()))
+	return run, evaluate
+
+
+def benchBeadPos(method='gauss',shape=(40,64,64),beads=8,noise=0.02,seed=0):
+	"""z localization of beads by beadPos.getzGauss() ('gauss') or beadPos.getzRobust() ('robust') at the
+	nearest pixel of the known x,y positions. Accuracy: mean and max absolute z error (px)."""
+	from tdct import beadPos
+	img, positions = beadStack(shape=shape, beads=beads, noise=noise, seed=seed)
+	xy = np.round(positions[:,:2]).astype(int)
+
+	def run():
+		if method == 'gauss':
+			return np.array([beadPos.getzGauss(x, y, img) for x, y in xy])
+		## new cache per repeat, so that the volume is smoothed once per run as in the correlation window
+		cache = beadPos.FitCache()
+		return np.array([beadPos.getzRobust(x, y, img, cache=cache)[0] for x, y in xy])
+
+	def evaluate(z):
+		error = np.abs(z - positions[:,2])
+		return dict(mean_error=float(error.mean()), max_error=float(error.max()))
+	return run, evaluate
+
+
+def benchBeadPos2D(method='gauss',shape=(64,64),beads=8,noise=0.02,seed=0):
+	"""x,y refinement of beads in a 2D image by beadPos2D.refine(), starting from the nearest pixel.
+	Accuracy: mean and max x,y error (px)."""
+	from tdct import beadPos2D
+	img, positions = beadStack(shape=shape, beads=beads, noise=noise, seed=seed)
+	start = np.round(positions[:,:2])
+
+	def run():
+		return beadPos2D.refine(img, start, method=method, cutout=6)
+
+	def evaluate(xy):
+		error = np.sqrt(((xy - positions[:,:2])**2).sum(axis=1))
+		return dict(mean_error=float(error.mean()), max_error=float(error.max()))
+	return run, evaluate
+
+
+def benchFindBeads(shape=(30,96,96),beads=9,radius=5.,noise=0.02,seed=0,threads=None):
+	"""Bead detection by beadDetect.findBeads() (threads None: all cores, see cpus in environment()) in a
+	synthetic stack with beads of the given radius (sigma radius/sqrt(3)). A detection within 1.5 px of a
+	bead counts as found.
+	Accuracy: fraction of beads found (recall), mean and max error of the found beads (px) and the number
+	of detections that are not close to any bead (false)."""
+	from scipy.spatial import cKDTree
+	from tdct import beadDetect
+	img, positions = beadStack(shape=shape, beads=beads, sigma=[radius/np.sqrt(3)]*3, noise=noise, seed=seed)
+
+	def run():
+		return beadDetect.findBeads(img, radius=radius, threads=threads)
+
+	def evaluate(coords):
+		if len(coords) == 0:
+			return dict(recall=0., mean_error=None, max_error=None, false=0)
+		distance = cKDTree(coords).query(positions)[0]
+		found = distance <= 1.5
+		closest = cKDTree(positions).query(coords)[0]
+		return dict(
+			recall=float(found.mean()),
+			mean_error=float(distance[found].mean()) if found.any() else None,
+			max_error=float(distance[found].max()) if found.any() else None,
+			false=int((closest > 1.5).sum()))
+	return run, evaluate
+
+
+def cases(quick=False):
+	"""Returns the list of benchmark cases (Case). With quick, the data is smaller and there are fewer
+	variants, e.g. for tests or a fast check during development."""
+	find32 = []
+	if quick:
+		variants = [(8, 1., 0.)]
+	else:
+		variants = [(n, noise, 0.) for n in (6, 20, 100) for noise in (0.5, 2.)]
+	for n, noise, outliers in variants:
+		find32.append(Case(
+			'find_32_batch_ck_n%d_noise%g' % (n, noise), benchFind32,
+			dict(n=n, noise=noise, mode='batch_ck')))
+	find32.append(Case('find_32_constr_ck_n20_noise1', benchFind32, dict(n=20, noise=1., mode='constr_ck')))
+	find32.append(Case('find_32_global_n20_noise1', benchFind32, dict(n=20, noise=1., mode='global')))
+	find32.append(Case(
+		'find_32_ransac_n20_noise1_outliers0.2', benchFind32,
+		dict(n=20, noise=1., outliers=0.2, mode='batch_ck', robust=True)))
+	if quick:
+		find32 = [case for case in find32 if 'batch' in case.name or 'global' in case.name]
+	## constrained (SLSQP) versus unconstrained (L-BFGS-B) rotation search from the same starts
+	for mode in ('constr_ck', 'unconstr_ck'):
+		find32.append(Case(
+			'find_32_%s_solver' % mode, benchCkSolver, dict(mode=mode, starts=10 if quick else 50)))
+	## correlation.main() with imageProps, cube transformation derived analytically versus a second fit
+	for cube in ('analytic', 'refit'):
+		find32.append(Case('correlation_main_imageProps_%s' % cube, benchCorrelationMain, dict(cube=cube)))
+	## batched affine fit versus the loop it replaces (same data, compare the times of the two cases)
+	affineSets = 50 if quick else 500
+	for method in ('batch', 'loop'):
+		find32.append(Case(
+			'affine2d_find_%s_%dsets' % (method, affineSets), benchAffineBatch,
+			dict(method=method, sets=affineSets, points=6)))
+
+	stackShape = (10,16,16) if quick else (20,64,64)
+	normShape = (10,64,64) if quick else (50,256,256)
+	beadShape = (30,48,48) if quick else (40,64,64)
+	beads = 4 if quick else 16
+	pipeline = [
+		Case('interpolation_linear', benchInterpolation, dict(method='linear', shape=stackShape)),
+		Case('interpolation_spline', benchInterpolation, dict(method='spline', shape=stackShape)),
+		Case('norm_img_uint16', benchNormImg, dict(shape=normShape, dtype='uint16')),
+		Case('beadPos_getzGauss', benchBeadPos, dict(method='gauss', shape=beadShape, beads=beads)),
+		Case('beadPos_getzRobust', benchBeadPos, dict(method='robust', shape=beadShape, beads=beads)),
+		Case('beadPos2D_gauss', benchBeadPos2D, dict(method='gauss', shape=beadShape[1:], beads=beads)),
+		Case('beadPos2D_radialsymmetry', benchBeadPos2D, dict(
+			method='radialsymmetry', shape=beadShape[1:], beads=beads)),
+		]
+	## findBeads on the stack size it is meant for (x,y,z = 2048x2048x100), on all cores and on one core
+	detectShape = (30,96,96) if quick else (100,2048,2048)
+	detectName = 'findBeads_%dx%dx%d' % detectShape[::-1]
+	detectParams = dict(shape=detectShape, beads=9 if quick else 400, radius=5.)
+	pipeline.append(Case(detectName, benchFindBeads, detectParams))
+	if not quick:
+		pipeline.append(Case(detectName + '_1thread', benchFindBeads, dict(detectParams, threads=1)))
+	return find32 + pipeline
+
+
+## Running =============================================================================================================
+
+def peakMemory():
+	"""Peak resident set size of this process in MB (None without the resource module)"""
+	if resource is None:
+		return None
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	## kB on Linux, bytes on OS X
+	return peak/1024.**2 if sys.platform == 'darwin' else peak/1024.
+
+
+def runCase(case,repeat=3):
+	"""Runs one benchmark case repeat times (after setting up its data once).
+	Returns a dict with name, params, status ('ok', 'skipped' or 'error'), time (fastest run in s),
+	time_median, peak_memory (MB) and accuracy (dict, see the bench functions)."""
+	result = dict(name=case.name, params=case.params, status='ok')
+	try:
+		run, evaluate = case.func(**case.params)
+	except (ImportError, SystemExit) as e:
+		## e.g. stackProcessing exits if PyQt4 or tifffile can not be imported
+		result.update(status='skipped', message='%s: %s' % (type(e).__name__, e))
+		return result
+	try:
+		memStart = peakMemory()
+		times = []
+		for i in range(repeat):
+			ping = timeit.default_timer()
+			out = run()
+			times.append(timeit.default_timer() - ping)
+		memEnd = peakMemory()
+		result.update(
+			time=min(times), time_median=float(np.median(times)),
+			peak_memory=None if memStart is None else memEnd - memStart,
+			accuracy=evaluate(out))
+	except Exception as e:
+		result.update(status='error', message='%s: %s' % (type(e).__name__, e))
+	return result
+
+
+def _runCaseProcess(case,repeat,queue):
+	queue.put(runCase(case, repeat))
+
+
+def runCaseIsolated(case,repeat=3):
+	"""runCase() in a separate process, so that the peak memory is the one of the case alone"""
+	queue = multiprocessing.Queue()
+	process = multiprocessing.Process(target=_runCaseProcess, args=(case, repeat, queue))
+	process.start()
+	result = None
+	while result is None:
+		try:
+			result = queue.get(timeout=1)
+		except Queue.Empty:
+			if not process.is_alive():
+				try:
+					result = queue.get(timeout=1)
+				except Queue.Empty:
+					result = dict(
+						name=case.name, params=case.params, status='error',
+						message='process exited with code %s' % process.exitcode)
+	process.join()
+	return result
+
+
+def environment():
+	"""Information about the machine and the software versions the benchmarks were run with"""
+	try:
+		commit = subprocess.check_output(
+			['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.realpath(__file__)),
+			stderr=open(os.devnull, 'w')).strip()
+	except (OSError, subprocess.CalledProcessError):
+		commit = None
+	return dict(
+		python=platform.python_version(), numpy=np.__version__, scipy=scipy.__version__,
+		platform=platform.platform(), machine=platform.machine(), cpus=multiprocessing.cpu_count(),
+		commit=commit)
+
+
+def run(caseList=None,history=None,repeat=3,isolate=True,quick=False,filter=None):
+	"""Runs the benchmark cases and returns the run as a dict with timestamp, environment and results
+	(list of runCase() results).
+
+	caseList defaults to cases(quick), filter only keeps cases whose name contains it. If history is the
+	path to a JSON file, the run is appended to the list of runs stored there (the file is created if
+	needed). If isolate is True, every case is run in a separate process (see runCaseIsolated())."""
+	if caseList is None:
+		caseList = cases(quick)
+	if filter is not None:
+		caseList = [case for case in caseList if filter in case.name]
+	results = []
+	for case in caseList:
+		if isolate:
+			result = runCaseIsolated(case, repeat)
+		else:
+			result = runCase(case, repeat)
+		if clrmsg and debug is True: print clrmsg.DEBUG + 'Benchmark %s: %s' % (case.name, result.get('time'))
+		results.append(result)
+	benchRun = dict(
+		timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"), environment=environment(), repeat=repeat,
+		quick=quick, results=results)
+	if history is not None:
+		runs = loadHistory(history)
+		runs.append(benchRun)
+		with open(history, 'w') as f:
+			json.dump(runs, f, indent=1, sort_keys=True)
+	return benchRun
+
+
+def loadHistory(history):
+	"""Returns the list of runs stored in the JSON file history (empty list if it does not exist)"""
+	if not os.path.exists(history):
+		return []
+	with open(history) as f:
+		return json.load(f)
+
+
+def compare(new,old,threshold=1.25,accuracyThreshold=1.5,minTime=0.02):
+	"""Compares two runs (see run()), cases are matched by name.
+
+	Returns a list of dicts (name, metric, old, new, ratio) for all metrics that got worse: time or peak
+	memory increased by more than the factor threshold (times below minTime s are too noisy and are not
+	compared), or an accuracy error increased by more than accuracyThreshold."""
+	oldResults = dict((result['name'], result) for result in old['results'] if result['status'] == 'ok')
+	regressions = []
+
+	def check(name, metric, oldValue, newValue, factor, minimum=0):
+		if oldValue is None or newValue is None or max(oldValue, newValue) <= minimum:
+			return
+		ratio = newValue/oldValue if oldValue > 0 else np.inf
+		if ratio > factor:
+			regressions.append(dict(name=name, metric=metric, old=oldValue, new=newValue, ratio=ratio))
+
+	for result in new['results']:
+		oldResult = oldResults.get(result['name'])
+		if result['status'] != 'ok' or oldResult is None:
+			continue
+		check(result['name'], 'time', oldResult['time'], result['time'], threshold, minTime)
+		check(result['name'], 'peak_memory', oldResult['peak_memory'], result['peak_memory'], threshold, 1.)
+		for metric, value in sorted(result['accuracy'].items()):
+			## tiny errors (e.g. of exact data) are not compared
+			check(result['name'], metric, oldResult['accuracy'].get(metric), value, accuracyThreshold, 1e-6)
+	return regressions
+
+
+def formatRun(benchRun,previous=None):
+	"""Returns a table (list of lines) of the results, with the speedup compared to previous (if given)"""
+	oldTimes = {}
+	if previous is not None:
+		oldTimes = dict((result['name'], result['time']) for result in previous['results'] if result['status'] == 'ok')
+	lines = ['%-40s %10s %10s %8s  %s' % ('case', 'time (s)', 'mem (MB)', 'speedup', 'accuracy')]
+	for result in benchRun['results']:
+		if result['status'] != 'ok':
+			lines.append('%-40s %s: %s' % (result['name'], result['status'], result.get('message', '')))
+			continue
+		speedup = ''
+		if oldTimes.get(result['name']):
+			speedup = '%.2fx' % (oldTimes[result['name']]/max(result['time'], 1e-12))
+		memory = '' if result['peak_memory'] is None else '%.1f' % result['peak_memory']
+		accuracy = ', '.join('%s %.3g' % item for item in sorted(result['accuracy'].items()))
+		lines.append('%-40s %10.4f %10s %8s  %s' % (result['name'], result['time'], memory, speedup, accuracy))
+	return lines
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='3DCT benchmark suite')
+	parser.add_argument('--history', help='JSON file the run is appended to and compared with')
+	parser.add_argument('--quick', action='store_true', help='smaller data and fewer cases')
+	parser.add_argument('--filter', help='only run cases whose name contains FILTER')
+	parser.add_argument('--repeat', type=int, default=3, help='number of timed runs per case (default 3)')
+	parser.add_argument('--no-isolate', action='store_true', help='run all cases in this process')
+	parser.add_argument(
+		'--threshold', type=float, default=1.25, help='slowdown factor reported as regression (default 1.25)')
+	args = parser.parse_args(argv)
+
+	previous = None
+	if args.history is not None:
+		runs = [one for one in loadHistory(args.history) if one.get('quick') == args.quick]
+		if runs:
+			previous = runs[-1]
+	benchRun = run(
+		history=args.history, repeat=args.repeat, isolate=not args.no_isolate, quick=args.quick,
+		filter=args.filter)
+	for line in formatRun(benchRun, previous):
+		print line
+	if previous is None:
+		return 0
+	regressions = compare(benchRun, previous, threshold=args.threshold)
+	for regression in regressions:
+		print 'REGRESSION %(name)s %(metric)s: %(old).4g -> %(new).4g (%(ratio).2fx)' % regression
+	return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
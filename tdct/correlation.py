@@ -109,7 +109,7 @@ The procedure is organized as follows:
 # @Credits			:
 # @Maintainer		: Vladan Lucic, Jan Arnold
 # @Date				: 2015/10
-# @Version			: 3DCT 2.3.0 module rev. 3
+# @Version			: 3DCT 2.3.0 module rev. 7
 # @Status			: stable
 # @Usage			: import correlation.py and call main(markers_3d,markers_2d,spots_3d,rotation_center,results_file)
 # 					: "markers_3d", "markers_2d" and "spots_3d" are numpy arrays. Those contain 3D coordinates
@@ -121,13 +121,18 @@ The procedure is organized as follows:
 # ======================================================================================================================
 
 import os
+import collections
 import numpy as np
+import scipy as sp
+import scipy.optimize
 
 import pyto
 import pyto.common as common
 import pyto.util
 from pyto.rigid_3d import Rigid3D
 
+import instrument
+
 ########## Functions #############################################################
 ##################################################################################
 
@@ -176,6 +181,30 @@ def write_results(
 			"#   Repeat run with changed initial values and / or " +
 			"increased ninit"])
 
+	# global optimum certificate (Rigid3D.find_32_global())
+	certificate = getattr(transf, 'certificate', None)
+	if certificate is not None:
+		if certificate.certified:
+			header.extend([
+				"#   - global optimum certified (sum of squared errors within %.3g of the lower bound, %d cells)"
+				% (certificate.tol, certificate.n_cells)])
+		else:
+			header.extend([
+				"#",
+				"# WARNING: Global optimum not certified, a solution up to %.3g (sum of squared errors) better"
+				% certificate.gap,
+				"#   may exist (%d cells searched)" % certificate.n_cells])
+		for fun, angle in zip(certificate.alternatives_fun, certificate.alternatives_angle):
+			header.extend([
+				"#   - alternative optimum: rms error = %6.2f, rotation differs by %6.2f deg"
+				% (np.sqrt(max(fun, 0) / transf.error.shape[1]), angle * 180 / np.pi)])
+
+	# outliers (robust correlation)
+	if getattr(transf, 'outliers', None) is not None and len(transf.outliers) > 0:
+		header.extend([
+			"#   - outlier markers (not used for the transformation): %s"
+			% ', '.join(str(i+1) for i in transf.outliers)])
+
 	# write header
 	for line in header:
 		res_file.write(line + os.linesep)
@@ -239,17 +268,356 @@ def write_results(
 			arrays=out_vars, format=out_format, indices=ids, prependIndex=False)
 		table.extend(res_tab_spots)
 
+	uncertainty = getattr(transf, 'poiUncertainty', None)
+	if spots_3d.shape[0] != 0 and uncertainty:
+		# confidence ellipses of the correlated spots from resampled markers
+		for method in ['leave-one-out', 'bootstrap']:
+			if method not in uncertainty:
+				continue
+			result = uncertainty[method]
+			table.extend([
+				"#",
+				"#",
+				"# Uncertainty of correlated spots (%s, %d resamples), %.0f%% confidence ellipses" % (
+					method, result.spots_2d.shape[0], result.confidence*100),
+				"#",
+				"#	Std dev x, y (px)	Semi-axes (px)		Angle (deg)"])
+			out_vars = [
+						np.sqrt(result.cov[:,0,0]), np.sqrt(result.cov[:,1,1]),
+						result.axes[:,0], result.axes[:,1], result.angle
+						]
+			out_format = '	%7.2f	%7.2f		%7.2f	%7.2f		%7.2f'
+			ids = range(result.axes.shape[0])
+			res_tab_spots = pyto.util.arrayFormat(
+				arrays=out_vars, format=out_format, indices=ids, prependIndex=False)
+			table.extend(res_tab_spots)
+
 	# write data table
 	for line in table:
 		res_file.write(line + os.linesep)
 
 
+class IncrementalCorrelation(object):
+	"""
+	Keeps the last 3D to 2D correlation (Rigid3D.find_32() solution) together with the sums needed for
+	the moment matrices x x^T, y x^T and tr(y^T y) of the markers, to quickly update the correlation
+	when single markers are moved, added or deleted.
+
+	Edited markers change these sums by rank-one terms (addMarker(), removeMarker()) and the optimization
+	(Rigid3D.find_32_batch_ck_moments()) is warm-started from the last optimum, together with the two
+	approximate solutions of the 2D affine transformation (see Rigid3D.approx_gl2_to_ck3()) in case the
+	edit moved the optimum to another minimum.
+
+	If there is no previous solution or more than maxEdits markers (a moved marker counts twice) changed,
+	a full find_32() run is done and the sums are recalculated from scratch.
+	"""
+	def __init__(self,maxEdits=4):
+		self.maxEdits = maxEdits
+		self.reset()
+
+	def reset(self):
+		self.transf = None
+		self.markers = []
+		self.n = 0
+		self.sx = np.zeros(3)
+		self.sy = np.zeros(2)
+		self.sxx = np.zeros((3,3))
+		self.syx = np.zeros((2,3))
+		self.syy = 0.
+		self.lastMode = None
+
+	def addMarker(self,x,y,sign=1):
+		"""Adds (sign=1) or removes (sign=-1) marker with 3D coordinates x and 2D coordinates y"""
+		x = np.asarray(x, dtype=float)
+		y = np.asarray(y, dtype=float)
+		self.n += sign
+		self.sx += sign*x
+		self.sy += sign*y
+		self.sxx += sign*np.outer(x, x)
+		self.syx += sign*np.outer(y, x)
+		self.syy += sign*np.dot(y, y)
+
+	def removeMarker(self,x,y):
+		self.addMarker(x, y, sign=-1)
+
+	def moments(self):
+		"""Returns center of mass of the 3D and 2D markers and the center of mass moments xxt, yxt and tryy"""
+		x_cm = self.sx/self.n
+		y_cm = self.sy/self.n
+		xxt = self.sxx - self.n*np.outer(x_cm, x_cm)
+		yxt = self.syx - self.n*np.outer(y_cm, x_cm)
+		tryy = self.syy - self.n*np.dot(y_cm, y_cm)
+		return x_cm, y_cm, xxt, yxt, tryy
+
+	def correlate(self,mark_3d,mark_2d,**kwargs):
+		"""
+		Returns the correlation of markers mark_3d (3xN) and mark_2d (2xN), kwargs are passed to
+		Rigid3D.find_32() in case a full run is needed. lastMode is set to 'full' or 'incremental'.
+		"""
+		markers = [tuple(row) for row in np.vstack((mark_3d, mark_2d)).transpose()]
+		removed = list(self.markers)
+		added = []
+		for marker in markers:
+			if marker in removed:
+				removed.remove(marker)
+			else:
+				added.append(marker)
+
+		if self.transf is None or len(removed)+len(added) > self.maxEdits or len(markers) < 3:
+			self.reset()
+			for marker in markers:
+				self.addMarker(marker[:3], marker[3:])
+			self.transf = Rigid3D.find_32(x=mark_3d, y=mark_2d, **kwargs)
+			self.markers = markers
+			self.lastMode = 'full'
+			instrument.count('correlation.full')
+			return self.transf
+
+		for marker in removed:
+			self.removeMarker(marker[:3], marker[3:])
+		for marker in added:
+			self.addMarker(marker[:3], marker[3:])
+		self.markers = markers
+
+		scale = kwargs.get('scale')
+		x_cm, y_cm, xxt, yxt, tryy = self.moments()
+		e_gl2, s_gl2 = Rigid3D.approx_gl2_to_ck3(
+			x=mark_3d-x_cm[:,np.newaxis], y=mark_2d-y_cm[:,np.newaxis], xy_axes='dim_point', ret='both')
+		if scale is None:
+			inits = [np.hstack((self.transf.ck, [self.transf.s_scalar]))] + [np.hstack((e, [s_gl2])) for e in e_gl2]
+		else:
+			inits = [self.transf.ck] + list(e_gl2)
+		landscape = Rigid3D.find_32_batch_ck_moments(xxt=xxt, yxt=yxt, tryy=tryy, inits=inits, scale=scale)
+		best = np.argmin(landscape.fun)
+		e_params = landscape.x[best,:4]
+		s = landscape.x[best,4] if scale is None else scale
+
+		transf = Rigid3D.make_32_ck(e_params=e_params, s=s, x=mark_3d, y=mark_2d, x_cm=x_cm, y_cm=y_cm)
+		transf.initial_params = landscape.init[best]
+		transf.optimizeResult = sp.optimize.OptimizeResult(
+			x=landscape.x[best], fun=landscape.fun[best], nit=landscape.nit[best],
+			success=landscape.success[best], status=int(not landscape.success[best]))
+		self.transf = transf
+		self.lastMode = 'incremental'
+		instrument.count('correlation.incremental')
+		return transf
+
+
+PoiUncertainty = collections.namedtuple('PoiUncertainty', ['method','spots_2d','cov','axes','angle','confidence'])
+
+
+def poiUncertainty(
+		transf,mark_3d,mark_2d,spots_3d,nBootstrap=200,leaveOneOut=True,confidence=0.95,weights=None,
+		random_state=None):
+	"""
+	Estimates how precisely the correlated spots (POIs) are known by repeating the correlation with
+	resampled markers: leave-one-out (jackknife, every marker left out once) and bootstrap (nBootstrap
+	random draws of the markers with replacement).
+
+	All resamples are solved together by Rigid3D.find_32_batch_ck_moments(): resampling only changes the
+	(weighted) marker moments, and every resample is warm-started from the full solution transf.
+
+	mark_3d (3xN), mark_2d (2xN) and spots_3d (3xM) are in the dim_point layout used in main(), weights
+	of the markers (N or 2xN, see Rigid3D.moments_32()) are combined with the resampling weights.
+	Bootstrap resamples are drawn from random_state (None, seed or np.random.RandomState, see
+	Rigid3D.get_random_state()).
+
+	Returns a dict with keys 'leave-one-out' and 'bootstrap' (only the requested ones, bootstrap needs
+	nBootstrap > 0 and leave-one-out at least 4 markers), each value is a PoiUncertainty with:
+		spots_2d	: correlated spots of all resamples (K x 2 x M)
+		cov			: 2x2 covariance matrix of each spot (M x 2 x 2)
+		axes		: semi-axes (major, minor) of the confidence ellipses (M x 2)
+		angle		: angle of the major axis to the x axis in degrees (M)
+		confidence	: confidence level of the ellipses
+	"""
+	nMarkers = mark_3d.shape[1]
+	resampling = {}
+	if leaveOneOut and nMarkers > 3:
+		resampling['leave-one-out'] = 1 - np.identity(nMarkers)
+	if nBootstrap > 0:
+		random_state = Rigid3D.get_random_state(random_state)
+		counts = random_state.multinomial(nMarkers, [1./nMarkers]*nMarkers, size=nBootstrap)
+		## at least 3 different markers are needed for a correlation
+		resampling['bootstrap'] = counts[(counts > 0).sum(axis=1) >= 3].astype(float)
+
+	## marker weights for both 2D axes
+	isotropic = weights is None or np.ndim(weights) == 1
+	markerWeights = np.broadcast_to(np.ones(nMarkers) if weights is None else weights, (2, nMarkers))
+
+	## chi-square quantile with 2 degrees of freedom
+	chi2 = -2*np.log(1-confidence)
+	results = {}
+	for method, w in resampling.items():
+		## weighted centers of mass (for each 2D axis) and moments of every resample
+		w = w[:,np.newaxis,:]*markerWeights
+		x_cm = np.einsum('kan,in->kia', w, mark_3d)/w.sum(axis=2)[:,np.newaxis,:]
+		y_cm = (w*mark_2d).sum(axis=2)/w.sum(axis=2)
+		x_prime = mark_3d[np.newaxis,np.newaxis] - x_cm.transpose(0,2,1)[:,:,:,np.newaxis]
+		y_prime = mark_2d[np.newaxis] - y_cm[:,:,np.newaxis]
+		xxt = np.einsum('kan,kain,kajn->kaij', w, x_prime, x_prime)
+		yxt = np.einsum('kan,kan,kain->kai', w, y_prime, x_prime)
+		tryy = (w*y_prime**2).sum(axis=(1,2))
+		if isotropic:
+			xxt, x_cm = xxt[:,0], x_cm[:,:,0]
+		inits = np.tile(np.hstack((transf.ck, [transf.s_scalar])), (len(w), 1))
+		landscape = Rigid3D.find_32_batch_ck_moments(xxt=xxt, yxt=yxt, tryy=tryy, inits=inits)
+
+		## correlated spots of every resample
+		r = Rigid3D.make_r_ck(landscape.x[:,:4])[:,:2,:]
+		s = landscape.x[:,4]
+		if isotropic:
+			d = y_cm - s[:,np.newaxis]*np.einsum('kij,kj->ki', r, x_cm)
+		else:
+			d = y_cm - s[:,np.newaxis]*np.einsum('kij,kji->ki', r, x_cm)
+		spots_2d = s[:,np.newaxis,np.newaxis]*np.einsum('kij,jm->kim', r, spots_3d) + d[:,:,np.newaxis]
+
+		deviation = spots_2d - spots_2d.mean(axis=0)
+		cov = np.einsum('kim,kjm->mij', deviation, deviation)
+		if method == 'leave-one-out':
+			## jackknife variance
+			cov *= (len(w)-1.)/len(w)
+		else:
+			cov /= len(w)-1.
+		eigval, eigvec = np.linalg.eigh(cov)
+		axes = np.sqrt(chi2*np.maximum(eigval[:,::-1], 0))
+		angle = np.degrees(np.arctan2(eigvec[:,1,1], eigvec[:,0,1]))
+		results[method] = PoiUncertainty(method, spots_2d, cov, axes, angle, confidence)
+	return results
+
+
+def cubeTransform(transf, offset):
+	"""
+	Returns the transformation for the 3D markers shifted by offset (x,y,z), i.e. the markers
+	of the volume padded to a cube. A constant shift only changes the translation, so the
+	transformation is derived from transf instead of running the optimization again.
+	As for transformations found by Rigid3D.find_32(), the z component of the translation
+	is set to 0.
+	"""
+	transf_cube = transf.shift_initial(shift=offset)
+	transf_cube.d[2] = 0
+	return transf_cube
+
+
+class TransformChain(object):
+	"""
+	Chain of transformations applied one after the other, as in the multi-stage correlation described at
+	the top of this module, e.g. LM -> EM overview (Rigid3D from main() or Affine2D), overview -> search
+	(Affine2D from collage or stage coordinates) and search -> stage.
+
+	Every transformation is exported in homogeneous coordinates (Affine.getHomogeneous()) and the chain is
+	precomposed into a single (n_out+1)x(n_in+1) matrix, so correlating many spots is a single matrix
+	product. A 2D transformation following a 3D one acts on x,y of the transformed points, z is dropped (like
+	the 2D spots correlated by main()).
+
+	The estimated rms error of the chain is propagated like in Affine.compose():
+
+		err_k = sqrt(rms_k**2 + (mean_scale_k * err_k-1)**2)
+
+	where rms_k is rmsError (or rmsErrorEst) of the k-th transformation and mean_scale_k the geometrical mean
+	of its scales. It is None if any of the transformations has no error.
+	"""
+	def __init__(self,transforms=None,names=None):
+		self.transforms = []
+		self.names = []
+		if transforms is not None:
+			if names is None:
+				names = [None]*len(transforms)
+			for transf, name in zip(transforms, names):
+				self.append(transf, name=name)
+
+	def append(self,transf,name=None):
+		"""Adds transformation transf (Affine or subclass, e.g. Rigid3D or Affine2D) at the end of the chain"""
+		ndim_in = transf.getHomogeneous().shape[0] - 1
+		if self.transforms and ndim_in > self.ndimOut:
+			raise ValueError('A {0}D transformation can not follow a {1}D one'.format(ndim_in, self.ndimOut))
+		self.transforms.append(transf)
+		self.names.append(name if name is not None else 'transformation %d' % len(self.transforms))
+
+	@property
+	def ndimIn(self):
+		return self.transforms[0].getHomogeneous().shape[0] - 1
+
+	@property
+	def ndimOut(self):
+		return self.transforms[-1].getHomogeneous().shape[0] - 1
+
+	def getHomogeneous(self):
+		"""Returns the composed transformation as (n_out+1)x(n_in+1) matrix in homogeneous coordinates"""
+		if not self.transforms:
+			raise ValueError('The transformation chain is empty')
+		matrix = self.transforms[0].getHomogeneous()
+		for transf in self.transforms[1:]:
+			homo = transf.getHomogeneous()
+			ndim = homo.shape[0] - 1
+			## keep the first ndim coordinates (and the homogeneous row) of the previous output
+			matrix = np.dot(homo, np.vstack((matrix[:ndim], matrix[-1:])))
+		return matrix
+
+	homogeneous = property(getHomogeneous)
+
+	@property
+	def rmsErrorEst(self):
+		error = 0.
+		for transf in self.transforms:
+			rms = transf.rmsError
+			if rms is None:
+				rms = transf.rmsErrorEst
+			if rms is None:
+				return None
+			homo = transf.getHomogeneous()
+			scale = np.linalg.svd(homo[:-1,:-1], compute_uv=False)
+			meanScale = np.prod(scale)**(1./len(scale))
+			error = np.sqrt(rms**2 + (meanScale*error)**2)
+		return error
+
+	def transform(self,x,xy_axes='point_dim'):
+		"""
+		Correlates points x through the whole chain. x is an array of points, n_points x n_in ('point_dim',
+		like the marker tables) or n_in x n_points ('dim_point'), or a single point. Returns the correlated
+		points in the same form.
+		"""
+		matrix = self.getHomogeneous()
+		ndim = matrix.shape[1] - 1
+		x = np.asarray(x, dtype=float)
+		if x.ndim == 1:
+			return np.dot(matrix[:-1,:ndim], x[:ndim]) + matrix[:-1,ndim]
+		if xy_axes == 'point_dim':
+			return np.dot(x[:,:ndim], matrix[:-1,:ndim].T) + matrix[:-1,ndim]
+		elif xy_axes == 'dim_point':
+			return np.dot(matrix[:-1,:ndim], x[:ndim]) + matrix[:-1,ndim,np.newaxis]
+		else:
+			raise ValueError("xy_axes has to be 'point_dim' or 'dim_point', got {0}".format(xy_axes))
+
+
 ########## Main ##################################################################
 ##################################################################################
 
-def main(markers_3d,markers_2d,spots_3d,rotation_center,results_file,imageProps=None):
+def main(
+		markers_3d,markers_2d,spots_3d,rotation_center,results_file,imageProps=None,incremental=None,robust=False,
+		uncertainty=True,nBootstrap=200,weights=None,random_state=None,certify=False):
+	"""
+	incremental can be an IncrementalCorrelation instance that keeps the correlation between calls,
+	in that case the correlation is only updated if just a few markers changed since the last call.
+	If robust is True, outlier markers are detected (Rigid3D.find_32_ransac()) and not used for the
+	correlation, their indices are in attribute outliers of the returned transformation.
+	If uncertainty is True and there are spots, their confidence ellipses from leave-one-out and nBootstrap
+	bootstrap resamples of the markers (see poiUncertainty()) are in attribute poiUncertainty of the
+	returned transformation.
+	weights are the weights of the markers in the correlation, one per marker or one per marker and 2D
+	axis (x,y rows like the marker tables), typically the inverse variances of the marker localization
+	(e.g. from the covariances of the bead fits). Poorly localized markers then contribute less.
+	Weighted correlations are not done incrementally.
+	random_state is used for all random numbers (initial scales of the optimization, RANSAC subsets and
+	bootstrap resamples), it can be a seed (int) or np.random.RandomState (see
+	Rigid3D.get_random_state()), so that correlations can be reproduced. None uses the numpy global random
+	state. Initial rotations are quasi-random (see Rigid3D.make_quasi_random_ck()) and do not depend on it.
+	If certify is True, the rotations are searched systematically (Rigid3D.find_32_global()) instead of
+	starting from ninit initial values, so that the correlation is certified to be the global optimum and
+	alternative optima that fit the markers (almost) equally well are reported (attribute certificate of the
+	returned transformation). Certified correlations are not done incrementally.
+	"""
 
-	random_rotations = True
+	random_rotations = 'quasi'
 	rotation_init = 'gl2'
 	restrict_rotations = 0.1
 	scale = None
@@ -263,6 +631,10 @@ def main(markers_3d,markers_2d,spots_3d,rotation_center,results_file,imageProps=
 	# read ib markers
 	mark_2d = markers_2d[range(markers_2d.shape[0])][:,:2].transpose()
 
+	# marker weights (per marker or per marker and 2D axis)
+	if weights is not None:
+		weights = np.asarray(weights, dtype=float).transpose()
+
 	# convert Eulers in degrees to Caley-Klein params
 	if (rotation_init is not None) and (rotation_init != 'gl2'):
 		rotation_init_rad = rotation_init * np.pi / 180
@@ -271,26 +643,27 @@ def main(markers_3d,markers_2d,spots_3d,rotation_center,results_file,imageProps=
 		einit = rotation_init
 
 	# establish correlation
-	transf = Rigid3D.find_32(
-		x=mark_3d, y=mark_2d, scale=scale,
-		randome=random_rotations, einit=einit, einit_dist=restrict_rotations,
-		randoms=random_scale, sinit=scale_init, ninit=ninit)
+	random_state = Rigid3D.get_random_state(random_state)
+	findArgs = dict(
+		scale=scale, randome=random_rotations, einit=einit, einit_dist=restrict_rotations,
+		randoms=random_scale, sinit=scale_init, ninit=ninit, random_state=random_state)
+	if certify:
+		findArgs['mode'] = 'global'
+	with instrument.timer('correlation.fit'):
+		if robust:
+			transf = Rigid3D.find_32_ransac(x=mark_3d, y=mark_2d, weights=weights, **findArgs)
+		elif incremental is None or weights is not None or certify:
+			transf = Rigid3D.find_32(x=mark_3d, y=mark_2d, weights=weights, **findArgs)
+		else:
+			transf = incremental.correlate(mark_3d, mark_2d, **findArgs)
 
 	if imageProps:
-		# establish correlation for cubic rotation (offset added to coordinates)
+		# correlation for cubic rotation (offset added to coordinates)
 		offsetZ = (max(imageProps[2])-imageProps[2][0])*0.5
 		offsetY = (max(imageProps[2])-imageProps[2][1])*0.5
 		offsetX = (max(imageProps[2])-imageProps[2][2])*0.5
 		print offsetZ, offsetY, offsetX
-		mark_3d_cube = np.copy(mark_3d)
-		mark_3d_cube[0] += offsetX
-		mark_3d_cube[1] += offsetY
-		mark_3d_cube[2] += offsetZ
-
-		transf_cube = Rigid3D.find_32(
-			x=mark_3d_cube, y=mark_2d, scale=scale,
-			randome=random_rotations, einit=einit, einit_dist=restrict_rotations,
-			randoms=random_scale, sinit=scale_init, ninit=ninit)
+		transf_cube = cubeTransform(transf, [offsetX, offsetY, offsetZ])
 	else:
 		transf_cube = transf
 
@@ -303,6 +676,17 @@ def main(markers_3d,markers_2d,spots_3d,rotation_center,results_file,imageProps=
 	else:
 		spots_2d = None
 
+	# uncertainty of the correlated spots (outlier markers are left out)
+	transf.poiUncertainty = None
+	if uncertainty and spots_3d.size != 0:
+		used = getattr(transf, 'inliers', None)
+		if used is None:
+			used = range(mark_3d.shape[1])
+		with instrument.timer('correlation.uncertainty'):
+			transf.poiUncertainty = poiUncertainty(
+				transf, mark_3d[:,used], mark_2d[:,used], spots_3d, nBootstrap=nBootstrap,
+				weights=None if weights is None else weights[...,used], random_state=random_state)
+
 	# transform markers
 	transf_3d = transf.transform(x=mark_3d)
 
@@ -313,11 +697,12 @@ def main(markers_3d,markers_2d,spots_3d,rotation_center,results_file,imageProps=
 
 	# write transformation params and correlation
 	if results_file != '':
-		write_results(
-			transf=transf, res_file_name=results_file,
-			spots_3d=spots_3d, spots_2d=spots_2d,
-			markers_3d=mark_3d, transformed_3d=transf_3d, markers_2d=mark_2d,
-			rotation_center=rotation_center, modified_translation=modified_translation,imageProps=imageProps)
+		with instrument.timer('correlation.report'):
+			write_results(
+				transf=transf, res_file_name=results_file,
+				spots_3d=spots_3d, spots_2d=spots_2d,
+				markers_3d=mark_3d, transformed_3d=transf_3d, markers_2d=mark_2d,
+				rotation_center=rotation_center, modified_translation=modified_translation,imageProps=imageProps)
 	cm_3D_markers = mark_3d.mean(axis=-1).tolist()
 
 	# delta calc,real
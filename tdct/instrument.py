@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Named timers and counters for the image, localization and correlation hot paths.
+Timings are collected per name (number of calls, total, min, max and last time) and can be shown as a
+summary table or exported to JSON, e.g. to see where the interactive latency of the correlation window goes.
+
+Recording is off unless enabled (instrument.enable() or debug mode). When disabled, timer() returns a shared
+no-op context manager and timed() functions only check a module flag, so the instrumentation can stay in
+the hot paths.
+
+Usage:
+	import instrument
+
+	@instrument.timed('image.blend')
+	def blendImages(images):
+		...
+
+	with instrument.timer('correlation.fit') as t:
+		...
+	print t.elapsed
+
+	instrument.count('localization.cacheHit')
+	print '\\n'.join(instrument.summary())
+	instrument.export('timing.json')
+
+# @Title			: instrument
+# @Project			: 3DCTv2
+# @Description		: Timing and counting instrumentation of the hot paths
+# @Author			: Jan Arnold
+# @Email			: jan.arnold (at) coraxx.net
+# @Copyright		: Copyright (C) 2016  Jan Arnold
+# @License			: GPLv3 (see LICENSE file)
+# @Credits			:
+# @Maintainer		: Jan Arnold
+# @Date				: 2016/10
+# @Version			: 3DCT 2.3.0 module rev. 1
+# @Status			: development
+# @Usage			: import instrument.py and decorate functions with @instrument.timed(name) or use
+# 					  with instrument.timer(name): ... blocks
+# @Notes			: Timers are thread safe (e.g. for the chunk threads of beadDetect). Nested timers are
+# 					  recorded independently, i.e. the time of an inner timer is also part of the outer one.
+# @Python_version	: 2.7.11
+"""
+# ======================================================================================================================
+
+import json
+import time
+import timeit
+import threading
+import functools
+
+try:
+	import clrmsg
+	import TDCT_debug
+except:
+	pass
+
+debug = TDCT_debug.debug
+
+## Recording is enabled in debug mode by default
+enabled = debug
+## name: [count, total, min, max, last] (times in s)
+_timers = {}
+## name: count
+_counters = {}
+_lock = threading.Lock()
+_clock = timeit.default_timer
+
+
+class _Timer(object):
+	"""Context manager recording the time of its block as name (elapsed time in attribute elapsed)"""
+	__slots__ = ('name', 'start', 'elapsed')
+
+	def __init__(self,name):
+		self.name = name
+		self.elapsed = None
+
+	def __enter__(self):
+		self.start = _clock()
+		return self
+
+	def __exit__(self,excType,excValue,traceback):
+		self.elapsed = _clock() - self.start
+		record(self.name, self.elapsed)
+		return False
+
+
+class _NullTimer(object):
+	"""Context manager that does nothing (timer() while recording is disabled)"""
+	__slots__ = ()
+	elapsed = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self,excType,excValue,traceback):
+		return False
+
+_nullTimer = _NullTimer()
+
+
+def enable(flag=True):
+	"""Enable (or disable with flag=False) recording"""
+	global enabled
+	enabled = bool(flag)
+
+
+def reset():
+	"""Remove all recorded timings and counts"""
+	with _lock:
+		_timers.clear()
+		_counters.clear()
+
+
+def timer(name):
+	"""Returns a context manager that records the time of its block as name (if recording is enabled).
+	The time of the last block is in attribute elapsed (None if recording is disabled)."""
+	if enabled:
+		return _Timer(name)
+	return _nullTimer
+
+
+def timed(name=None):
+	"""Decorator recording the time of each call of the function as name (if recording is enabled).
+	name defaults to module.function. In debug mode, the time is also printed."""
+	def decorator(func):
+		label = name or '%s.%s' % (func.__module__, func.__name__)
+
+		@functools.wraps(func)
+		def wrapper(*args, **kwargs):
+			if not enabled:
+				return func(*args, **kwargs)
+			start = _clock()
+			try:
+				return func(*args, **kwargs)
+			finally:
+				elapsed = _clock() - start
+				record(label, elapsed)
+				if clrmsg and debug is True: print clrmsg.DEBUG + '%s in s: %.4f' % (label, elapsed)
+		return wrapper
+	return decorator
+
+
+def record(name,seconds):
+	"""Add a time (in s) to timer name (also if recording is disabled)"""
+	with _lock:
+		entry = _timers.get(name)
+		if entry is None:
+			_timers[name] = [1, seconds, seconds, seconds, seconds]
+		else:
+			entry[0] += 1
+			entry[1] += seconds
+			entry[2] = min(entry[2], seconds)
+			entry[3] = max(entry[3], seconds)
+			entry[4] = seconds
+
+
+def count(name,n=1):
+	"""Increase counter name by n (if recording is enabled)"""
+	if enabled:
+		with _lock:
+			_counters[name] = _counters.get(name, 0) + n
+
+
+def stats():
+	"""Returns the recorded timings and counts as dict with keys timers (name: dict of count, total, mean,
+	min, max and last, times in s) and counters (name: count)"""
+	with _lock:
+		timers = dict(
+			(name, dict(count=entry[0], total=entry[1], mean=entry[1]/entry[0], min=entry[2], max=entry[3],
+				last=entry[4]))
+			for name, entry in _timers.items())
+		return dict(timers=timers, counters=dict(_counters))
+
+
+def summary(sort='total'):
+	"""Returns a table (list of lines) of the timers (sorted by sort, descending, one of the timer keys of
+	stats() or 'name') followed by the counters. Times are in ms."""
+	current = stats()
+	if sort == 'name':
+		names = sorted(current['timers'])
+	else:
+		names = sorted(current['timers'], key=lambda name: current['timers'][name][sort], reverse=True)
+	lines = ['%-36s %7s %10s %9s %9s %9s %9s' % ('timer', 'calls', 'total', 'mean', 'min', 'max', 'last')]
+	for name in names:
+		entry = current['timers'][name]
+		lines.append('%-36s %7d %10.1f %9.2f %9.2f %9.2f %9.2f' % (
+			name, entry['count'], entry['total']*1e3, entry['mean']*1e3, entry['min']*1e3, entry['max']*1e3,
+			entry['last']*1e3))
+	if current['counters']:
+		lines.extend(['', '%-36s %7s' % ('counter', 'count')])
+		for name in sorted(current['counters']):
+			lines.append('%-36s %7d' % (name, current['counters'][name]))
+	return lines
+
+
+def export(path):
+	"""Write the recorded timings and counts (see stats()) together with a timestamp to the JSON file path"""
+	data = stats()
+	data['timestamp'] = time.strftime("%Y-%m-%dT%H:%M:%S")
+	with open(path, 'w') as f:
+		json.dump(data, f, indent=1, sort_keys=True)
+	return data
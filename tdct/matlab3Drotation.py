@@ -4,6 +4,7 @@
 Rotate original light microscope volume with tom_rotate function in MATLAB.
 
 This generates the MATLAB script and runs in the matlab -nodisplay console.
+See volumeRotation.py for the native (numpy/scipy) implementation that does not need MATLAB.
 
 # @Title			: matlab3Drotation
 # @Project			: 3DCTv2
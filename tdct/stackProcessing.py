@@ -39,7 +39,7 @@ kwargs:
 # @Credits			:
 # @Maintainer		: Jan Arnold
 # @Date				: 2016/01
-# @Version			: 3DCT 2.3.0 module rev. 8
+# @Version			: 3DCT 2.3.0 module rev. 9
 # @Status			: stable
 # @Usage			: Can be used as standalone application, i.e. run python -u stackProcessing.py
 # 					: or import stackProcessing.py and use main function like:
@@ -74,7 +74,6 @@ import sys
 import os
 import re
 import fnmatch
-import time
 import numpy as np
 from scipy import interpolate
 import matplotlib
@@ -95,6 +94,7 @@ try:
 	from PyQt4 import QtGui
 	import clrmsg
 	import TDCT_debug
+	import instrument
 except:
 	sys.exit("Please install tifffile, e.g.: pip install tifffile")
 
@@ -369,6 +369,7 @@ def showgraph_(img, ss_in, ss_out, sl_in, sl_out, block=True):
 	plt.show(block)
 
 
+@instrument.timed('stack.spline')
 def spline(img, img_int_shape, ss_in, ss_out, sl_in, sl_out):
 	"""
 	Spline interpolation
@@ -394,18 +395,16 @@ def spline(img, img_int_shape, ss_in, ss_out, sl_in, sl_out):
 
 	r_sl_out = range(sl_out)
 
-	ping = time.time()
 	for px in range(img.shape[-1]):
 		for py in range(img.shape[-2]):
 			spl = interpolate.InterpolatedUnivariateSpline(zx, img[:,py,px])
 			np.put(img_int[:,py,px], r_sl_out, spl(zxnew))
 		sys.stdout.write("\r%d%%" % int(px*100/img.shape[-1]))
 		sys.stdout.flush()
-	pong = time.time()
-	if debug is True: print clrmsg.DEBUG, "This interpolation took {0} seconds".format(pong - ping)
 	return img_int
 
 
+@instrument.timed('stack.linear')
 def linear(img, img_int_shape, ss_in, ss_out, sl_in, sl_out):
 	"""Linear interpolation"""
 	##  Determine interpolated slice positions
@@ -417,15 +416,12 @@ def linear(img, img_int_shape, ss_in, ss_out, sl_in, sl_out):
 
 	## Calculate distances from every interpolated image to its next original image
 	sl_counter = 0
-	ping = time.time()
 	for i in sl_int:
 		int_i = int(i)
 		lower = i-int_i
 		upper = 1-(lower)
 		img_int[sl_counter,:,:] = img[int_i,:,:]*upper + img[int_i+1,:,:]*lower
 		sl_counter += 1
-	pong = time.time()
-	if debug is True: print clrmsg.DEBUG, "This interpolation took {0} seconds".format(pong - ping)
 	return img_int
 
 
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+
+# @Title			: test_beadDetect
+# @Project			: 3DCTv2
+# @Description		: pytest test
+# @Author			: Jan Arnold
+# @Email			: jan.arnold (at) coraxx.net
+# @Copyright		: Copyright (C) 2016  Jan Arnold
+# @License			: GPLv3 (see LICENSE file)
+# @Credits			:
+# @Maintainer		: Jan Arnold
+# @Date				: 2016/10
+# @Version			: 3DCT 2.3.0 module rev. 1
+# @Status			: stable
+# @Usage			: pytest
+# @Notes			:
+# @Python_version	: 2.7.12
+"""
+# ======================================================================================================================
+from tdct import beadDetect
+import numpy as np
+
+beadDetect.debug = False
+
+
+def test_findBeads(testVolume):
+	## testVolume has a sphere at z,y,x = 40,20,70 -> marker x,y,z = 70,20,40
+	retVal = beadDetect.findBeads(testVolume,radius=10)
+	assert retVal.shape == (1,3)
+	assert np.testing.assert_allclose(retVal[0], [70,20,40], atol=0.5) is None
+
+
+def test_findBeadsChunks(testVolume):
+	## chunked, multithreaded filtering has to give the same result as filtering the whole volume
+	retVal = beadDetect.findBeads(testVolume,radius=10,chunksize=(25,40,50),threads=4)
+	compVal = beadDetect.findBeads(testVolume,radius=10,chunksize=testVolume.shape,threads=1)
+	assert np.testing.assert_allclose(retVal, compVal) is None
+	## many maxima close to the block borders along every axis
+	noise = np.random.RandomState(0).rand(30,50,60).astype(np.float32)
+	retVal = beadDetect.findBeads(noise,radius=2,threshVal=0,chunksize=(8,13,17),threads=3)
+	compVal = beadDetect.findBeads(noise,radius=2,threshVal=0,chunksize=noise.shape,threads=1)
+	assert len(compVal) > 100
+	assert np.testing.assert_allclose(retVal, compVal) is None
+
+
+def test_findBeads2D(testVolume):
+	retVal = beadDetect.findBeads(testVolume[40],radius=10)
+	assert retVal.shape == (1,3)
+	assert np.testing.assert_allclose(retVal[0], [70,20,0], atol=0.5) is None
+
+
+def test_refineParabolic():
+	data = np.array([[1., 2., 1.], [2., 6., 4.], [1., 3., 1.]])
+	retVal = beadDetect.refineParabolic(data, np.array([[1],[1]]))
+	assert np.testing.assert_allclose(retVal, [[0.071428571, 0.166666666]], atol=0.0001) is None
@@ -63,3 +63,109 @@ def test_2Dgauss():
 	params = beadPos.fitgaussian(data)
 
 	assert (round(params[1]), round(params[2])) == (100, 100)
+
+
+def test_getzRobust(testVolume):
+	retVal = beadPos.getzRobust(70,20,testVolume,parent=None,optimize=False)
+	assert abs(retVal[0]-40) < 0.1
+	assert retVal[1] > 0.9
+	retVal = beadPos.getzRobust(72,17,testVolume,parent=None,optimize=True,cutout=15)
+	for i, valExp in enumerate([70, 20, 40]):
+		assert abs(retVal[i]-valExp) < 0.1
+	assert retVal[3] > 0.9
+
+
+def test_getzRobustLowSNR(testVolume):
+	## dim bead in poisson noise plus a hot pixel on the z profile
+	noisy = (testVolume*0.05 + np.random.RandomState(0).poisson(20,testVolume.shape)).astype('uint16')
+	noisy[10,20,70] = 300
+	z, confidence = beadPos.getzRobust(70,20,noisy)
+	assert abs(z-40) < 1
+	assert confidence > 0.9
+	z, confidence = beadPos.getzRobust(80,80,noisy)
+	assert confidence < 0.5
+
+
+def test_FitCache(testVolume):
+	cache = beadPos.FitCache()
+	retVal = cache.lookup(testVolume,70,20,'gauss',None,None,beadPos.getzGauss,70,20,testVolume)
+	assert abs(retVal-40.00000000073846) < 0.0001
+	## same volume, same (rounded) position -> cached, function is not called again
+	retVal = cache.lookup(testVolume,70.01,20,'gauss',None,None,None)
+	assert abs(retVal-40.00000000073846) < 0.0001
+	assert (cache.hits, cache.misses, len(cache)) == (1, 1, 1)
+	## different method or volume -> new entry
+	cache.lookup(testVolume,70,20,'poly',None,None,beadPos.getzPoly,70,20,testVolume)
+	cache.lookup(np.copy(testVolume),70,20,'gauss',None,None,beadPos.getzGauss,70,20,testVolume)
+	assert (cache.hits, cache.misses, len(cache)) == (1, 3, 3)
+	## volume replaced -> entries of the old volume are dropped
+	cache.prune([None])
+	assert len(cache) == 0
+
+
+def test_FitCacheSmoothVolume(testVolume):
+	cache = beadPos.FitCache()
+	assert beadPos.getzRobust(70,20,testVolume,cache=cache) == beadPos.getzRobust(70,20,testVolume)
+	## without cache only a block around x,y is smoothed, same result (also at the border and with optimize)
+	for x, y in [(72,17), (3,97), (50.4,60.6)]:
+		assert np.allclose(
+			beadPos.getzRobust(x,y,testVolume,optimize=True,cutout=10,cache=cache),
+			beadPos.getzRobust(x,y,testVolume,optimize=True,cutout=10), rtol=0, atol=1e-9)
+	smoothed = cache.smoothVolume(testVolume)
+	## smoothed once per volume and sigma
+	assert cache.smoothVolume(testVolume) is smoothed
+	assert cache.smoothVolume(testVolume,smooth=2.) is not smoothed
+	copy = np.copy(testVolume)
+	assert cache.smoothVolume(copy) is not smoothed
+	## no module level reference, closed volumes are dropped with the cache entries
+	assert not hasattr(beadPos, '_smoothed')
+	cache.prune([copy])
+	assert cache.smoothVolume(testVolume) is not smoothed
+	cache.clear()
+	assert cache._smoothed == []
+
+
+class PlotRecorder():
+	"""Stand-in for the correlation window, records the calls to its matplotlib widget"""
+	def __init__(self):
+		self.calls = []
+		self.widget_matplotlib = self
+
+	def __getattr__(self, name):
+		def record(*args, **kwargs):
+			self.calls.append(name)
+		return record
+
+
+def test_fitGauss1D(testVolume):
+	data_z = testVolume[:,20,70]
+	result = beadPos.fitGauss1D(np.array([np.arange(len(data_z)), data_z]))
+	assert abs(result.params[1]-40.00000000073846) < 0.0001
+	assert result.cov.shape == (3,3)
+	assert result.model.shape == result.residuals.shape == data_z.shape
+	assert np.testing.assert_allclose(result.model + result.residuals, data_z - data_z.min()) is None
+
+
+def test_getzGaussPlotsFinalFitOnly(testVolume):
+	parent = PlotRecorder()
+	beadPos.getzGauss(70,20,testVolume,parent=parent,optimize=True,threshold=None,threshVal=0.6,cutout=15)
+	## one z profile and one xy plot for the final fit, not one per optimization step
+	assert parent.calls == ['setupScatterCanvas', 'xyPlot', 'xyPlot', 'matshowPlot']
+
+
+def test_FitCacheReturnFits(testVolume):
+	cache = beadPos.FitCache()
+	for call in range(2):
+		## fits are cached with the result, the second (cached) lookup draws the same plots
+		parent = PlotRecorder()
+		(x, y, z), fits = cache.lookup(
+			testVolume,70,20,'gaussOpt',15,None,beadPos.getzGauss,70,20,testVolume,optimize=True,returnFits=True)
+		beadPos.plotFits(parent,fits)
+		assert parent.calls == ['setupScatterCanvas', 'xyPlot', 'xyPlot', 'matshowPlot']
+	assert (cache.hits, cache.misses) == (1, 1)
+	assert abs(z-40.00000000073846) < 0.0001
+	(z, confidence), fits = beadPos.getzRobust(70,20,testVolume,returnFits=True)
+	assert (z, confidence) == beadPos.getzRobust(70,20,testVolume)
+	parent = PlotRecorder()
+	beadPos.plotFits(parent,fits)
+	assert parent.calls == ['setupScatterCanvas', 'xyPlot', 'xyPlot']
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+
+# @Title			: test_beadPos2D
+# @Project			: 3DCTv2
+# @Description		: pytest test
+# @Author			: Jan Arnold
+# @Email			: jan.arnold (at) coraxx.net
+# @Copyright		: Copyright (C) 2016  Jan Arnold
+# @License			: GPLv3 (see LICENSE file)
+# @Credits			:
+# @Maintainer		: Jan Arnold
+# @Date				: 2016/10
+# @Version			: 3DCT 2.3.0 module rev. 1
+# @Status			: stable
+# @Usage			: pytest
+# @Notes			:
+# @Python_version	: 2.7.12
+"""
+# ======================================================================================================================
+from tdct import beadPos2D
+import numpy as np
+
+beadPos2D.debug = False
+
+
+def gaussImage():
+	## three gaussian spots (x,y) on a constant background
+	spots = np.array([[50.3,60.7],[150.8,120.2],[250.45,30.6]])
+	Y, X = np.mgrid[0:200, 0:300]
+	img = np.ones((200,300))*10
+	for x, y in spots:
+		img += 100*np.exp(-((X-x)**2+(Y-y)**2)/(2*2.5**2))
+	return img, spots
+
+
+def test_refine():
+	img, spots = gaussImage()
+	clicked = np.round(spots) + [[1,-1],[0,1],[-1,0]]
+	retVal = beadPos2D.refine(img,clicked,method='centroid',cutout=8)
+	assert np.testing.assert_allclose(retVal, spots, atol=0.05) is None
+	retVal = beadPos2D.refine(img,clicked,method='gauss',cutout=8)
+	assert np.testing.assert_allclose(retVal, spots, atol=0.001) is None
+	retVal = beadPos2D.refine(img,clicked,method='radialsymmetry',cutout=8)
+	assert np.testing.assert_allclose(retVal, spots, atol=0.001) is None
+
+
+def test_refineKeepsZ():
+	img, spots = gaussImage()
+	clicked = np.column_stack((np.round(spots), [1,2,3]))
+	retVal = beadPos2D.refine(img,clicked,method='radialsymmetry',cutout=8)
+	assert retVal.shape == (3,3)
+	assert np.testing.assert_array_equal(retVal[:,2], [1,2,3]) is None
+
+
+def test_refineFailed():
+	## flat cutout: no refinement possible, original position is kept
+	img = np.ones((100,100))
+	retVal = beadPos2D.refine(img,[[40.,50.]],method='radialsymmetry',cutout=8)
+	assert np.testing.assert_array_equal(retVal, [[40.,50.]]) is None
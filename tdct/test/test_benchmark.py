@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+
+# @Title			: test_benchmark
+# @Project			: 3DCTv2
+# @Description		: pytest test
+# @Author			: Jan Arnold
+# @Email			: jan.arnold (at) coraxx.net
+# @Copyright		: Copyright (C) 2016  Jan Arnold
+# @License			: GPLv3 (see LICENSE file)
+# @Credits			:
+# @Maintainer		: Jan Arnold
+# @Date				: 2016/10
+# @Version			: 3DCT 2.3.0 module rev. 1
+# @Status			: stable
+# @Usage			: pytest
+# @Notes			:
+# @Python_version	: 2.7.12
+"""
+# ======================================================================================================================
+import json
+from tdct import benchmark
+import numpy as np
+
+benchmark.debug = False
+
+
+def test_markerSet():
+	x, y, truth = benchmark.markerSet(n=10, noise=0, outliers=0.2, seed=4)
+	assert x.shape == (3,10) and y.shape == (2,10)
+	assert len(truth['outliers']) == 2
+	inliers = np.setdiff1d(np.arange(10), truth['outliers'])
+	np.testing.assert_almost_equal(
+		truth['s']*np.dot(truth['q'], x[:,inliers])[:2] + truth['d'][:,np.newaxis], y[:,inliers])
+	## reproducible
+	np.testing.assert_equal(benchmark.markerSet(n=10, noise=1, seed=4)[1], benchmark.markerSet(n=10, noise=1, seed=4)[1])
+
+
+def test_beadStack():
+	img, positions = benchmark.beadStack(shape=(30,48,48), beads=4, noise=0)
+	assert img.shape == (30,48,48) and positions.shape == (4,3)
+	for x, y, z in np.round(positions).astype(int):
+		assert img[z,y,x] > 0.7
+	img, positions = benchmark.beadStack(shape=(48,48), beads=4, noise=0)
+	assert positions.shape == (4,2)
+
+
+def test_benchFindBeads():
+	case = [case for case in benchmark.cases(quick=True) if case.name.startswith('findBeads')][0]
+	result = benchmark.runCase(case, repeat=1)
+	assert result['status'] == 'ok'
+	assert result['accuracy']['recall'] == 1
+	assert result['accuracy']['false'] == 0
+	assert result['accuracy']['max_error'] < 0.5
+	full = [case for case in benchmark.cases() if case.name.startswith('findBeads')]
+	assert [case.name for case in full] == ['findBeads_2048x2048x100', 'findBeads_2048x2048x100_1thread']
+	assert [case.params.get('threads') for case in full] == [None, 1]
+
+
+def test_benchCkSolver():
+	results = [
+		benchmark.runCase(case, repeat=1) for case in benchmark.cases(quick=True) if case.name.endswith('_solver')]
+	assert [result['name'] for result in results] == ['find_32_constr_ck_solver', 'find_32_unconstr_ck_solver']
+	for result in results:
+		assert result['status'] == 'ok'
+		assert result['accuracy']['nit'] > 1
+		assert result['accuracy']['success'] > 0.5
+
+
+def test_benchCorrelationMain():
+	results = [
+		benchmark.runCase(case, repeat=1) for case in benchmark.cases(quick=True)
+		if case.name.startswith('correlation_main')]
+	assert [result['name'] for result in results] == [
+		'correlation_main_imageProps_analytic', 'correlation_main_imageProps_refit']
+	for result in results:
+		assert result['status'] == 'ok'
+		assert result['accuracy']['rms_error'] < 1e-3
+		assert result['accuracy']['translation_error'] < 1e-2
+
+
+def test_benchAffineBatch():
+	results = [
+		benchmark.runCase(case, repeat=1) for case in benchmark.cases(quick=True) if case.name.startswith('affine2d')]
+	assert [result['name'] for result in results] == ['affine2d_find_batch_50sets', 'affine2d_find_loop_50sets']
+	assert all(result['status'] == 'ok' for result in results)
+	## same transformations from the batch and the loop
+	for metric in ('gl_error', 'point_error'):
+		assert abs(results[0]['accuracy'][metric] - results[1]['accuracy'][metric]) < 1e-9
+	assert results[0]['accuracy']['decomposition_error'] < 1e-9
+
+
+def test_runCase():
+	case = benchmark.Case('find_32', benchmark.benchFind32, dict(n=8, noise=0.))
+	result = benchmark.runCase(case, repeat=2)
+	assert result['status'] == 'ok'
+	assert result['time'] > 0 and result['time_median'] >= result['time']
+	assert result['accuracy']['rotation_error'] < 1e-3
+	assert result['accuracy']['poi_error'] < 1e-3
+
+	def missing(**kwargs):
+		raise ImportError('No module named PyQt4')
+	result = benchmark.runCase(benchmark.Case('missing', missing, {}))
+	assert result['status'] == 'skipped'
+
+
+def test_runHistory(tmpdir):
+	history = str(tmpdir.join('history.json'))
+	caseList = [case for case in benchmark.cases(quick=True) if 'batch_ck' in case.name or 'beadPos2D' in case.name]
+	first = benchmark.run(caseList, history=history, repeat=1)
+	second = benchmark.run(caseList, history=history, repeat=1, isolate=False)
+	with open(history) as f:
+		runs = json.load(f)
+	assert len(runs) == 2
+	assert [result['name'] for result in runs[1]['results']] == [case.name for case in caseList]
+	assert all(result['status'] == 'ok' for result in runs[0]['results'])
+	assert runs[0]['results'][0]['accuracy'] == second['results'][0]['accuracy']
+	assert first['environment']['numpy'] == np.__version__
+	assert len(benchmark.formatRun(second, first)) == len(caseList) + 1
+
+	## regressions
+	slower = json.loads(json.dumps(second))
+	slower['results'][0]['time'] = 10*max(second['results'][0]['time'], 0.1)
+	slower['results'][0]['accuracy']['poi_error'] *= 2
+	regressions = benchmark.compare(slower, second)
+	assert set((one['name'], one['metric']) for one in regressions) == set([
+		(caseList[0].name, 'time'), (caseList[0].name, 'poi_error')])
+	assert benchmark.compare(second, second) == []
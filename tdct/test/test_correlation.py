@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+
+# @Title			: test_correlation
+# @Project			: 3DCTv2
+# @Description		: pytest test
+# @Author			: Jan Arnold
+# @Email			: jan.arnold (at) coraxx.net
+# @Copyright		: Copyright (C) 2016  Jan Arnold
+# @License			: GPLv3 (see LICENSE file)
+# @Credits			:
+# @Maintainer		: Jan Arnold
+# @Date				: 2016/10
+# @Version			: 3DCT 2.3.0 module rev. 1
+# @Status			: stable
+# @Usage			: pytest
+# @Notes			:
+# @Python_version	: 2.7.12
+"""
+# ======================================================================================================================
+from tdct import correlation
+from pyto.rigid_3d import Rigid3D
+from pyto.affine_2d import Affine2D
+import numpy as np
+
+
+def markers():
+	## 3D markers (x,y,z rows as in the marker tables) and their 2D projection
+	markers_3d = np.array([
+		[32., 13., 1.],[78., 36., 5.],[3., 54., 8.],[40., 60., 2.],[50., 38., 3.],[21., 75., 6.]])
+	r = Rigid3D.make_r_euler(np.array([-123, 32, 168])*np.pi/180)
+	markers_2d = (1.7*np.dot(r, markers_3d.T) + np.array([[300.],[-40.],[0.]])).T
+	return markers_3d, markers_2d
+
+
+def test_cubeTransform():
+	markers_3d, markers_2d = markers()
+	mark_3d = markers_3d.T
+	mark_2d = markers_2d[:,:2].T
+	offset = np.array([12., 12., 40.])
+	rotation_center = [50., 50., 50.]
+
+	np.random.seed(3)
+	transf = Rigid3D.find_32(
+		x=mark_3d, y=mark_2d, randome=True, einit='gl2', randoms=True, sinit='gl2')
+	transf_cube = correlation.cubeTransform(transf, offset)
+	## same markers are mapped to the same 2D positions
+	np.testing.assert_almost_equal(
+		transf_cube.transform(x=mark_3d+offset[:,np.newaxis])[:2], transf.transform(x=mark_3d)[:2])
+	assert transf_cube.d[2] == 0
+	assert np.array_equal(transf_cube.q, transf.q)
+	assert transf.d[0] != transf_cube.d[0]
+
+	## agrees with the optimization on the shifted markers
+	np.random.seed(3)
+	transf_opt = Rigid3D.find_32(
+		x=mark_3d+offset[:,np.newaxis], y=mark_2d, randome=True, einit='gl2', randoms=True, sinit='gl2')
+	np.testing.assert_almost_equal(transf_cube.q, transf_opt.q, decimal=4)
+	np.testing.assert_almost_equal(transf_cube.d, transf_opt.d, decimal=2)
+	np.testing.assert_almost_equal(
+		transf_cube.recalculate_translation(rotation_center),
+		transf_opt.recalculate_translation(rotation_center), decimal=2)
+
+
+def test_main():
+	markers_3d, markers_2d = markers()
+	spots_3d = np.array([[20., 30., 4.]])
+	imageProps = [(512, 512), 0.1, (81, 100, 100)]
+
+	np.random.seed(3)
+	transf, transf_3d, spots_2d, delta2D, cm_3D_markers, modified_translation = correlation.main(
+		markers_3d, markers_2d, spots_3d, [50., 50., 50.], '', imageProps)
+	np.testing.assert_almost_equal(delta2D, 0, decimal=3)
+	np.testing.assert_almost_equal(transf.s_scalar, 1.7, decimal=4)
+	np.testing.assert_almost_equal(cm_3D_markers, markers_3d.mean(axis=0))
+	transf_cube = correlation.cubeTransform(transf, [0, 0, 9.5])
+	np.testing.assert_almost_equal(modified_translation, transf_cube.recalculate_translation([50., 50., 50.]))
+
+
+def test_incrementalCorrelation():
+	markers_3d, markers_2d = markers()
+	mark_3d = markers_3d.T
+	mark_2d = markers_2d[:,:2].T
+	findArgs = dict(randome=True, einit='gl2', randoms=True, sinit='gl2')
+	inc = correlation.IncrementalCorrelation()
+
+	## first run is a full find_32 run
+	np.random.seed(3)
+	transf = inc.correlate(mark_3d, mark_2d, **findArgs)
+	assert inc.lastMode == 'full'
+	np.testing.assert_almost_equal(transf.s_scalar, 1.7, decimal=4)
+
+	## moved, deleted and added markers: rank-one updates agree with moments from scratch
+	## and the warm-started solution with a full run
+	mark_2d_moved = mark_2d.copy()
+	mark_2d_moved[:,2] += [3., -2.]
+	edits = [
+		(mark_3d, mark_2d_moved),
+		(mark_3d[:,:5], mark_2d_moved[:,:5]),
+		(np.column_stack((mark_3d[:,:5], [60., 20., 4.])), np.column_stack((mark_2d_moved[:,:5], [150., 30.])))]
+	for edit_3d, edit_2d in edits:
+		transf = inc.correlate(edit_3d, edit_2d, **findArgs)
+		assert inc.lastMode == 'incremental'
+		x_cm, y_cm, xxt, yxt, tryy = inc.moments()
+		x_prime = edit_3d - edit_3d.mean(axis=1)[:,np.newaxis]
+		y_prime = edit_2d - edit_2d.mean(axis=1)[:,np.newaxis]
+		np.testing.assert_almost_equal(x_cm, edit_3d.mean(axis=1))
+		np.testing.assert_almost_equal(xxt, np.dot(x_prime, x_prime.T), decimal=6)
+		np.testing.assert_almost_equal(yxt, np.dot(y_prime, x_prime.T), decimal=6)
+		np.testing.assert_almost_equal(tryy, (y_prime**2).sum(), decimal=6)
+
+		np.random.seed(3)
+		full = Rigid3D.find_32(x=edit_3d, y=edit_2d, **findArgs)
+		np.testing.assert_almost_equal(transf.q, full.q, decimal=4)
+		np.testing.assert_almost_equal(transf.s_scalar, full.s_scalar, decimal=4)
+		np.testing.assert_almost_equal(transf.d, full.d, decimal=2)
+		np.testing.assert_almost_equal(transf.rmsError, full.rmsError, decimal=4)
+
+	## many changed markers: full run again
+	inc.correlate(mark_3d, mark_2d+5, **findArgs)
+	assert inc.lastMode == 'full'
+
+
+def test_mainRobust(tmpdir):
+	markers_3d, markers_2d = markers()
+	markers_3d = np.vstack((markers_3d, [[10., 40., 5.],[65., 70., 7.]]))
+	r = Rigid3D.make_r_euler(np.array([-123, 32, 168])*np.pi/180)
+	markers_2d = (1.7*np.dot(r, markers_3d.T) + np.array([[300.],[-40.],[0.]])).T
+	## misclicked marker
+	markers_2d[2,:2] += [25., -10.]
+	results_file = str(tmpdir.join('correlation.txt'))
+
+	np.random.seed(3)
+	transf, transf_3d, spots_2d, delta2D, cm_3D_markers, modified_translation = correlation.main(
+		markers_3d, markers_2d, np.array([[20., 30., 4.]]), [50., 50., 50.], results_file, robust=True)
+	assert list(transf.outliers) == [2]
+	np.testing.assert_almost_equal(transf.q, r, decimal=4)
+	np.testing.assert_almost_equal(np.delete(delta2D, 2, axis=1), 0, decimal=3)
+	assert np.abs(delta2D[:,2]).max() > 10
+	with open(results_file) as f:
+		assert 'outlier markers (not used for the transformation): 3' in f.read()
+
+
+def test_poiUncertainty(tmpdir):
+	markers_3d, markers_2d = markers()
+	np.random.seed(5)
+	markers_2d[:,:2] += np.random.normal(scale=0.5, size=(6,2))
+	mark_3d = markers_3d.T
+	mark_2d = markers_2d[:,:2].T
+	spots_3d = np.array([[20., 30., 4.],[70., 10., 6.]]).T
+	findArgs = dict(randome=True, einit='gl2', randoms=True, sinit='gl2')
+
+	transf = Rigid3D.find_32(x=mark_3d, y=mark_2d, **findArgs)
+	uncertainty = correlation.poiUncertainty(transf, mark_3d, mark_2d, spots_3d, nBootstrap=50)
+	assert set(uncertainty.keys()) == set(['leave-one-out', 'bootstrap'])
+
+	## leave-one-out resamples agree with full runs without the left out marker
+	loo = uncertainty['leave-one-out']
+	assert loo.spots_2d.shape == (6, 2, 2)
+	for i in range(6):
+		used = np.delete(np.arange(6), i)
+		full = Rigid3D.find_32(x=mark_3d[:,used], y=mark_2d[:,used], **findArgs)
+		np.testing.assert_almost_equal(loo.spots_2d[i], full.transform(x=spots_3d)[:2], decimal=3)
+
+	for result in uncertainty.values():
+		assert result.cov.shape == (2, 2, 2)
+		assert (result.axes[:,0] >= result.axes[:,1]).all() and (result.axes > 0).all()
+		## major semi-axis along the angle covers the variance in that direction
+		direction = np.array([np.cos(np.radians(result.angle)), np.sin(np.radians(result.angle))])
+		variance = np.einsum('im,mij,jm->m', direction, result.cov, direction)
+		np.testing.assert_almost_equal(result.axes[:,0]**2, variance*(-2*np.log(0.05)))
+
+	## noise free markers: no uncertainty, written to the results file
+	markers_3d, markers_2d = markers()
+	results_file = str(tmpdir.join('correlation.txt'))
+	transf = correlation.main(markers_3d, markers_2d, spots_3d.T, [50., 50., 50.], results_file, nBootstrap=20)[0]
+	np.testing.assert_almost_equal(transf.poiUncertainty['bootstrap'].axes, 0, decimal=3)
+	with open(results_file) as f:
+		assert 'Uncertainty of correlated spots (leave-one-out, 6 resamples)' in f.read()
+
+
+def test_mainWeighted():
+	markers_3d, markers_2d = markers()
+	r = Rigid3D.make_r_euler(np.array([-123, 32, 168])*np.pi/180)
+	## poorly localized 2D marker (in x), e.g. a blurred bead
+	markers_2d[1,0] += 8.
+	weights = np.ones((6,2))
+	weights[1,0] = 1e-6
+	spots_3d = np.array([[20., 30., 4.]])
+
+	np.random.seed(3)
+	transf, transf_3d, spots_2d, delta2D, cm_3D_markers, modified_translation = correlation.main(
+		markers_3d, markers_2d, spots_3d, [50., 50., 50.], '', weights=weights, nBootstrap=20)
+	np.testing.assert_almost_equal(transf.q, r, decimal=4)
+	np.testing.assert_almost_equal(transf.s_scalar, 1.7, decimal=4)
+	np.testing.assert_almost_equal(np.delete(delta2D[0], 1), 0, decimal=3)
+	np.testing.assert_almost_equal(delta2D[1], 0, decimal=3)
+	np.testing.assert_almost_equal(transf.poiUncertainty['leave-one-out'].axes, 0, decimal=2)
+
+	## one weight per marker, also for the robust correlation
+	np.random.seed(3)
+	transf = correlation.main(
+		markers_3d, markers_2d, spots_3d, [50., 50., 50.], '', robust=True, weights=weights[:,0])[0]
+	np.testing.assert_almost_equal(transf.q, r, decimal=4)
+
+	## unweighted correlation is off
+	np.random.seed(3)
+	transf = correlation.main(markers_3d, markers_2d, spots_3d, [50., 50., 50.], '')[0]
+	assert np.abs(transf.s_scalar - 1.7) > 1e-3
+
+
+def test_transformChain():
+	markers_3d, markers_2d = markers()
+	np.random.seed(3)
+	lm2overview = Rigid3D.find_32(x=markers_3d.T, y=markers_2d[:,:2].T + np.random.normal(0, 0.5, (2,6)))
+	## overview -> search and search -> stage (noisy 2D affine)
+	points = np.array([[0., 0], [100, 10], [40, 90], [-30, 60], [70, -50]])
+	overview2search = Affine2D.find(
+		x=points, y=np.dot(points, [[0.9, 0.2], [-0.1, 1.1]]) + [5, -7] + np.random.normal(0, 0.3, (5,2)))
+	search2stage = Affine2D.find(x=points, y=points*0.01 + [-12, 30] + np.random.normal(0, 0.01, (5,2)))
+	chain = correlation.TransformChain(
+		[lm2overview, overview2search, search2stage], names=['LM-overview', 'overview-search', 'search-stage'])
+	assert (chain.ndimIn, chain.ndimOut) == (3, 2)
+	assert chain.homogeneous.shape == (3, 4)
+
+	## same as applying the transformations one after the other
+	spots_3d = np.random.random((50, 3))*100
+	desired = lm2overview.transform(x=spots_3d.T)[:2].T
+	desired = search2stage.transform(overview2search.transform(desired))
+	np.testing.assert_almost_equal(chain.transform(spots_3d), desired)
+	np.testing.assert_almost_equal(chain.transform(spots_3d.T, xy_axes='dim_point'), desired.T)
+	np.testing.assert_almost_equal(chain.transform(spots_3d[0]), desired[0])
+
+	## error propagation as in Affine.compose()
+	chain2D = correlation.TransformChain([overview2search, search2stage])
+	composed = Affine2D.compose(t_1=search2stage, t_2=overview2search)
+	np.testing.assert_almost_equal(chain2D.rmsErrorEst, composed.rmsErrorEst)
+	assert chain.rmsErrorEst > chain2D.rmsErrorEst
+	search2stage.error = None
+	search2stage.rmsErrorEst = None
+	assert chain.rmsErrorEst is None
+
+	## 3D transformation can not follow a 2D one
+	try:
+		chain.append(lm2overview)
+		assert False
+	except ValueError:
+		pass
+
+
+def test_mainRandomState():
+	markers_3d, markers_2d = markers()
+	markers_2d[:,:2] += np.random.RandomState(1).normal(0, 0.5, (6,2))
+	spots_3d = np.array([[20., 30., 4.]])
+	results = [correlation.main(
+		markers_3d, markers_2d, spots_3d, [50., 50., 50.], '', robust=robust, nBootstrap=20, random_state=7)
+		for robust in [False, False, True, True]]
+	for first, second in [results[:2], results[2:]]:
+		np.testing.assert_equal(first[0].gl, second[0].gl)
+		np.testing.assert_equal(first[2], second[2])
+		np.testing.assert_equal(
+			first[0].poiUncertainty['bootstrap'].spots_2d, second[0].poiUncertainty['bootstrap'].spots_2d)
+
+
+def test_mainCertify(tmpdir):
+	markers_3d, markers_2d = markers()
+	markers_2d[:,:2] += np.random.RandomState(2).normal(0, 0.5, (6,2))
+	results_file = str(tmpdir.join('correlation.txt'))
+
+	transf, transf_3d, spots_2d, delta2D, cm_3D_markers, modified_translation = correlation.main(
+		markers_3d, markers_2d, np.array([[20., 30., 4.]]), [50., 50., 50.], results_file, random_state=3,
+		certify=True)
+	assert transf.certificate.certified
+	transf_local = correlation.main(
+		markers_3d, markers_2d, np.array([[20., 30., 4.]]), [50., 50., 50.], '', random_state=3)[0]
+	np.testing.assert_almost_equal(transf.q, transf_local.q, decimal=4)
+	with open(results_file) as f:
+		assert 'global optimum certified' in f.read()
+
+	## markers on a plane, the mirrored rotation fits equally well
+	markers_3d[:,2] = 0
+	r = Rigid3D.make_r_euler(np.array([-123, 32, 168])*np.pi/180)
+	markers_2d = (1.7*np.dot(r, markers_3d.T) + np.array([[300.],[-40.],[0.]])).T
+	transf = correlation.main(
+		markers_3d, markers_2d, np.array([[20., 30., 4.]]), [50., 50., 50.], results_file, certify=True)[0]
+	assert len(transf.certificate.alternatives_fun) == 1
+	with open(results_file) as f:
+		assert 'alternative optimum: rms error =   0.00' in f.read()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+
+# @Title			: test_instrument
+# @Project			: 3DCTv2
+# @Description		: pytest test
+# @Author			: Jan Arnold
+# @Email			: jan.arnold (at) coraxx.net
+# @Copyright		: Copyright (C) 2016  Jan Arnold
+# @License			: GPLv3 (see LICENSE file)
+# @Credits			:
+# @Maintainer		: Jan Arnold
+# @Date				: 2016/10
+# @Version			: 3DCT 2.3.0 module rev. 1
+# @Status			: stable
+# @Usage			: pytest
+# @Notes			:
+# @Python_version	: 2.7.12
+"""
+# ======================================================================================================================
+import json
+import pytest
+import numpy as np
+from tdct import instrument, correlation, beadPos2D
+
+instrument.debug = False
+
+
+@pytest.fixture(autouse=True)
+def clean():
+	state = instrument.enabled
+	instrument.reset()
+	yield
+	instrument.enable(state)
+	instrument.reset()
+
+
+@instrument.timed('test.add')
+def add(a,b):
+	return a+b
+
+
+def test_disabled():
+	instrument.enable(False)
+	assert add(1, 2) == 3
+	with instrument.timer('test.block') as t:
+		pass
+	assert t.elapsed is None
+	instrument.count('test.counter')
+	assert instrument.stats() == dict(timers={}, counters={})
+
+
+def test_timerTimed():
+	instrument.enable()
+	for i in range(3):
+		assert add(i, 1) == i+1
+	with instrument.timer('test.block') as t:
+		sum(range(1000))
+	assert t.elapsed >= 0
+	## exceptions are timed as well and passed on
+	with pytest.raises(TypeError):
+		add(1, 'a')
+	timers = instrument.stats()['timers']
+	assert timers['test.add']['count'] == 4
+	assert timers['test.block']['count'] == 1
+	assert timers['test.block']['last'] == t.elapsed
+	entry = timers['test.add']
+	assert entry['min'] <= entry['mean'] <= entry['max'] <= entry['total']
+	## default name is module.function
+	assert instrument.timed()(add).__name__ == 'add'
+
+
+def test_counterSummary():
+	instrument.enable()
+	instrument.count('test.counter')
+	instrument.count('test.counter', 4)
+	instrument.record('test.slow', 2.)
+	instrument.record('test.fast', 1.)
+	instrument.record('test.fast', 0.5)
+	assert instrument.stats()['counters'] == {'test.counter': 5}
+	lines = instrument.summary()
+	assert lines[0].split()[:3] == ['timer', 'calls', 'total']
+	assert [line.split()[0] for line in lines[1:3]] == ['test.slow', 'test.fast']
+	assert lines[2].split()[1:3] == ['2', '1500.0']
+	assert lines[-1].split() == ['test.counter', '5']
+	assert [line.split()[0] for line in instrument.summary(sort='name')[1:3]] == ['test.fast', 'test.slow']
+	instrument.reset()
+	assert instrument.summary() == lines[:1]
+
+
+def test_export(tmpdir):
+	instrument.enable()
+	instrument.record('test.block', 0.25)
+	instrument.count('test.counter', 2)
+	path = str(tmpdir.join('timing.json'))
+	instrument.export(path)
+	with open(path) as f:
+		data = json.load(f)
+	assert data['timers']['test.block']['total'] == 0.25
+	assert data['counters'] == {'test.counter': 2}
+	assert 'timestamp' in data
+
+
+def test_hotPaths():
+	instrument.enable()
+	rs = np.random.RandomState(3)
+	markers_3d = rs.rand(6, 3)*100
+	markers_2d = np.column_stack((2*markers_3d[:,:2] + 5, np.zeros(6)))
+	spots_3d = np.array([[20., 30., 4.]])
+	incremental = correlation.IncrementalCorrelation()
+	for i in range(2):
+		correlation.main(
+			markers_3d, markers_2d, spots_3d, [0., 0., 0.], '', incremental=incremental, nBootstrap=5, random_state=1)
+	current = instrument.stats()
+	assert current['timers']['correlation.fit']['count'] == 2
+	assert current['timers']['correlation.uncertainty']['count'] == 2
+	assert current['counters']['correlation.full'] == 1
+	assert current['counters']['correlation.incremental'] == 1
+
+	img = np.zeros((40, 40))
+	img[20, 20] = 1
+	beadPos2D.refine(img, [[19, 21]], method='centroid')
+	current = instrument.stats()
+	assert current['timers']['localization.refine2D']['count'] == 1
+	assert current['counters']['localization.refine2D.markers'] == 1
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+
+# @Title			: test_volumeRotation
+# @Project			: 3DCTv2
+# @Description		: pytest test
+# @Author			: Jan Arnold
+# @Email			: jan.arnold (at) coraxx.net
+# @Copyright		: Copyright (C) 2016  Jan Arnold
+# @License			: GPLv3 (see LICENSE file)
+# @Credits			:
+# @Maintainer		: Jan Arnold
+# @Date				: 2016/10
+# @Version			: 3DCT 2.3.0 module rev. 2
+# @Status			: stable
+# @Usage			: pytest
+# @Notes			:
+# @Python_version	: 2.7.12
+"""
+# ======================================================================================================================
+from tdct import volumeRotation
+from pyto.rigid_3d import Rigid3D
+import numpy as np
+import tifffile as tf
+
+
+def blobs(shape, points, sigma=1.5):
+	## volume (z,y,x) with gaussian blobs at points (x,y,z rows)
+	z, y, x = np.indices(shape)
+	vol = np.zeros(shape, dtype=np.float32)
+	for px, py, pz in points:
+		vol += np.exp(-((x-px)**2 + (y-py)**2 + (z-pz)**2)/(2*sigma**2))
+	return vol
+
+
+def centroid(vol, point, origin, radius=4):
+	## intensity weighted centroid (x,y,z) around point in the output frame
+	index = np.round(point - origin).astype(int)[::-1]
+	sl = tuple(slice(i-radius, i+radius+1) for i in index)
+	cut = vol[sl]
+	z, y, x = np.indices(cut.shape)
+	total = cut.sum()
+	return np.array([(x*cut).sum(), (y*cut).sum(), (z*cut).sum()])/total + index[::-1] - radius + origin
+
+
+def test_rotate(tmpdir):
+	points = np.array([[12., 15., 8.], [30., 10., 14.], [22., 28., 6.]])
+	vol = blobs((20, 40, 42), points)
+
+	## identity
+	out, origin = volumeRotation.rotate(vol, volumeRotation.makeTransform(0, 0, 0, 1, 0, 0))
+	np.testing.assert_equal(origin, [0, 0, 0])
+	np.testing.assert_almost_equal(out, vol, decimal=5)
+
+	## blobs end up at the transformed points, for linear and spline interpolation
+	transf = volumeRotation.makeTransform(-59.5, 179.7, 37.8, 1.2, -17.6, 30.5)
+	expected = transf.transform(x=points.T).T
+	for order in [1, 3]:
+		out, origin = volumeRotation.rotate(vol, transf, order=order, chunksize=5, threads=1)
+		assert out.dtype == np.float32
+		assert (transf.transform(x=np.zeros((3,1)))[:,0] >= origin).all()
+		for point in expected:
+			np.testing.assert_almost_equal(centroid(out, point, origin), point, decimal=1)
+
+	## threads and chunks do not change the result, written to tiff
+	fileout = str(tmpdir.join('rotated.tif'))
+	out_threads, origin_threads = volumeRotation.rotate(vol, transf, order=3, chunksize=3, threads=3, fileout=fileout)
+	np.testing.assert_equal(out_threads, out)
+	np.testing.assert_equal(tf.imread(fileout), out)
+
+	## output grid aligned to a 2D image
+	out, origin = volumeRotation.rotate(vol, transf, outputShape=(10, 60, 80), origin=(0, 0, -5))
+	assert out.shape == (10, 60, 80)
+	np.testing.assert_equal(origin, [0, 0, -5])
+
+
+def test_lamella():
+	points = np.array([[12., 15., 8.], [30., 10., 14.], [22., 28., 6.]])
+	vol = blobs((20, 40, 42), points)
+	transf = volumeRotation.makeTransform(-59.5, 179.7, 37.8, 1.2, -17.6, 30.5)
+	volOrigin, volShape = volumeRotation.outputBounds(vol.shape, transf)
+	zrange = (volOrigin[2], volOrigin[2] + volShape[0] - 1)
+
+	## same as the corresponding part of the whole rotated volume
+	for order in [1, 3]:
+		lam, origin = volumeRotation.lamella(vol, transf, -20, 5, 10, 17, order=order, chunksize=4)
+		np.testing.assert_equal(origin, [-20, 10, zrange[0]])
+		assert lam.shape == (volShape[0], 8, 26)
+		full, origin = volumeRotation.rotate(vol, transf, order=order, outputShape=lam.shape, origin=origin)
+		np.testing.assert_almost_equal(lam, full, decimal=4)
+
+	## binning averages 2x2x2 blocks, the box is extended to full bins
+	lam, origin = volumeRotation.lamella(vol, transf, -20, 4, 10, 17, zrange=(-10, 5), binfactor=1, threads=2, chunksize=2)
+	assert lam.shape == (8, 4, 13)
+	full, origin = volumeRotation.rotate(vol, transf, outputShape=(16, 8, 26), origin=origin)
+	np.testing.assert_almost_equal(lam, full.reshape(8, 2, 4, 2, 13, 2).mean(axis=(1,3,5)), decimal=5)
+
+	## box outside of the volume
+	lam, origin = volumeRotation.lamella(vol, transf, 500, 510, 500, 510, cval=-1)
+	assert (lam == -1).all()
+
+
+def test_makeTransform():
+	## values of the correlation report reproduce the correlation
+	r = Rigid3D.make_r_euler(np.radians([-59.5, 37.8, 179.7]))
+	transf = Rigid3D()
+	transf.q, transf.s_scalar, transf.d = r, 1.2, np.array([-17.6, 30.5, 0])
+	center = [50., 60., 70.]
+	translation = transf.recalculate_translation(center)
+	made = volumeRotation.makeTransform(-59.5, 179.7, 37.8, 1.2, translation[0], translation[1], center)
+	np.testing.assert_almost_equal(made.q, r)
+	np.testing.assert_almost_equal(made.d, transf.d)
+
+	## translation for the volume padded to a cube
+	offset = [10., 10., 40.]
+	transf_cube = transf.shift_initial(offset)
+	translation = transf_cube.recalculate_translation(center)
+	made = volumeRotation.makeTransform(
+		-59.5, 179.7, 37.8, 1.2, translation[0], translation[1], center, cubeOffset=offset)
+	x = np.array([[3.], [4.], [5.]])
+	np.testing.assert_almost_equal(made.transform(x=x)[:2], transf.transform(x=x)[:2])
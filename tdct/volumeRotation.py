@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Rotate (resample) the light microscope volume into the frame of the correlated 2D image (e.g. FIB image)
+without MATLAB. Native replacement for the script generated by matlab3Drotation.py.
+
+import volumeRotation.py and call vol = volumeRotation.rotate(img,transf) with transf being the Rigid3D
+transformation found by the correlation (correlation.main()), or one made from the numbers in the
+correlation report by makeTransform().
+
+Coordinates are the ones of the marker tables: x (column), y (row) and z (slice) in px. Every output
+voxel is mapped back through the inverse transformation into the input volume and interpolated there
+(scipy.ndimage.map_coordinates), so the output has no holes. The output volume is processed in chunks
+along z in a thread pool, which keeps the memory for the coordinate grids bounded.
+
+To only cut out the lamella, call lam, origin = volumeRotation.lamella(img,transf,lam_start_x,lam_end_x,
+lam_start_y,lam_end_y,binfactor=1). Only the part of the volume inside the lamella box is resampled.
+
+# @Title			: volumeRotation
+# @Project			: 3DCTv2
+# @Description		: Rotate original light microscope volume
+# @Author			: Jan Arnold
+# @Email			: jan.arnold (at) coraxx.net
+# @Copyright		: Copyright (C) 2016  Jan Arnold
+# @License			: GPLv3 (see LICENSE file)
+# @Credits			: Florian Beck, Max-Planck-Institute of Biochemistry (MATLAB/TOM script)
+# @Maintainer		: Jan Arnold
+# @Date				: 2016/10
+# @Version			: 3DCT 2.3.0 module rev. 3
+# @Status			: development
+# @Usage			: import volumeRotation.py and call vol = volumeRotation.rotate(img,transf)
+# 					: or volumeRotation.rotate(img,transf,fileout='/path/to/rotated.tif')
+# 					: lam, origin = volumeRotation.lamella(img,transf,661,885,512,518,binfactor=1)
+# @Notes			: The output is float32 (as single in the MATLAB script)
+# @Python_version	: 2.7.11
+"""
+# ======================================================================================================================
+
+import time
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import numpy as np
+from scipy import ndimage
+import tifffile as tf
+
+from pyto.rigid_3d import Rigid3D
+
+try:
+	import clrmsg
+	import TDCT_debug
+	import instrument
+except:
+	pass
+
+debug = TDCT_debug.debug
+
+
+def makeTransform(phi,psi,theta,scale,shiftx,shifty,rotation_center=(0,0,0),cubeOffset=None):
+	"""Returns the Rigid3D transformation for the values written in the correlation report.
+
+	phi, psi and theta are the Euler angles in degrees, scale the scale and shiftx, shifty the translation
+	for rotation around rotation_center (x,y,z), i.e. x and y of a point x are transformed to:
+
+		s q (x - rotation_center) + s rotation_center + shift
+
+	which is the inverse of Rigid3D.recalculate_translation(). As for the transformations found by the
+	correlation, the z component of the translation for rotation around [0,0,0] is 0.
+
+	The translation for a custom rotation center in the report is calculated for the volume padded to a
+	cube (like quadvol in the MATLAB script). In that case cubeOffset is the offset (x,y,z) of the volume
+	in the cube and the returned transformation is the one for the original (not padded) volume."""
+	transf = Rigid3D()
+	transf.q = Rigid3D.make_r_euler(np.radians([phi, theta, psi]), mode='x')
+	transf.s_scalar = float(scale)
+	transf.s = transf.s_scalar * np.identity(3)
+	transf.gl = transf.s_scalar * transf.q
+	center = np.asarray(rotation_center, dtype=np.float64)
+	transf.d = np.array([shiftx, shifty, 0.]) + transf.s_scalar * (center - np.dot(transf.q, center))
+	transf.d[2] = 0
+	if cubeOffset is not None:
+		transf = transf.shift_initial(-np.asarray(cubeOffset, dtype=np.float64))
+	return transf
+
+
+def outputBounds(shape,transf):
+	"""Returns origin (x,y,z) and shape (z,y,x) of the smallest voxel grid that contains the volume of shape
+	(z,y,x) transformed by transf."""
+	corners = np.array([[x, y, z] for z in (0, shape[0]-1) for y in (0, shape[1]-1) for x in (0, shape[2]-1)], dtype=np.float64)
+	transformed = transf.transform(x=corners.T, xy_axes='dim_point')
+	origin = np.floor(transformed.min(axis=1))
+	end = np.ceil(transformed.max(axis=1))
+	return origin, tuple((end - origin).astype(int)[::-1] + 1)
+
+
+@instrument.timed('stack.rotate')
+def rotate(img,transf,order=1,outputShape=None,origin=None,chunksize=16,threads=None,cval=0.,fileout=None):
+	"""Resample the volume img with the transformation transf.
+
+	img is the path to the z-stack tiff file or a numpy.ndarray (z,y,x) from tifffile.py imread function
+	transf is a Rigid3D instance (e.g. from correlation.main() or makeTransform())
+	order is the interpolation order, 1 for linear or 3 for cubic spline interpolation
+	outputShape (z,y,x) and origin (x,y,z of the first output voxel in the transformed frame) define the
+	output grid. By default it is the bounding box of the transformed volume (see outputBounds()). For an
+	output aligned with the 2D image, use origin (0,0,z0) and outputShape (nz,image height,image width).
+	chunksize is the number of output slices resampled in one go
+	threads is the number of worker threads (defaults to the number of cpus)
+	cval is the value for output voxels outside of the input volume
+	fileout is an optional path the resampled volume is written to (tiff)
+
+	Returns the resampled volume (float32) and the origin of the output grid."""
+
+	if not isinstance(img, str) and not isinstance(img, np.ndarray):
+		if clrmsg and debug is True: print clrmsg.ERROR
+		raise TypeError('I can only handle an image path as string or an image volume as numpy.ndarray imported from tifffile.py')
+	elif isinstance(img, str):
+		img = tf.imread(img)
+	if img.ndim != 3:
+		raise ValueError('Expected a single channel 3D image stack, got an array with shape {0}'.format(img.shape))
+	if order not in (0, 1, 3):
+		raise ValueError('Interpolation order has to be 0 (nearest), 1 (linear) or 3 (spline), got {0}'.format(order))
+
+	if debug is True: ping = time.time()
+
+	if outputShape is None or origin is None:
+		autoOrigin, autoShape = outputBounds(img.shape, transf)
+		if origin is None:
+			origin = autoOrigin
+		if outputShape is None:
+			outputShape = autoShape
+	origin = np.asarray(origin, dtype=np.float64)
+
+	inverse, offset = _inverseMapping(transf, origin)
+	## spline coefficients are calculated once for the whole volume
+	if order > 1:
+		data = ndimage.spline_filter(img, order=order, output=np.float32)
+	else:
+		data = img
+	out = _resample(data, inverse, offset, outputShape, order, chunksize, threads, cval)
+
+	if clrmsg and debug is True:
+		print clrmsg.DEBUG + 'Volume %s resampled to %s (order %.f) in %.3f s' % (
+			img.shape, out.shape, order, time.time()-ping)
+
+	if fileout is not None:
+		tf.imsave(fileout, out)
+	return out, origin
+
+
+@instrument.timed('stack.lamella')
+def lamella(
+		img,transf,lam_start_x,lam_end_x,lam_start_y,lam_end_y,zrange=None,binfactor=0,order=1,
+		chunksize=16,threads=None,cval=0.,fileout=None):
+	"""Cut out the lamella region of the volume img without resampling the whole volume.
+
+	The lamella box lam_start_x..lam_end_x, lam_start_y..lam_end_y (px, inclusive) is given in the
+	correlated 2D image (e.g. FIB image), like in the MATLAB script. zrange (start,end) limits the box along
+	the transformed z axis, by default it covers the whole transformed volume. The box is mapped back
+	through the inverse transformation and only the part of img inside it is interpolated (the spline
+	prefilter is also only run on that part).
+
+	binfactor bins the output 2^binfactor times (as csbin in the MATLAB script, 0 for no binning).
+	The box is extended to a multiple of the bin size and every output voxel is the mean of the
+	(2^binfactor)^3 voxels it covers.
+
+	For the other parameters see rotate().
+
+	Returns the lamella volume (float32) and the origin (x,y,z) of the box in the transformed frame, i.e.
+	binned voxel i,j,k covers origin + 2^binfactor * (k,j,i) onwards."""
+
+	if not isinstance(img, str) and not isinstance(img, np.ndarray):
+		if clrmsg and debug is True: print clrmsg.ERROR
+		raise TypeError('I can only handle an image path as string or an image volume as numpy.ndarray imported from tifffile.py')
+	elif isinstance(img, str):
+		img = tf.imread(img)
+	if img.ndim != 3:
+		raise ValueError('Expected a single channel 3D image stack, got an array with shape {0}'.format(img.shape))
+	if order not in (0, 1, 3):
+		raise ValueError('Interpolation order has to be 0 (nearest), 1 (linear) or 3 (spline), got {0}'.format(order))
+	if lam_end_x < lam_start_x or lam_end_y < lam_start_y:
+		raise ValueError('Lamella end coordinates have to be larger than the start coordinates')
+
+	if debug is True: ping = time.time()
+
+	binning = 2**int(binfactor)
+	if zrange is None:
+		volOrigin, volShape = outputBounds(img.shape, transf)
+		zrange = (volOrigin[2], volOrigin[2] + volShape[0] - 1)
+	origin = np.floor([lam_start_x, lam_start_y, zrange[0]]).astype(np.float64)
+	end = np.ceil([lam_end_x, lam_end_y, zrange[1]])
+	size = (end - origin).astype(int) + 1
+	## extend to full bins
+	size = -(-size // binning) * binning
+	outputShape = tuple(size[::-1] // binning)
+
+	## part of the input volume the lamella box maps to (plus a margin for the interpolation)
+	corners = np.array([[x, y, z] for z in (0, size[2]-1) for y in (0, size[1]-1) for x in (0, size[0]-1)])
+	inverse, offset = _inverseMapping(transf, origin)
+	inputCorners = np.dot(corners[:,::-1], inverse.T) + offset
+	margin = 8 if order > 1 else 1
+	start = np.clip(np.floor(inputCorners.min(axis=0)).astype(int) - margin, 0, img.shape)
+	stop = np.clip(np.ceil(inputCorners.max(axis=0)).astype(int) + margin + 1, 0, img.shape)
+
+	if (stop > start).all():
+		crop = img[start[0]:stop[0], start[1]:stop[1], start[2]:stop[2]]
+		if order > 1:
+			data = ndimage.spline_filter(crop, order=order, output=np.float32)
+		else:
+			data = crop
+		out = _resample(data, inverse, offset - start, outputShape, order, chunksize, threads, cval, binning)
+	else:
+		## lamella box outside of the volume
+		out = np.empty(outputShape, dtype=np.float32)
+		out.fill(cval)
+
+	if clrmsg and debug is True:
+		print clrmsg.DEBUG + 'Lamella %s (bin %.f) cut out of %s (%s resampled) in %.3f s' % (
+			out.shape, binning, img.shape, tuple(np.maximum(stop - start, 0)), time.time()-ping)
+
+	if fileout is not None:
+		tf.imsave(fileout, out)
+	return out, origin
+
+
+def _inverseMapping(transf,origin):
+	"""Returns the matrix and offset mapping output array indices (z,y,x) of a grid starting at origin (x,y,z)
+	to input array coordinates (z,y,x): x_in = (s q p)^-1 (x_out - d), q p is orthogonal"""
+	gl = transf.transform(x=np.identity(3), d=0, xy_axes='dim_point')
+	inverse = np.linalg.inv(gl)
+	offset = np.dot(inverse, origin - np.asarray(transf.d, dtype=np.float64))
+	## x,y,z -> z,y,x (array axes) for input and output coordinates
+	return inverse[::-1,::-1], offset[::-1]
+
+
+def _resample(data,inverse,offset,outputShape,order,chunksize,threads,cval,binning=1):
+	"""Interpolate data (spline coefficients for order > 1) at the inverse mapped output grid in z chunks
+	processed in a thread pool. With binning > 1 the grid is binning times finer than outputShape and
+	averaged over binning^3 blocks."""
+	out = np.empty(outputShape, dtype=np.float32)
+	chunks = [(z, min(z+chunksize, outputShape[0])) for z in range(0, outputShape[0], chunksize)]
+
+	def resampleChunk(chunk):
+		zstart, zend = chunk
+		shape = ((zend-zstart)*binning, outputShape[1]*binning, outputShape[2]*binning)
+		grid = np.ogrid[zstart*binning:zend*binning, 0:shape[1], 0:shape[2]]
+		coords = np.empty((3,) + shape, dtype=np.float32)
+		for axis in range(3):
+			coords[axis] = inverse[axis,0]*grid[0] + inverse[axis,1]*grid[1] + inverse[axis,2]*grid[2] + offset[axis]
+		if binning == 1:
+			ndimage.map_coordinates(
+				data, coords, output=out[zstart:zend], order=order, mode='constant', cval=cval, prefilter=False)
+		else:
+			values = ndimage.map_coordinates(
+				data, coords, output=np.float32, order=order, mode='constant', cval=cval, prefilter=False)
+			out[zstart:zend] = values.reshape(
+				zend-zstart, binning, outputShape[1], binning, outputShape[2], binning).mean(axis=(1,3,5))
+
+	if threads is None:
+		threads = multiprocessing.cpu_count()
+	if threads > 1 and len(chunks) > 1:
+		pool = ThreadPool(min(threads, len(chunks)))
+		try:
+			pool.map(resampleChunk, chunks)
+		finally:
+			pool.close()
+			pool.join()
+	else:
+		for chunk in chunks:
+			resampleChunk(chunk)
+	return out